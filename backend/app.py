@@ -1,116 +1,106 @@
 # backend/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import time
-from firebase_admin import credentials, db, initialize_app
+from firebase_admin import credentials, initialize_app
 from flask_cors import CORS
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
+import math
+import atexit
+
+import metrics
+from model_registry import ModelRegistry, MODEL_FILES
+from trend_features import calculate_trend_features_batch
+from datastore import store
+from patient_cache import PatientDirectory, PatientIdCache
+from window_cache import WindowCache
+from timeseries_store import TimeseriesStore, TimeseriesMirror
+from result_cache import ResultCache, fingerprint
+from singleflight import SingleFlight
+from scheduler import DeteriorationScheduler
+from stream_hub import StreamHub
+from worker import ScoringWorker
+from ingest_buffer import IngestBuffer
+from risk_profiles import RISK_LEVELS, simulated_reading, to_reading
+from simulation import SimulationEngine
+from patient_index import assign_new_patient_id, lookup_simple_id, lookup_uid_by_email
 
 # -----------------------------------------------------------------------------
 # Initialize Flask + CORS
 # -----------------------------------------------------------------------------
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify() with its serialization counted as the "serialize" stage"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.span("serialize"):
+            return super().dumps(obj, **kwargs)
+
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app, supports_credentials=True)  # allows frontend (Vite) to call Flask
 
+@app.before_request
+def begin_request_metrics():
+    metrics.begin_request(request.endpoint)
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+    metrics.end_request(request.method, response.status_code)
     return response
 
 # -----------------------------------------------------------------------------
 # Firebase Admin SDK connection
+# Only for STORAGE_BACKEND=firebase (default); memory/sqlite run fully offline
 # -----------------------------------------------------------------------------
-# Check if Firebase credentials are in environment variable (Railway deployment)
-firebase_creds = os.getenv('FIREBASE_CREDENTIALS')
-if firebase_creds:
-    print("Loading Firebase credentials from environment variable...")
-    cred_dict = json.loads(firebase_creds)
-    cred = credentials.Certificate(cred_dict)
+if store.name == "firebase":
+    # Check if Firebase credentials are in environment variable (Railway deployment)
+    firebase_creds = os.getenv('FIREBASE_CREDENTIALS')
+    if firebase_creds:
+        print("Loading Firebase credentials from environment variable...")
+        cred_dict = json.loads(firebase_creds)
+        cred = credentials.Certificate(cred_dict)
+    else:
+        print("Loading Firebase credentials from file...")
+        cred = credentials.Certificate("firebase_key.json")
+
+    initialize_app(cred, {
+        "databaseURL": "https://health-sync-dev-default-rtdb.firebaseio.com/"
+    })
 else:
-    print("Loading Firebase credentials from file...")
-    cred = credentials.Certificate("firebase_key.json")
-
-initialize_app(cred, {
-    "databaseURL": "https://health-sync-dev-default-rtdb.firebaseio.com/"
-})
+    print(f"Using local {store.name} storage backend (no Firebase connection)")
 
 # -----------------------------------------------------------------------------
 # ML Models - UNSUPERVISED (No Manual Labels!)
 # Uses ONLY smartwatch variables: heartRate, steps, calories, distance, sleepHours, workout
 # Model learns patterns from FitBit data itself
+#
+# All nine artifacts (health K-Means + scaler, anomaly Isolation Forest, trend
+# detector + scaler, trend K-Means + scaler, cluster names) live in ONE
+# immutable ModelVersion. Handlers grab `model_registry.active` once per request.
 # -----------------------------------------------------------------------------
-health_cluster_model = None
-health_scaler = None
-anomaly_model = None
-cluster_names = None
-
-# TREND DETERIORATION DETECTION MODELS (UNSUPERVISED - No Future Prediction)
-trend_detector = None  # Isolation Forest
-trend_detector_scaler = None
-trend_cluster_model = None  # K-Means
-trend_cluster_scaler = None
-trend_cluster_names = None
+MODEL_DIR = os.getenv("MODEL_DIR", ".")
+model_registry = ModelRegistry(MODEL_DIR)
 
 def load_ml_models():
     """Load trained ML models for health prediction"""
-    global health_cluster_model, health_scaler, anomaly_model, cluster_names
-    global trend_detector, trend_detector_scaler, trend_cluster_model, trend_cluster_scaler, trend_cluster_names
-
     try:
-        import pickle
-
-        # Health Cluster Model (Unsupervised - K-Means)
-        if os.path.exists('health_cluster_model.pkl') and os.path.exists('health_scaler.pkl'):
-            with open('health_cluster_model.pkl', 'rb') as f:
-                health_cluster_model = pickle.load(f)
-            with open('health_scaler.pkl', 'rb') as f:
-                health_scaler = pickle.load(f)
-            print("Health Cluster Model loaded successfully!")
-        else:
+        models = model_registry.load()
+        for name in MODEL_FILES:
+            if models.is_loaded(name):
+                print(f"{name} loaded successfully!")
+        if not models.is_loaded("health_cluster_model"):
             print("WARNING: Health Cluster Model not found. Run train_health_model.py first.")
-
-        # Cluster Names Mapping
-        if os.path.exists('cluster_names.pkl'):
-            with open('cluster_names.pkl', 'rb') as f:
-                cluster_names = pickle.load(f)
-            print("Cluster Names loaded successfully!")
-
-        # Anomaly Detection Model (Unsupervised - Isolation Forest)
-        if os.path.exists('anomaly_model.pkl'):
-            with open('anomaly_model.pkl', 'rb') as f:
-                anomaly_model = pickle.load(f)
-            print("Anomaly Detection Model loaded successfully!")
-        else:
+        if not models.is_loaded("anomaly_model"):
             print("WARNING: Anomaly Model not found. Run train_health_model.py first.")
-
-        # TREND DETERIORATION DETECTION MODELS (Unsupervised)
-        if os.path.exists('trend_detector.pkl'):
-            with open('trend_detector.pkl', 'rb') as f:
-                trend_detector = pickle.load(f)
-            print("Trend Detector (Isolation Forest) loaded successfully!")
-
-        if os.path.exists('trend_detector_scaler.pkl'):
-            with open('trend_detector_scaler.pkl', 'rb') as f:
-                trend_detector_scaler = pickle.load(f)
-
-        if os.path.exists('trend_cluster_model.pkl'):
-            with open('trend_cluster_model.pkl', 'rb') as f:
-                trend_cluster_model = pickle.load(f)
-            print("Trend Cluster Model (K-Means) loaded successfully!")
-
-        if os.path.exists('trend_cluster_scaler.pkl'):
-            with open('trend_cluster_scaler.pkl', 'rb') as f:
-                trend_cluster_scaler = pickle.load(f)
-
-        if os.path.exists('trend_cluster_names.pkl'):
-            with open('trend_cluster_names.pkl', 'rb') as f:
-                trend_cluster_names = pickle.load(f)
-            print("Trend Cluster Names loaded successfully!")
-
+        print(f"Model version {models.version} active ({models.memory_bytes} bytes)")
     except Exception as e:
         print(f"ERROR loading ML models: {e}")
 
@@ -123,66 +113,133 @@ load_ml_models()
 @app.route("/debug/model_status", methods=["GET"])
 def model_status():
     """Debug endpoint to check if ML models are loaded"""
-    import os
+    models = model_registry.active
     return jsonify({
-        "models_loaded": {
-            "health_cluster_model": health_cluster_model is not None,
-            "health_scaler": health_scaler is not None,
-            "anomaly_model": anomaly_model is not None,
-            "cluster_names": cluster_names is not None,
-            "trend_detector": trend_detector is not None,
-            "trend_detector_scaler": trend_detector_scaler is not None,
-            "trend_cluster_model": trend_cluster_model is not None,
-            "trend_cluster_scaler": trend_cluster_scaler is not None,
-            "trend_cluster_names": trend_cluster_names is not None,
-        },
+        "active_version": models.describe(),
+        "models_loaded": {name: models.is_loaded(name) for name in MODEL_FILES},
         "files_exist": {
-            "health_cluster_model.pkl": os.path.exists('health_cluster_model.pkl'),
-            "health_scaler.pkl": os.path.exists('health_scaler.pkl'),
-            "anomaly_model.pkl": os.path.exists('anomaly_model.pkl'),
-            "cluster_names.pkl": os.path.exists('cluster_names.pkl'),
-            "trend_detector.pkl": os.path.exists('trend_detector.pkl'),
-            "trend_detector_scaler.pkl": os.path.exists('trend_detector_scaler.pkl'),
-            "trend_cluster_model.pkl": os.path.exists('trend_cluster_model.pkl'),
-            "trend_cluster_scaler.pkl": os.path.exists('trend_cluster_scaler.pkl'),
-            "trend_cluster_names.pkl": os.path.exists('trend_cluster_names.pkl'),
+            filename: os.path.exists(os.path.join(MODEL_DIR, filename))
+            for filename in MODEL_FILES.values()
+        },
+        "reload": {
+            "in_progress": model_registry.reload_in_progress,
+            "last_error": model_registry.last_reload_error,
+            "history": model_registry.history,
         },
         "working_directory": os.getcwd(),
-        "files_in_dir": [f for f in os.listdir('.') if f.endswith('.pkl')]
+        "files_in_dir": [f for f in os.listdir(MODEL_DIR) if f.endswith('.pkl')]
     })
 
+@app.route("/debug/reload_models", methods=["POST"])
+def reload_models():
+    """Load the model files in MODEL_DIR as a new version and hot-swap it in the background"""
+    started = model_registry.reload_async()
+    return jsonify({
+        "reload_started": started,
+        "active_version": model_registry.active.version,
+        "message": "Reload started" if started else "A reload is already in progress"
+    }), 202 if started else 409
+
+# -----------------------------------------------------------------------------
+# Health Checks - never touch the database (used by the Railway healthcheck)
+# -----------------------------------------------------------------------------
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: models loaded and the last database contact did not fail"""
+    models = model_registry.active
+    models_ready = models.health_cluster_model is not None and trend_models_loaded(models)
+    database_ready = store.healthy()
+    ready = models_ready and database_ready
+    return jsonify({
+        "ready": ready,
+        "models_loaded": models_ready,
+        "model_version": models.version,
+        "database": store.status()
+    }), 200 if ready else 503
+
 # -----------------------------------------------------------------------------
 # Helper function to resolve patient ID (simple or firebase UID)
 # -----------------------------------------------------------------------------
+patient_id_cache = PatientIdCache(users_ttl_seconds=int(os.getenv("USERS_INDEX_TTL", 300)))
+if os.getenv("RESOLVER_LISTEN", "1") == "1":
+    patient_id_cache.start_listener()
+
 def resolve_patient_id(patient_id_input):
     """
     Accept either simple ID (P1, P2, p1, p2) or Firebase UID.
     Returns actual Firebase UID.
+    Simple IDs are served from the in-memory PatientIdCache.
     """
     if not patient_id_input:
         return None
 
     # Handle both uppercase and lowercase patient IDs (P1, p1, P2, p2, etc.)
+    # P<digits> of any length is a simple ID (P1000+ too); UIDs are 28 chars
     patient_id_upper = patient_id_input.upper()
-    if patient_id_upper.startswith('P') and len(patient_id_upper) <= 4:
-        mapping_ref = db.reference(f"patient_mappings/{patient_id_upper}")
-        uid = mapping_ref.get()
+    if patient_id_upper.startswith('P') and (len(patient_id_upper) <= 4 or patient_id_upper[1:].isdigit()):
+        with metrics.span("resolve_id"):
+            uid = patient_id_cache.resolve(patient_id_upper)
         if uid:
-            print(f"DEBUG: Resolved {patient_id_input} -> {uid}")
             return uid
-        # If not in mappings, try to find in users table
-        users_ref = db.reference("users")
-        users = users_ref.get()
-        if users:
-            for uid, user_data in users.items():
-                if user_data.get("patientId", "").upper() == patient_id_upper:
-                    print(f"DEBUG: Found {patient_id_input} in users table -> {uid}")
-                    return uid
         print(f"DEBUG: Patient {patient_id_input} not found")
         return None
     # Assume it's a Firebase UID
     return patient_id_input
 
+# Final JSON of predict_health / detect_deterioration, keyed by a fingerprint
+# of endpoint + model version + patient + exact model input
+result_cache = ResultCache(
+    max_bytes=int(float(os.getenv("RESULT_CACHE_MB", 16)) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL", 60)),
+)
+
+# Concurrent identical requests (same fingerprint) share one model run
+inference_flight = SingleFlight()
+
+def cached_json_response(body, cache_status):
+    response = app.response_class(body, mimetype="application/json")
+    response.headers["X-Result-Cache"] = cache_status
+    return response
+
+def cached_inference(cache_key, compute):
+    """
+    Answer from the result cache, else run compute() - once for all
+    concurrent callers with this key - and cache its serialized result.
+    """
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached_json_response(cached, "HIT")
+
+    def run():
+        body = jsonify(compute()).get_data()
+        result_cache.put(cache_key, body)
+        return body
+
+    body, shared = inference_flight.do(cache_key, run)
+    return cached_json_response(body, "SHARED" if shared else "MISS")
+
+@app.route("/debug/cache_stats", methods=["GET"])
+def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return jsonify({
+        "patient_id_cache": patient_id_cache.stats(),
+        "patient_directory": patient_directory.stats(),
+        "window_cache": window_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "inference_coalescing": inference_flight.stats(),
+        "fetch_coalescing": fetch_flight.stats()
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request, stage and model latency histograms in Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # -----------------------------------------------------------------------------
 # Patient Management Routes
 # -----------------------------------------------------------------------------
@@ -198,12 +255,10 @@ def resolve_patient():
     if not resolved_uid:
         return jsonify({"error": "Patient not found"}), 404
 
-    patient_info_ref = db.reference(f"patient_info/{patient_input}")
-    patient_info = patient_info_ref.get()
+    patient_info = store.get(f"patient_info/{patient_input}")
 
     if not patient_info:
-        user_ref = db.reference(f"users/{resolved_uid}")
-        user_data = user_ref.get()
+        user_data = store.get(f"users/{resolved_uid}")
         if user_data:
             patient_info = {
                 "name": user_data.get("fullName", "Unknown"),
@@ -219,24 +274,43 @@ def resolve_patient():
 
 @app.route("/get_all_patients", methods=["GET"])
 def get_all_patients():
-    """Get all patients with their simple IDs"""
-    patient_mappings_ref = db.reference("patient_mappings")
-    mappings = patient_mappings_ref.get() or {}
-
-    patient_info_ref = db.reference("patient_info")
-    patient_info = patient_info_ref.get() or {}
-
-    patients = []
-    for simple_id, uid in mappings.items():
-        info = patient_info.get(simple_id, {})
-        patients.append({
-            "simple_id": simple_id,
-            "firebase_uid": uid,
-            "name": info.get("name", "Unknown"),
-            "email": info.get("email", "")
-        })
+    """
+    Get all patients with their simple IDs, ordered P1, P2, ...
+    Optional paging: ?limit=50&after=P50 (next_after is returned while more remain).
+    Served from the in-memory PatientDirectory; the ETag comes from its
+    content hash, so If-None-Match revalidation returns 304 without
+    reading the store or building the body.
+    """
+    try:
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    after = request.args.get("after")
+
+    # One snapshot for both the ETag and the body
+    listing = patient_directory.listing()
+    etag = fingerprint("get_all_patients", listing[0], limit, after)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        _, patients, total, next_after = patient_directory.page(limit, after, listing)
+        response = jsonify({"patients": patients, "total": total, "next_after": next_after})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def patient_sort_key(simple_id):
+    """P2 sorts before P10; anything that is not P<n> sorts last, by name"""
+    if simple_id[:1] == "P" and simple_id[1:].isdigit():
+        return (0, int(simple_id[1:]), "")
+    return (1, 0, simple_id)
 
-    return jsonify({"patients": patients})
+# Sorted patient list for /get_all_patients, rebuilt only when mappings/patient_info change
+patient_directory = PatientDirectory(patient_id_cache, patient_sort_key)
+if os.getenv("RESOLVER_LISTEN", "1") == "1":
+    patient_directory.start_listener()
 
 @app.route("/assign_patient_id", methods=["POST"])
 def assign_patient_id():
@@ -249,36 +323,25 @@ def assign_patient_id():
     if not firebase_uid:
         return jsonify({"error": "Missing firebase_uid"}), 400
 
-    patient_mappings_ref = db.reference("patient_mappings")
-    mappings = patient_mappings_ref.get() or {}
+    # Reverse index: single-key read instead of scanning patient_mappings
+    existing_id = lookup_simple_id(firebase_uid)
+    if existing_id:
+        return jsonify({
+            "simple_id": existing_id,
+            "firebase_uid": firebase_uid,
+            "message": "Patient already has an ID"
+        })
 
-    for simple_id, uid in mappings.items():
-        if uid == firebase_uid:
-            return jsonify({
-                "simple_id": simple_id,
-                "firebase_uid": firebase_uid,
-                "message": "Patient already has an ID"
-            })
+    # O(1) transactional allocation + one multi-path write
+    new_simple_id, created = assign_new_patient_id(firebase_uid, patient_name, patient_email)
+    patient_id_cache.remember(new_simple_id, firebase_uid)
 
-    max_patient_num = 0
-    for simple_id in mappings.keys():
-        if simple_id.startswith("P"):
-            try:
-                num = int(simple_id[1:])
-                max_patient_num = max(max_patient_num, num)
-            except:
-                pass
-
-    new_patient_num = max_patient_num + 1
-    new_simple_id = f"P{new_patient_num}"
-
-    db.reference(f"patient_mappings/{new_simple_id}").set(firebase_uid)
-    db.reference(f"patient_info/{new_simple_id}").set({
-        "name": patient_name,
-        "email": patient_email,
-        "uid": firebase_uid
-    })
-    db.reference(f"users/{firebase_uid}/patientId").set(new_simple_id)
+    if not created:
+        return jsonify({
+            "simple_id": new_simple_id,
+            "firebase_uid": firebase_uid,
+            "message": "Patient already has an ID"
+        })
 
     print(f"Assigned {new_simple_id} to {patient_name} (UID: {firebase_uid[:20]}...)")
 
@@ -297,18 +360,11 @@ def assign_patient_id_to_existing():
     if not email:
         return jsonify({"error": "Missing email"}), 400
 
-    users_ref = db.reference("users")
-    users = users_ref.get() or {}
+    # Reverse index: single-key read instead of downloading every user
+    firebase_uid = lookup_uid_by_email(email)
+    user_data = store.get(f"users/{firebase_uid}") if firebase_uid else None
 
-    firebase_uid = None
-    user_data = None
-    for uid, udata in users.items():
-        if udata.get("email") == email:
-            firebase_uid = uid
-            user_data = udata
-            break
-
-    if not firebase_uid:
+    if not firebase_uid or not user_data:
         return jsonify({"error": f"User with email {email} not found"}), 404
 
     if user_data.get("patientId"):
@@ -318,29 +374,19 @@ def assign_patient_id_to_existing():
             "firebase_uid": firebase_uid
         })
 
-    patient_mappings_ref = db.reference("patient_mappings")
-    mappings = patient_mappings_ref.get() or {}
+    # O(1) transactional allocation + one multi-path write
+    new_simple_id, created = assign_new_patient_id(
+        firebase_uid, user_data.get("fullName", "Unknown"), email,
+        user_fields={"dataSource": "watch"}
+    )
+    patient_id_cache.remember(new_simple_id, firebase_uid)
 
-    max_patient_num = 0
-    for simple_id in mappings.keys():
-        if simple_id.startswith("P"):
-            try:
-                num = int(simple_id[1:])
-                max_patient_num = max(max_patient_num, num)
-            except:
-                pass
-
-    new_patient_num = max_patient_num + 1
-    new_simple_id = f"P{new_patient_num}"
-
-    db.reference(f"patient_mappings/{new_simple_id}").set(firebase_uid)
-    db.reference(f"patient_info/{new_simple_id}").set({
-        "name": user_data.get("fullName", "Unknown"),
-        "email": email,
-        "uid": firebase_uid
-    })
-    db.reference(f"users/{firebase_uid}/patientId").set(new_simple_id)
-    db.reference(f"users/{firebase_uid}/dataSource").set("watch")
+    if not created:
+        return jsonify({
+            "message": "User already has Patient ID",
+            "patientId": new_simple_id,
+            "firebase_uid": firebase_uid
+        })
 
     print(f"Manually assigned {new_simple_id} to {email} (UID: {firebase_uid[:20]}...) - dataSource: watch")
 
@@ -391,110 +437,147 @@ def predict_health():
         # Resolve patient ID
         patient_id = resolve_patient_id(patient_id_input) if patient_id_input else None
 
-        # If health_data not provided, fetch from Firebase
+        # If health_data not provided, use the latest reading (hot window cache)
         if patient_id and not health_data:
-            health_ref = db.reference(f"health_data/{patient_id}/current")
-            health_data = health_ref.get() or {}
+            with metrics.span("window_cache"):
+                health_data = window_cache.current(patient_id) or {}
 
         if not health_data:
             return jsonify({"error": "No health data available"}), 400
 
-        # Extract ONLY watch variables (no manual input)
-        heart_rate = health_data.get("heartRate", 70)
-        steps = health_data.get("steps", 5000)
-        calories = health_data.get("calories", 200)
-        distance = health_data.get("distance", 3.0)
-        sleep_hours = health_data.get("sleepHours", 7.0)
-        workout_minutes = health_data.get("workout", 0)
-
-        result = {
-            "patient_id": patient_id_input,
-            "timestamp": datetime.now().isoformat(),
-            "watch_data": {
-                "heart_rate": heart_rate,
-                "steps": steps,
-                "calories": calories,
-                "distance": distance,
-                "sleep_hours": sleep_hours,
-                "workout_minutes": workout_minutes
-            },
-            "predictions": {}
-        }
-
         # Check if ML models are loaded
-        if health_cluster_model is None:
+        models = model_registry.active
+        if models.health_cluster_model is None:
             return jsonify({
                 "error": "ML models not trained yet. Please run train_health_model.py first.",
                 "status": "models_not_loaded"
             }), 503
 
-        # Prepare feature vector (ONLY watch variables)
-        # Order: heartRate, steps, calories, distance, sleepHours, workout
-        X = np.array([[heart_rate, steps, calories, distance, sleep_hours, workout_minutes]])
+        # Same reading + same model version -> cached JSON, models untouched
+        cache_key = fingerprint("predict_health", models.version, patient_id_input,
+                                json.dumps(health_data, sort_keys=True, default=str))
+        return cached_inference(
+            cache_key, lambda: build_health_predictions(models, [(patient_id_input, health_data)])[0]
+        )
+
+    except Exception as e:
+        print(f"ERROR in health prediction: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-        # Scale features
-        X_scaled = health_scaler.transform(X)
 
-        # Model 1: Health Pattern Clustering (UNSUPERVISED - No Manual Labels!)
-        cluster_id = health_cluster_model.predict(X_scaled)[0]
+def extract_watch_data(health_data):
+    """Extract ONLY watch variables (no manual input), with the same defaults as always"""
+    return {
+        "heart_rate": health_data.get("heartRate", 70),
+        "steps": health_data.get("steps", 5000),
+        "calories": health_data.get("calories", 200),
+        "distance": health_data.get("distance", 3.0),
+        "sleep_hours": health_data.get("sleepHours", 7.0),
+        "workout_minutes": health_data.get("workout", 0)
+    }
 
-        # Get cluster info
-        cluster_info = cluster_names.get(cluster_id, {"name": "Unknown", "color": "gray"})
 
-        # Calculate confidence based on distance to cluster centers
-        distances = health_cluster_model.transform(X_scaled)[0]
-        min_dist = distances[cluster_id]
-        max_dist = max(distances)
-        confidence = (1 - min_dist / max_dist) * 100 if max_dist > 0 else 50
+def generate_health_recommendations(watch_data):
+    """Generate recommendations based on watch data patterns"""
+    recommendations = []
+
+    if watch_data["steps"] < 5000:
+        recommendations.append("Increase daily steps - aim for at least 8,000 steps")
+    if watch_data["sleep_hours"] < 6:
+        recommendations.append("Sleep duration is low - aim for 7-9 hours")
+    if watch_data["heart_rate"] > 100:
+        recommendations.append("Elevated resting heart rate - consider relaxation techniques")
+    if watch_data["workout_minutes"] < 20:
+        recommendations.append("Increase physical activity - aim for 30+ minutes daily")
+    if watch_data["calories"] < 150:
+        recommendations.append("Low calorie burn indicates sedentary behavior")
+
+    if not recommendations:
+        recommendations.append("Great job! Your health patterns look good. Keep it up!")
+
+    return recommendations
+
+
+def run_forest(models, name, X):
+    """(decision, labels) of a compiled forest, scaling and tree walk timed apart"""
+    kernel = models.kernels[name]
+    with metrics.model_span(name, "scale"):
+        X_scaled = kernel.scale(X)
+    with metrics.model_span(name, "predict", rows=len(X)):
+        return kernel.score_scaled(X_scaled)
 
-        result["predictions"]["health_pattern"] = {
-            "pattern": cluster_info['name'],
-            "cluster_id": int(cluster_id),
-            "confidence": round(confidence, 1),
-            "color": cluster_info['color'],
-            "method": "K-Means Clustering (Unsupervised)"
-        }
 
-        # Model 2: Anomaly Detection (UNSUPERVISED)
-        if anomaly_model is not None:
-            anomaly_score = anomaly_model.decision_function(X_scaled)[0]
-            is_anomaly = anomaly_model.predict(X_scaled)[0] == -1
+def run_kmeans(models, name, X):
+    """(cluster ids, distances, confidence); scaling is folded into the centroids"""
+    with metrics.model_span(name, "predict", rows=len(X)):
+        return models.kernels[name].predict(X)
 
+
+def build_health_predictions(models, entries):
+    """
+    Run the health models over many readings at once.
+    entries: list of (patient_id_input, health_data) pairs.
+    Returns one /predict_health-shaped result dict per entry, in order.
+    """
+    with metrics.span("features"):
+        watch_rows = [extract_watch_data(health_data) for _, health_data in entries]
+
+        # Prepare feature matrix (ONLY watch variables), one row per patient
+        # Order: heartRate, steps, calories, distance, sleepHours, workout
+        X = np.array([[
+            w["heart_rate"], w["steps"], w["calories"],
+            w["distance"], w["sleep_hours"], w["workout_minutes"]
+        ] for w in watch_rows], dtype=np.float64)
+
+    # Model 1: Health Pattern Clustering (UNSUPERVISED - No Manual Labels!)
+    # Compiled kernel: scaler folded into centroids -> one distance matrix
+    cluster_ids, _, confidences = run_kmeans(models, "health_kmeans", X)
+
+    # Model 2: Anomaly Detection (UNSUPERVISED)
+    # Flattened forest: score and label from a single tree walk
+    anomaly_scores = anomaly_labels = None
+    if models.anomaly_model is not None:
+        anomaly_scores, anomaly_labels = run_forest(models, "anomaly_forest", X)
+
+    timestamp = datetime.now().isoformat()
+    results = []
+    for i, (patient_id_input, _) in enumerate(entries):
+        cluster_id = int(cluster_ids[i])
+        confidence = float(confidences[i])
+        cluster_info = models.cluster_names.get(cluster_id, {"name": "Unknown", "color": "gray"})
+
+        result = {
+            "patient_id": patient_id_input,
+            "timestamp": timestamp,
+            "watch_data": watch_rows[i],
+            "predictions": {
+                "health_pattern": {
+                    "pattern": cluster_info['name'],
+                    "cluster_id": cluster_id,
+                    "confidence": round(confidence, 1),
+                    "color": cluster_info['color'],
+                    "method": "K-Means Clustering (Unsupervised)"
+                }
+            }
+        }
+
+        if anomaly_scores is not None:
+            is_anomaly = anomaly_labels[i] == -1
             result["predictions"]["anomaly"] = {
                 "is_anomaly": bool(is_anomaly),
-                "anomaly_score": round(float(anomaly_score), 3),
+                "anomaly_score": round(float(anomaly_scores[i]), 3),
                 "status": "Abnormal Pattern Detected" if is_anomaly else "Normal Pattern",
                 "method": "Isolation Forest (Unsupervised)"
             }
 
-        # Generate recommendations based on watch data patterns
-        recommendations = []
-
-        if steps < 5000:
-            recommendations.append("Increase daily steps - aim for at least 8,000 steps")
-        if sleep_hours < 6:
-            recommendations.append("Sleep duration is low - aim for 7-9 hours")
-        if heart_rate > 100:
-            recommendations.append("Elevated resting heart rate - consider relaxation techniques")
-        if workout_minutes < 20:
-            recommendations.append("Increase physical activity - aim for 30+ minutes daily")
-        if calories < 150:
-            recommendations.append("Low calorie burn indicates sedentary behavior")
-
-        if not recommendations:
-            recommendations.append("Great job! Your health patterns look good. Keep it up!")
-
-        result["recommendations"] = recommendations
+        result["recommendations"] = generate_health_recommendations(watch_rows[i])
+        results.append(result)
 
         print(f"Health Prediction for {patient_id_input}: {cluster_info['name']} (Confidence: {confidence:.1f}%)")
 
-        return jsonify(result)
-
-    except Exception as e:
-        print(f"ERROR in health prediction: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    return results
 
 
 @app.route("/get_health_prediction/<patient_id>", methods=["GET"])
@@ -508,9 +591,9 @@ def get_health_prediction(patient_id):
         if not resolved_id:
             return jsonify({"error": "Patient not found"}), 404
 
-        # Fetch latest health data from watch
-        health_ref = db.reference(f"health_data/{resolved_id}/current")
-        health_data = health_ref.get()
+        # Latest health data from watch (hot window cache)
+        with metrics.span("window_cache"):
+            health_data = window_cache.current(resolved_id)
 
         if not health_data:
             return jsonify({"error": "No health data available for this patient"}), 404
@@ -528,56 +611,327 @@ def get_health_prediction(patient_id):
         return jsonify({"error": str(e)}), 500
 
 
+MAX_BATCH_PATIENTS = int(os.getenv("MAX_BATCH_PATIENTS", 500))
+_fetch_pool = ThreadPoolExecutor(max_workers=int(os.getenv("FETCH_WORKERS", 16)), thread_name_prefix="fetch")
+# Concurrent reads of the same patient path share one round-trip
+fetch_flight = SingleFlight()
+
+
+def fetch_once(path, fetch):
+    """Run fetch() for path, coalesced with any identical read in flight"""
+    return fetch_flight.do(path, fetch)[0]
+
+
+def fetch_current(uid):
+    path = f"health_data/{uid}/current"
+    return fetch_once(path, lambda: store.get(path))
+
+
+def fetch_current_readings(uids):
+    """
+    Fetch health_data/{uid}/current for many patients in one go.
+    RTDB has no multi-key get, so the reads are issued concurrently and the
+    whole batch costs about one round-trip. Returns {uid: reading or None}.
+    """
+    uids = list(dict.fromkeys(uids))
+    readings = _fetch_pool.map(metrics.bind(fetch_current), uids)
+    return dict(zip(uids, readings))
+
+
+@app.route("/predict_health_batch", methods=["POST"])
+def predict_health_batch():
+    """
+    Batch Health Prediction - a whole patient panel in one request
+
+    Input:
+    {
+        "patients": [
+            "P1",                                           # fetch current reading
+            {"patient_id": "P2"},                           # same
+            {"patient_id": "P3", "health_data": {...}},     # inline reading
+            {"health_data": {...}}                          # anonymous reading
+        ]
+    }
+    ("patient_ids": ["P1", "P2"] is accepted as a shorthand)
+
+    Output:
+    {
+        "results": [<same shape as /predict_health> or {"patient_id", "error"}],
+        "count": N
+    }
+    """
+    try:
+        data = request.get_json(force=True)
+        patients = data.get("patients") or data.get("patient_ids") or []
+
+        if not isinstance(patients, list) or not patients:
+            return jsonify({"error": "Missing patients list"}), 400
+        if len(patients) > MAX_BATCH_PATIENTS:
+            return jsonify({"error": f"Too many patients (max {MAX_BATCH_PATIENTS})"}), 400
+
+        models = model_registry.active
+        if models.health_cluster_model is None:
+            return jsonify({
+                "error": "ML models not trained yet. Please run train_health_model.py first.",
+                "status": "models_not_loaded"
+            }), 503
+
+        # Normalize entries and resolve IDs
+        entries = []
+        for item in patients:
+            if not isinstance(item, dict):
+                item = {"patient_id": item}
+            patient_id_input = item.get("patient_id")
+            patient_id = resolve_patient_id(patient_id_input) if patient_id_input else None
+            entries.append({
+                "patient_id_input": patient_id_input,
+                "patient_id": patient_id,
+                "health_data": item.get("health_data") or {}
+            })
+
+        # One concurrent fetch for every reading that was not sent inline
+        missing = [e["patient_id"] for e in entries if e["patient_id"] and not e["health_data"]]
+        if missing:
+            readings = fetch_current_readings(missing)
+            for entry in entries:
+                if entry["patient_id"] in readings and not entry["health_data"]:
+                    entry["health_data"] = readings[entry["patient_id"]] or {}
+
+        # Stack every scorable reading into one matrix
+        scorable = [(e["patient_id_input"], e["health_data"]) for e in entries if e["health_data"]]
+        predictions = iter(build_health_predictions(models, scorable)) if scorable else iter([])
+
+        results = []
+        for entry in entries:
+            if entry["health_data"]:
+                results.append(next(predictions))
+            elif entry["patient_id_input"] and not entry["patient_id"]:
+                results.append({"patient_id": entry["patient_id_input"], "error": "Patient not found"})
+            else:
+                results.append({"patient_id": entry["patient_id_input"], "error": "No health data available"})
+
+        return jsonify({"results": results, "count": len(results)})
+
+    except Exception as e:
+        print(f"ERROR in batch health prediction: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
 # -----------------------------------------------------------------------------
 # TREND-BASED DETERIORATION DETECTION - UNSUPERVISED ML
 # Analyzes past 7 days to detect if health is DECLINING
 # NO future prediction - only pattern detection!
 # -----------------------------------------------------------------------------
 
-def calculate_trend_features(window):
+# Days per trend window (history days + today's current reading). Every
+# history read is bounded to the last TREND_WINDOW_DAYS - 1 days.
+TREND_WINDOW_DAYS = int(os.getenv("TREND_WINDOW_DAYS", 7))
+HISTORY_DAYS = TREND_WINDOW_DAYS - 1
+MIN_TREND_DAYS = 3
+
+# Neutral defaults for missing/null watch fields (heartRate, steps, calories, distance, sleepHours)
+READING_DEFAULTS = [('heartRate', 70), ('steps', 5000), ('calories', 200), ('distance', 3.0), ('sleepHours', 7.0)]
+
+
+def get_workout_minutes(data):
+    """Handle workout - can be number, object, or array from real watch"""
+    workout = data.get('workout', 0)
+    if isinstance(workout, (int, float)):
+        return float(workout)
+    elif isinstance(workout, list):
+        # Real watch data has workout as array - sum all durations
+        return float(sum(w.get('durationMinutes', 0) for w in workout if isinstance(w, dict)))
+    elif isinstance(workout, dict):
+        return float(workout.get('durationMinutes', 0))
+    return 0.0
+
+
+def reading_to_row(day_data):
+    """One day of watch data -> [heartRate, steps, calories, distance, sleepHours, workout]"""
+    row = [float(day_data.get(key, default) or default) for key, default in READING_DEFAULTS]
+    row.append(get_workout_minutes(day_data))
+    return row
+
+
+def fetch_history(uid):
+    """Last HISTORY_DAYS days of health_data/{uid}/history - never the full history"""
+    path = f"health_data/{uid}/history"
+    return fetch_once((path, HISTORY_DAYS), lambda: store.get_last(path, HISTORY_DAYS))
+
+
+def fetch_trend_data(uid):
+    """(bounded history, current reading) for one patient"""
+    return fetch_history(uid), fetch_current(uid)
+
+
+def fetch_window_rows(uids):
     """
-    Extract trend features from 7-day window of health data
-    Same calculation as training - consistency is critical for ML
+    Window rows (last HISTORY_DAYS history days + current) for each uid.
+    History comes from the time-series store in one bulk query when
+    TIMESERIES_DB is set, else from concurrent bounded RTDB reads.
     """
-    feature_names = ['AvgHeartRate', 'TotalSteps', 'Calories', 'TotalDistance', 'SleepHours', 'ActiveMinutes']
-    features = []
+    timeseries = history_timeseries()
+    if timeseries is None:
+        return [build_window_rows(history_data, current_data)
+                for history_data, current_data in _fetch_pool.map(metrics.bind(fetch_trend_data), uids)]
+    histories = timeseries.windows(uids, HISTORY_DAYS)
+    currents = fetch_current_readings(uids)
+    windows = []
+    for uid in uids:
+        rows = histories[uid][1].tolist()
+        if currents.get(uid):
+            rows.append(reading_to_row(currents[uid]))
+        windows.append(rows)
+    return windows
+
+
+def build_window_rows(history_data, current_data):
+    """Last HISTORY_DAYS history days + the current reading, oldest first"""
+    rows = []
+    if history_data and HISTORY_DAYS > 0:
+        for date_key in sorted(history_data.keys())[-HISTORY_DAYS:]:
+            rows.append(reading_to_row(history_data[date_key]))
+    if current_data:
+        rows.append(reading_to_row(current_data))
+    return rows
+
+
+def pad_window(rows):
+    """Repeat the oldest day until the window is TREND_WINDOW_DAYS long"""
+    rows = np.asarray(rows, dtype=np.float64)
+    missing = TREND_WINDOW_DAYS - len(rows)
+    if missing > 0:
+        rows = np.concatenate([np.repeat(rows[:1], missing, axis=0), rows])
+    return rows
+
+
+# Optional indexed mirror of health_data/*/history (one typed row per patient-day).
+# When set it is the history read path for the window cache, scoring and the scheduler.
+TIMESERIES_DB = os.getenv("TIMESERIES_DB")
+timeseries = TimeseriesStore(TIMESERIES_DB) if TIMESERIES_DB else None
+timeseries_mirror = TimeseriesMirror(
+    timeseries, reading_to_row, resync_seconds=float(os.getenv("TIMESERIES_RESYNC_SECONDS", 300)),
+) if timeseries else None
+# In-process mirror (TIMESERIES_MIRROR=0 when `python timeseries_store.py follow` runs apart)
+TIMESERIES_MIRROR = timeseries_mirror is not None and os.getenv("TIMESERIES_MIRROR", "1") == "1"
+
+
+def timeseries_ready():
+    """False while the in-process mirror's first catch-up runs (history comes from the store until then)"""
+    return not TIMESERIES_MIRROR or timeseries_mirror.ready.is_set()
+
+
+def history_timeseries():
+    """The time-series store to read history from, or None for the primary store"""
+    return timeseries if timeseries is not None and timeseries_ready() else None
+
+
+@app.route("/debug/timeseries_stats", methods=["GET"])
+def timeseries_stats():
+    """Rows, patients and sync progress of the time-series mirror"""
+    if timeseries_mirror is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(timeseries_mirror.stats(), enabled=True))
+
+
+# Last 30 days per active patient as float32 blocks, LRU under a memory budget
+window_cache = WindowCache(
+    reading_to_row,
+    max_bytes=int(float(os.getenv("WINDOW_CACHE_MB", 64)) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("WINDOW_CACHE_TTL", 30)),
+    days=max(30, HISTORY_DAYS),
+    trend_days=TREND_WINDOW_DAYS,
+    timeseries=timeseries,
+    timeseries_ready=timeseries_ready,
+)
+TREND_STATE_FILE = os.getenv("TREND_STATE_FILE")
+if TREND_STATE_FILE and os.path.exists(TREND_STATE_FILE):
+    try:
+        window_cache.load(TREND_STATE_FILE)
+    except Exception as e:
+        print(f"WARNING: Could not restore window cache from {TREND_STATE_FILE}: {e}")
 
-    for i, name in enumerate(feature_names):
-        col_data = window[:, i]
 
-        # 1. Mean (average level)
-        features.append(np.mean(col_data))
 
-        # 2. Standard Deviation (variability)
-        features.append(np.std(col_data))
+def build_deterioration_results(models, entries, trend_features=None):
+    """
+    Run both trend models over many windows at once.
+    entries: list of (patient_id_input, window (7, 6), days_available).
+    trend_features: precomputed (N, 36) features (e.g. from RollingTrendState).
+    Returns one /detect_deterioration-shaped result dict per entry, in order.
+    """
+    if trend_features is None:
+        # Calculate trend features for every window in one vectorized pass
+        with metrics.span("features"):
+            windows = np.stack([window for _, window, _ in entries])
+            trend_features = calculate_trend_features_batch(windows)
 
-        # 3. Trend Slope (is it increasing/decreasing?)
-        x = np.arange(len(col_data))
-        if np.std(col_data) > 0:
-            slope = np.polyfit(x, col_data, 1)[0]
-        else:
-            slope = 0
-        features.append(slope)
+    # DETECTION 1: Isolation Forest (Anomaly Detection)
+    anomaly_scores, anomaly_labels = run_forest(models, "trend_forest", trend_features)
 
-        # 4. Change Rate (end vs start)
-        if col_data[0] != 0:
-            change_rate = (col_data[-1] - col_data[0]) / col_data[0]
-        else:
-            change_rate = 0
-        features.append(change_rate)
+    # DETECTION 2: K-Means Clustering (Deterioration Status)
+    cluster_ids = run_kmeans(models, "trend_kmeans", trend_features)[0]
 
-        # 5. Recent value (most recent day)
-        features.append(col_data[-1])
+    timestamp = datetime.now().isoformat()
+    results = []
+    for i, (patient_id_input, window, days_available) in enumerate(entries):
+        features = trend_features[i]
 
-        # 6. Trend consistency
-        diffs = np.diff(col_data)
-        if len(diffs) > 0:
-            trend_consistency = np.mean(diffs)
-        else:
-            trend_consistency = 0
-        features.append(trend_consistency)
+        # Extract slope values for trend display
+        hr_slope = features[2]
+        steps_slope = features[8]
+        sleep_slope = features[26]
 
-    return np.array(features)
+        is_anomaly = anomaly_labels[i] == -1
+        cluster_info = models.trend_cluster_names.get(
+            int(cluster_ids[i]), {"name": "Unknown", "color": "gray", "severity": 1}
+        )
+
+        results.append({
+            "patient_id": patient_id_input,
+            "timestamp": timestamp,
+            "analysis_period": f"Last {days_available} days",
+            "past_data_summary": {
+                "avg_heart_rate": round(float(np.mean(window[:, 0])), 1),
+                "avg_steps": round(float(np.mean(window[:, 1])), 0),
+                "avg_sleep": round(float(np.mean(window[:, 4])), 1),
+                "heart_rate_trend": "increasing" if hr_slope > 0.5 else ("decreasing" if hr_slope < -0.5 else "stable"),
+                "steps_trend": "increasing" if steps_slope > 100 else ("decreasing" if steps_slope < -100 else "stable"),
+                "sleep_trend": "increasing" if sleep_slope > 0.1 else ("decreasing" if sleep_slope < -0.1 else "stable"),
+            },
+            "trend_slopes": {
+                "heart_rate": round(float(hr_slope), 2),
+                "steps": round(float(steps_slope), 0),
+                "sleep": round(float(sleep_slope), 2)
+            },
+            "detection": {
+                "anomaly": {
+                    "is_anomaly": bool(is_anomaly),
+                    "anomaly_score": round(float(anomaly_scores[i]), 3),
+                    "status": "Abnormal Trend Detected" if is_anomaly else "Normal Trend",
+                    "method": "Isolation Forest (Unsupervised)"
+                },
+                "deterioration_status": {
+                    "status": cluster_info['name'],
+                    "color": cluster_info['color'],
+                    "severity": cluster_info['severity'],
+                    "interpretation": get_deterioration_interpretation(cluster_info['severity'], features),
+                    "method": "K-Means Clustering (Unsupervised)"
+                }
+            },
+            # Generate recommendations based on detected trends
+            "recommendations": generate_deterioration_recommendations(
+                cluster_info['severity'], features, is_anomaly
+            )
+        })
+
+    return results
+
+
+def trend_models_loaded(models):
+    return models.trend_detector is not None and models.trend_cluster_model is not None
 
 
 @app.route("/detect_deterioration", methods=["POST"])
@@ -602,150 +956,169 @@ def detect_deterioration():
         if not patient_id:
             return jsonify({"error": "Patient not found"}), 404
 
-        # Fetch 7-day history from Firebase
-        history_ref = db.reference(f"health_data/{patient_id}/history")
-        history_data = history_ref.get()
-
-        # Also get current data
-        current_ref = db.reference(f"health_data/{patient_id}/current")
-        current_data = current_ref.get()
-
-        # Debug logging
-        print(f"DEBUG: Fetching history for patient_id={patient_id}")
-        print(f"DEBUG: history_data exists={history_data is not None}, entries={len(history_data) if history_data else 0}")
-        print(f"DEBUG: current_data exists={current_data is not None}")
-
-        # Helper function to safely extract workout minutes
-        def get_workout_minutes(data):
-            """Handle workout - can be number, object, or array from real watch"""
-            workout = data.get('workout', 0)
-            if isinstance(workout, (int, float)):
-                return float(workout)
-            elif isinstance(workout, list):
-                # Real watch data has workout as array - sum all durations
-                return float(sum(w.get('durationMinutes', 0) for w in workout if isinstance(w, dict)))
-            elif isinstance(workout, dict):
-                return float(workout.get('durationMinutes', 0))
-            return 0.0
-
-        # Build 7-day data array
-        seven_day_data = []
-
-        if history_data:
-            sorted_dates = sorted(history_data.keys())[-6:]
-            print(f"DEBUG: Using {len(sorted_dates)} history entries: {sorted_dates}")
-            for date_key in sorted_dates:
-                day_data = history_data[date_key]
-                seven_day_data.append([
-                    float(day_data.get('heartRate', 70) or 70),
-                    float(day_data.get('steps', 5000) or 5000),
-                    float(day_data.get('calories', 200) or 200),
-                    float(day_data.get('distance', 3.0) or 3.0),
-                    float(day_data.get('sleepHours', 7.0) or 7.0),
-                    get_workout_minutes(day_data)
-                ])
-
-        if current_data:
-            seven_day_data.append([
-                float(current_data.get('heartRate', 70) or 70),
-                float(current_data.get('steps', 5000) or 5000),
-                float(current_data.get('calories', 200) or 200),
-                float(current_data.get('distance', 3.0) or 3.0),
-                float(current_data.get('sleepHours', 7.0) or 7.0),
-                get_workout_minutes(current_data)
-            ])
-
-        print(f"DEBUG: Total entries built: {len(seven_day_data)}")
-
-        if len(seven_day_data) < 3:
-            print(f"DEBUG: INSUFFICIENT DATA - only {len(seven_day_data)} entries")
+        # Last HISTORY_DAYS of history + current data from the hot window cache.
+        # Rows and rolling trend features come from one snapshot of the entry,
+        # so the cache key always matches what the models score.
+        with metrics.span("window_cache"):
+            patient_window = window_cache.get(patient_id)
+        with metrics.span("window_build"):
+            seven_day_data, features = patient_window.trend_snapshot(HISTORY_DAYS, pad_to=TREND_WINDOW_DAYS)
+
+        if len(seven_day_data) < MIN_TREND_DAYS:
             return jsonify({
                 "error": "Insufficient history data",
                 "message": "Need at least 3 days of data for trend analysis",
                 "days_available": len(seven_day_data)
             }), 400
 
-        while len(seven_day_data) < 7:
-            seven_day_data.insert(0, seven_day_data[0])
-
-        window = np.array(seven_day_data)
-
         # Check if trend models are loaded
-        if trend_detector is None or trend_cluster_model is None:
+        models = model_registry.active
+        if not trend_models_loaded(models):
             return jsonify({
                 "error": "Trend models not loaded. Run train_trend_model.py first.",
                 "status": "models_not_loaded"
             }), 503
 
-        # Calculate trend features
-        trend_features = calculate_trend_features(window)
+        # Same window + same model version -> cached JSON, models untouched
+        with metrics.span("window_build"):
+            window = pad_window(seven_day_data)
+        cache_key = fingerprint("detect_deterioration", models.version, patient_id_input,
+                                window, len(seven_day_data))
+        def compute():
+            # Features come from the patient's rolling trend state (O(1) upkeep)
+            result = build_deterioration_results(
+                models, [(patient_id_input, window, len(seven_day_data))], trend_features=features[np.newaxis]
+            )[0]
+            print(f"Deterioration Detection for {patient_id_input}: {result['detection']['deterioration_status']['status']}")
+            return result
+
+        return cached_inference(cache_key, compute)
 
-        # Extract slope values for trend display
-        hr_slope = trend_features[2]
-        steps_slope = trend_features[8]
-        sleep_slope = trend_features[26]
+    except Exception as e:
+        print(f"ERROR in deterioration detection: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-        result = {
-            "patient_id": patient_id_input,
-            "timestamp": datetime.now().isoformat(),
-            "analysis_period": f"Last {len(seven_day_data)} days",
-            "past_data_summary": {
-                "avg_heart_rate": round(float(np.mean(window[:, 0])), 1),
-                "avg_steps": round(float(np.mean(window[:, 1])), 0),
-                "avg_sleep": round(float(np.mean(window[:, 4])), 1),
-                "heart_rate_trend": "increasing" if hr_slope > 0.5 else ("decreasing" if hr_slope < -0.5 else "stable"),
-                "steps_trend": "increasing" if steps_slope > 100 else ("decreasing" if steps_slope < -100 else "stable"),
-                "sleep_trend": "increasing" if sleep_slope > 0.1 else ("decreasing" if sleep_slope < -0.1 else "stable"),
-            },
-            "trend_slopes": {
-                "heart_rate": round(float(hr_slope), 2),
-                "steps": round(float(steps_slope), 0),
-                "sleep": round(float(sleep_slope), 2)
-            },
-            "detection": {}
-        }
 
-        # DETECTION 1: Isolation Forest (Anomaly Detection)
-        X_det = trend_detector_scaler.transform([trend_features])
-        is_anomaly = trend_detector.predict(X_det)[0] == -1
-        anomaly_score = trend_detector.decision_function(X_det)[0]
+def score_patients(models, patients):
+    """
+    Deterioration results for [(simple_id, uid)] in one vectorized pass.
+    Each patient's bounded window comes from fetch_window_rows().
+    Returns ({simple_id: result}, {simple_id: skip reason}).
+    """
+    with metrics.span("window_build"):
+        windows = fetch_window_rows([uid for _, uid in patients])
+
+        entries = []
+        skipped = {}
+        for (simple_id, uid), rows in zip(patients, windows):
+            if len(rows) < MIN_TREND_DAYS:
+                skipped[simple_id] = f"Insufficient history data ({len(rows)} days)"
+                continue
+            entries.append((simple_id, pad_window(rows), len(rows)))
 
-        result["detection"]["anomaly"] = {
-            "is_anomaly": bool(is_anomaly),
-            "anomaly_score": round(float(anomaly_score), 3),
-            "status": "Abnormal Trend Detected" if is_anomaly else "Normal Trend",
-            "method": "Isolation Forest (Unsupervised)"
-        }
+    results = build_deterioration_results(models, entries) if entries else []
+    return {result["patient_id"]: result for result in results}, skipped
 
-        # DETECTION 2: K-Means Clustering (Deterioration Status)
-        X_cluster = trend_cluster_scaler.transform([trend_features])
-        cluster_id = trend_cluster_model.predict(X_cluster)[0]
-        cluster_info = trend_cluster_names.get(cluster_id, {"name": "Unknown", "color": "gray", "severity": 1})
-
-        result["detection"]["deterioration_status"] = {
-            "status": cluster_info['name'],
-            "color": cluster_info['color'],
-            "severity": cluster_info['severity'],
-            "interpretation": get_deterioration_interpretation(cluster_info['severity'], trend_features),
-            "method": "K-Means Clustering (Unsupervised)"
-        }
 
-        # Generate recommendations based on detected trends
-        result["recommendations"] = generate_deterioration_recommendations(
-            cluster_info['severity'], trend_features, is_anomaly
-        )
+def list_mapped_patients():
+    """[(simple_id, uid)] for every mapped patient, sorted by simple ID"""
+    mappings = store.get("patient_mappings") or {}
+    return sorted((simple_id, uid) for simple_id, uid in mappings.items() if uid)
+
 
-        print(f"Deterioration Detection for {patient_id_input}: {cluster_info['name']}")
+def score_all_patients():
+    """
+    Bulk deterioration scoring - every mapped patient in one pass.
+
+    Reads patient_mappings once, fetches each patient's bounded window
+    (last HISTORY_DAYS + current) concurrently, builds an (N, 7, 6) window
+    tensor, and runs the trend features, trend detector and trend K-Means
+    over the whole matrix. Meant for nightly population sweeps.
 
-        return jsonify(result)
+    Returns {"results": {simple_id: result}, "skipped": {simple_id: reason}}
+    """
+    models = model_registry.active
+    if not trend_models_loaded(models):
+        raise RuntimeError("Trend models not loaded. Run train_trend_model.py first.")
 
+    results, skipped = score_patients(models, list_mapped_patients())
+    print(f"Bulk deterioration scoring: {len(results)} scored, {len(skipped)} skipped")
+
+    return {
+        "results": results,
+        "skipped": skipped
+    }
+
+
+@app.route("/detect_deterioration_bulk", methods=["GET", "POST"])
+def detect_deterioration_bulk():
+    """Deterioration status for EVERY mapped patient (population sweep)"""
+    try:
+        sweep = score_all_patients()
+        return jsonify({
+            "timestamp": datetime.now().isoformat(),
+            "scored": len(sweep["results"]),
+            "results": sweep["results"],
+            "skipped": sweep["skipped"]
+        })
+    except RuntimeError as e:
+        return jsonify({"error": str(e), "status": "models_not_loaded"}), 503
     except Exception as e:
-        print(f"ERROR in deterioration detection: {e}")
+        print(f"ERROR in bulk deterioration detection: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+# -----------------------------------------------------------------------------
+# Background Deterioration Scheduler (ENABLE_SCHEDULER=1)
+# Rescores a patient when a new day enters their window, Severe first, and
+# writes predictions/{uid}/deterioration for clients to read directly
+# -----------------------------------------------------------------------------
+def latest_history_day(uid):
+    """Newest date key in health_data/{uid}/history (one-day bounded read)"""
+    newest = store.get_last(f"health_data/{uid}/history", 1) or {}
+    return max(newest) if newest else None
+
+
+def latest_history_days(uids):
+    timeseries = history_timeseries()
+    if timeseries is not None:
+        return timeseries.latest_dates(uids)
+    return dict(zip(uids, _fetch_pool.map(metrics.bind(latest_history_day), uids)))
+
+
+def score_patients_for_scheduler(patients):
+    """{uid: result} for the patients whose window gained a day"""
+    models = model_registry.active
+    if not trend_models_loaded(models):
+        raise RuntimeError("Trend models not loaded. Run train_trend_model.py first.")
+    results, _ = score_patients(models, patients)
+    return {uid: results[simple_id] for simple_id, uid in patients if simple_id in results}
+
+
+def publish_deterioration(results):
+    """One multi-path update for the whole batch"""
+    store.update({f"predictions/{uid}/deterioration": result for uid, result in results.items()})
+
+
+deterioration_scheduler = DeteriorationScheduler(
+    list_mapped_patients, latest_history_days, score_patients_for_scheduler, publish_deterioration,
+    interval_seconds=float(os.getenv("SCHEDULER_INTERVAL", 300)),
+    batch_size=int(os.getenv("SCHEDULER_BATCH", 64)),
+    # Cap on newest-day reads per interval (0 = no cap); see scheduler.py
+    max_checks=int(os.getenv("SCHEDULER_MAX_CHECKS", 0)),
+)
+
+
+@app.route("/debug/scheduler_status", methods=["GET"])
+def scheduler_status():
+    """Runs, queue depth and last error of the deterioration scheduler"""
+    return jsonify(deterioration_scheduler.stats())
+
+
 def get_deterioration_interpretation(severity, trend_features):
     """Generate interpretation based on detected deterioration status"""
     hr_slope = trend_features[2]
@@ -826,6 +1199,410 @@ def generate_deterioration_recommendations(severity, trend_features, is_anomaly)
     return recommendations
 
 
+# -----------------------------------------------------------------------------
+# Live Prediction Stream (Server-Sent Events) - replaces 5-second polling
+# One upstream watcher per patient; payload computed once per reading change
+# and fanned out to every subscriber
+# -----------------------------------------------------------------------------
+def live_prediction(uid, reading):
+    """Health prediction for the new reading + deterioration over the cached window"""
+    models = model_registry.active
+    window_cache.apply_reading(uid, reading)
+    payload = {
+        "firebase_uid": uid,
+        "timestamp": datetime.now().isoformat(),
+        "model_version": models.version,
+    }
+    if models.health_cluster_model is not None:
+        payload["health_prediction"] = build_health_predictions(models, [(uid, reading)])[0]
+    if trend_models_loaded(models):
+        rows, features = window_cache.get(uid).trend_snapshot(HISTORY_DAYS, pad_to=TREND_WINDOW_DAYS)
+        if len(rows) >= MIN_TREND_DAYS:
+            payload["deterioration"] = build_deterioration_results(
+                models, [(uid, pad_window(rows), len(rows))], trend_features=features[np.newaxis]
+            )[0]
+    return payload
+
+
+stream_hub = StreamHub(
+    live_prediction,
+    heartbeat_seconds=float(os.getenv("STREAM_HEARTBEAT", 15)),
+    poll_seconds=float(os.getenv("STREAM_POLL_SECONDS", 5)),
+)
+
+
+@app.route("/stream/patient/<patient_id>", methods=["GET"])
+def stream_patient(patient_id):
+    """
+    SSE stream of live predictions for one patient.
+    Sends `event: prediction` with {health_prediction, deterioration} each
+    time the patient's current reading changes, plus heartbeat comments.
+    """
+    uid = resolve_patient_id(patient_id)
+    if not uid:
+        return jsonify({"error": "Patient not found"}), 404
+
+    subscriber = stream_hub.subscribe(uid)
+    return Response(
+        stream_with_context(stream_hub.events(uid, subscriber)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/debug/stream_stats", methods=["GET"])
+def stream_stats():
+    """Connected clients, upstream events and fan-out of the live streams"""
+    return jsonify(stream_hub.stats())
+
+
+# -----------------------------------------------------------------------------
+# Event-Driven Scoring Worker (ENABLE_WORKER=1 or `python worker.py`)
+# Rescores patients whose health_data changed and writes predictions/{uid}/*
+# -----------------------------------------------------------------------------
+def health_predictions_for(models, readings):
+    """Batch health predictions, falling back to one-by-one if a reading is malformed"""
+    entries = [(uid, reading) for uid, reading in readings.items() if reading]
+    try:
+        return build_health_predictions(models, entries) if entries else []
+    except (TypeError, ValueError):
+        results = []
+        for entry in entries:
+            try:
+                results.extend(build_health_predictions(models, [entry]))
+            except (TypeError, ValueError) as e:
+                print(f"Skipping health prediction for {entry[0]}: {e}")
+        return results
+
+
+def score_changed_patients(uids):
+    """Health + trend inference for the changed patients, one multi-path write"""
+    models = model_registry.active
+    readings = fetch_current_readings(uids)
+    for uid, reading in readings.items():
+        window_cache.apply_reading(uid, reading)
+
+    updates = {}
+    if models.health_cluster_model is not None:
+        for result in health_predictions_for(models, readings):
+            updates[f"predictions/{result['patient_id']}/health"] = result
+    if trend_models_loaded(models):
+        results, _ = score_patients(models, [(uid, uid) for uid in readings])
+        for uid, result in results.items():
+            updates[f"predictions/{uid}/deterioration"] = result
+
+    if updates:
+        store.update(updates)
+    return len(updates)
+
+
+scoring_worker = ScoringWorker(
+    score_changed_patients,
+    debounce_seconds=float(os.getenv("WORKER_DEBOUNCE", 2)),
+    max_delay_seconds=float(os.getenv("WORKER_MAX_DELAY", 10)),
+    queue_size=int(os.getenv("WORKER_QUEUE", 1000)),
+    max_pending=int(os.getenv("WORKER_MAX_PENDING", 10000)),
+    threads=int(os.getenv("WORKER_THREADS", 2)),
+    batch_size=int(os.getenv("WORKER_BATCH", 32)),
+)
+
+
+@app.route("/debug/worker_stats", methods=["GET"])
+def worker_stats():
+    """Events, debouncing, queue depth and drops of the scoring worker"""
+    return jsonify(scoring_worker.stats())
+
+
+# -----------------------------------------------------------------------------
+# Watch Reading Ingestion (/send_data)
+# Readings are buffered per patient and written every INGEST_FLUSH_SECONDS as
+# one multi-path update of health_data/{uid}/current + history/{date}
+# -----------------------------------------------------------------------------
+MAX_INGEST_BATCH = int(os.getenv("MAX_INGEST_BATCH", 5000))
+
+# Accepted spellings -> canonical six-metric schema
+READING_FIELDS = {
+    "heartRate": "heartRate", "heart_rate": "heartRate",
+    "steps": "steps",
+    "calories": "calories",
+    "distance": "distance",
+    "sleepHours": "sleepHours", "sleep_hours": "sleepHours",
+    "workout": "workout", "workoutMinutes": "workout", "workout_minutes": "workout",
+}
+WATCH_METRICS = frozenset(READING_FIELDS.values())
+# Characters RTDB does not allow in keys
+INVALID_KEY_CHARS = set(".$#[]/")
+
+
+def normalize_reading(raw):
+    """
+    Raw watch/simulator reading -> (reading, date_key, timestamp_ms).
+    The reading keeps only the watch metrics it carries (workout as minutes)
+    plus timestamp and source; the ingest flush writes each field on its own
+    path, so metrics it lacks keep their stored values. Raises ValueError
+    for unusable input.
+    """
+    reading = {}
+    for field, metric in READING_FIELDS.items():
+        value = raw.get(field)
+        if value is None or value == "":
+            continue
+        if metric == "workout" and isinstance(value, (list, dict)):
+            value = get_workout_minutes({"workout": value})
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f"{field} must be a non-negative number")
+        reading[metric] = int(value) if value.is_integer() else value
+    if not reading:
+        raise ValueError("Reading has none of heartRate, steps, calories, distance, sleepHours, workout")
+
+    try:
+        timestamp = int(float(raw.get("timestamp") or time.time() * 1000))
+    except (TypeError, ValueError):
+        raise ValueError("timestamp must be milliseconds since the epoch")
+    date_key = raw.get("date") or datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(date_key, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError("date must be YYYY-MM-DD")
+
+    reading["timestamp"] = timestamp
+    reading["source"] = str(raw.get("source") or "api")
+    return reading, date_key, timestamp
+
+
+def has_all_metrics(reading):
+    return WATCH_METRICS.issubset(reading)
+
+
+def apply_ingested(currents, days):
+    """
+    Keep the mirror, cached windows and the scoring worker in step with what
+    the ingest buffer just wrote. A partial reading was merged into the
+    stored node, so those patients are re-read instead of patched.
+    """
+    if TIMESERIES_MIRROR and days:
+        timeseries_mirror.apply_days(days, complete=has_all_metrics)
+    for (uid, date_key), reading in days.items():
+        if has_all_metrics(reading):
+            window_cache.apply_reading(uid, reading, date_key)
+        else:
+            window_cache.mark_stale(uid, date_key)
+    for uid, reading in currents.items():
+        if has_all_metrics(reading):
+            window_cache.apply_reading(uid, reading)
+        else:
+            window_cache.mark_stale(uid)
+    if scoring_worker.running:
+        for uid in set(currents) | {uid for uid, _ in days}:
+            scoring_worker.notify(uid)
+
+
+ingest_buffer = IngestBuffer(
+    store.update,
+    flush_seconds=float(os.getenv("INGEST_FLUSH_SECONDS", 0.5)),
+    max_pending=int(os.getenv("INGEST_MAX_PENDING", 50000)),
+    on_flush=apply_ingested,
+)
+
+
+@app.route("/send_data", methods=["GET", "POST"])
+def send_data():
+    """
+    Ingest watch readings for one or many patients.
+
+    POST {"patient_id": ..., "heartRate": ..., ...}
+         {"readings": [{"patient_id": ..., ...}, ...]}  (or a bare list)
+    GET  /send_data?patient_id=...&heartRate=...&steps=...
+         With no metrics, a simulated reading is generated from
+         ?risk_level=low|moderate|high (what simulator.py calls).
+
+    Readings are buffered and written within INGEST_FLUSH_SECONDS.
+    """
+    try:
+        if request.method == "GET":
+            raw = request.args.to_dict()
+            if not any(field in raw for field in READING_FIELDS):
+                risk_level = raw.get("risk_level", "low")
+                if risk_level not in RISK_LEVELS:
+                    return jsonify({"error": f"risk_level must be one of {', '.join(RISK_LEVELS)}"}), 400
+                raw.update(simulated_reading(risk_level), source="simulator")
+            raw_readings = [raw]
+        else:
+            body = request.get_json(force=True)
+            raw_readings = body if isinstance(body, list) else body.get("readings", [body])
+        if not isinstance(raw_readings, list) or not raw_readings:
+            return jsonify({"error": "No readings"}), 400
+        if len(raw_readings) > MAX_INGEST_BATCH:
+            return jsonify({"error": f"At most {MAX_INGEST_BATCH} readings per request"}), 413
+
+        accepted = []
+        rejected = {}
+        buffer_full = False
+        for i, raw in enumerate(raw_readings):
+            if not isinstance(raw, dict):
+                rejected[i] = "Reading must be an object"
+                continue
+            patient_id = resolve_patient_id(str(raw.get("patient_id") or ""))
+            if not patient_id or INVALID_KEY_CHARS & set(patient_id):
+                rejected[i] = "Patient not found"
+                continue
+            try:
+                reading, date_key, timestamp = normalize_reading(raw)
+            except ValueError as e:
+                rejected[i] = str(e)
+                continue
+            if not ingest_buffer.add(patient_id, reading, date_key, timestamp):
+                buffer_full = True
+                rejected[i] = "Ingest buffer full"
+                continue
+            accepted.append((patient_id, reading))
+
+        if buffer_full and not accepted:
+            response = jsonify({"error": "Ingest buffer full, retry shortly", "rejected": len(rejected)})
+            response.headers["Retry-After"] = str(max(1, int(math.ceil(ingest_buffer.flush_seconds))))
+            return response, 503
+
+        body = {"status": "queued", "accepted": len(accepted), "rejected": rejected}
+        if len(raw_readings) == 1 and accepted:
+            body["patient_id"], body["reading"] = accepted[0]
+        return jsonify(body), 202 if accepted else 400
+
+    except Exception as e:
+        print(f"ERROR in send_data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/debug/ingest_stats", methods=["GET"])
+def ingest_stats():
+    """Ingest rate, flush latency and buffer depth of /send_data"""
+    return jsonify(ingest_buffer.stats())
+
+
+# -----------------------------------------------------------------------------
+# Server-Side Simulation (/start_simulation, /stop_simulation, /simulations)
+# Every simulated patient shares one timer wheel; readings go through the
+# ingest buffer exactly like real uploads
+# -----------------------------------------------------------------------------
+SIMULATION_INTERVAL = float(os.getenv("SIMULATION_INTERVAL", 5))
+
+
+def ingest_simulated(uids, rows):
+    """Buffer one tick's simulated readings (rows from risk_profiles.draw_readings)"""
+    timestamp = int(time.time() * 1000)
+    date_key = datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d")
+    for uid, row in zip(uids, rows):
+        reading = to_reading(row)
+        reading["timestamp"] = timestamp
+        reading["source"] = "simulator"
+        ingest_buffer.add(uid, reading, date_key, timestamp)
+
+
+simulation_engine = SimulationEngine(
+    ingest_simulated,
+    tick_seconds=float(os.getenv("SIMULATION_TICK", 0.1)),
+    max_patients=int(os.getenv("SIMULATION_MAX_PATIENTS", 100000)),
+    max_interval_seconds=float(os.getenv("SIMULATION_MAX_INTERVAL", 86400)),
+)
+
+
+def simulation_targets(data):
+    """Resolved UIDs from "patient_id" or "patient_ids" -> ([uids], [not found])"""
+    patient_ids = data.get("patient_ids") or ([data["patient_id"]] if data.get("patient_id") else [])
+    uids, missing = [], []
+    for patient_id_input in patient_ids:
+        uid = resolve_patient_id(str(patient_id_input))
+        if uid and not INVALID_KEY_CHARS & set(uid):
+            uids.append(uid)
+        else:
+            missing.append(patient_id_input)
+    return uids, missing
+
+
+@app.route("/start_simulation", methods=["POST"])
+def start_simulation():
+    """
+    Start simulated watch readings for one or many patients.
+    {"patient_id" | "patient_ids": [...], "risk_level": "low|moderate|high", "interval_seconds": 5}
+    Starting an already simulated patient updates its risk level / interval.
+    Patients refused because the engine is full are listed in "rejected"
+    (503 when none could be started).
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        uids, missing = simulation_targets(data)
+        if not uids:
+            return jsonify({"error": "Patient not found", "not_found": missing}), 404
+        risk_level = data.get("risk_level", "low")
+        interval_seconds = float(data.get("interval_seconds", SIMULATION_INTERVAL))
+        started, rejected, error = [], [], None
+        for uid in uids:
+            try:
+                simulation_engine.start_patient(uid, risk_level, interval_seconds)
+                started.append(uid)
+            except OverflowError as e:
+                rejected.append(uid)
+                error = str(e)
+        if not started:
+            return jsonify({"error": error, "rejected": rejected, "not_found": missing}), 503
+        print(f"Simulation started for {len(started)} patients (risk {risk_level}, every {interval_seconds}s)")
+        return jsonify({
+            "status": "started",
+            "patient_ids": started,
+            "rejected": rejected,
+            "not_found": missing,
+            "risk_level": risk_level,
+            "interval_seconds": interval_seconds,
+            "simulated_patients": len(simulation_engine.patients()),
+        })
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/stop_simulation", methods=["POST"])
+def stop_simulation():
+    """Stop simulating {"patient_id"} / {"patient_ids": [...]}, or everyone with {"all": true}"""
+    data = request.get_json(force=True) or {}
+    if data.get("all"):
+        return jsonify({"status": "stopped", "stopped": simulation_engine.stop_all()})
+    uids, missing = simulation_targets(data)
+    stopped = [uid for uid in uids if simulation_engine.stop_patient(uid)]
+    if not stopped:
+        return jsonify({"error": "No simulation running for these patients", "not_found": missing}), 404
+    return jsonify({"status": "stopped", "patient_ids": stopped})
+
+
+@app.route("/simulations", methods=["GET"])
+def list_simulations():
+    """Simulated patients with their risk level / interval, plus engine stats"""
+    return jsonify({"patients": simulation_engine.patients(), "engine": simulation_engine.stats()})
+
+
+# Start background work only once every handler above is defined
+ingest_buffer.start()
+# Write whatever is still buffered on shutdown
+atexit.register(ingest_buffer.stop)
+if TIMESERIES_MIRROR:
+    # Catch-up runs in the background (reads stay on the store until it is done), so
+    # /healthz answers right away. Fed by the ingest flush and TIMESERIES_RESYNC_SECONDS
+    # sweeps; TIMESERIES_MIRROR_LISTEN=1 also follows the health_data root, at the
+    # cost of downloading the whole tree on each connect
+    timeseries_mirror.start(listen=os.getenv("TIMESERIES_MIRROR_LISTEN", "0") == "1")
+if os.getenv("ENABLE_SCHEDULER", "0") == "1":
+    # Opt-in: a health_data root listener downloads every patient's full
+    # history on each (re)connect, so by default the scheduler sweeps instead
+    if os.getenv("SCHEDULER_LISTEN", "0") == "1":
+        deterioration_scheduler.listen_for_changes()
+    deterioration_scheduler.start()
+if os.getenv("ENABLE_WORKER", "0") == "1":
+    # Fed by the ingest flush; WORKER_LISTEN=1 also follows the health_data root
+    # (catches direct Firebase writes, but downloads the whole tree on each connect)
+    scoring_worker.start(listen=os.getenv("WORKER_LISTEN", "0") == "1")
+
+
 # -----------------------------------------------------------------------------
 # Run Flask
 # -----------------------------------------------------------------------------
@@ -838,4 +1615,11 @@ if __name__ == "__main__":
     print("Models: Health Risk State (Supervised) + Anomaly Detection (Unsupervised)")
     print("=" * 60)
 
+    if TREND_STATE_FILE:
+        # Snapshot the window cache + trend states on shutdown (SIGTERM too)
+        import signal
+        import sys
+        atexit.register(window_cache.save, TREND_STATE_FILE)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     app.run(debug=True, host="0.0.0.0", port=5000, use_reloader=False)
@@ -0,0 +1,83 @@
+"""
+Benchmark: flattened NumPy Isolation Forest vs the sklearn path
+================================================================
+Checks that CompiledIsolationForest reproduces sklearn's decision_function
+and predict for the anomaly model and the trend detector, then times both
+paths at 1, 100 and 10,000 rows.
+
+Run from the backend folder:  python benchmark_iforest.py
+"""
+
+import time
+import warnings
+
+import numpy as np
+
+from model_registry import load_model_version
+
+warnings.filterwarnings('ignore')
+
+ROW_COUNTS = [1, 100, 10000]
+SCORE_TOLERANCE = 1e-9
+
+
+def time_call(fn, min_seconds=0.5):
+    """Average seconds per call, repeating until min_seconds has elapsed"""
+    fn()  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def sample_rows(scaler, n_rows, rng):
+    """Rows drawn around the training distribution the scaler was fit on"""
+    noise = rng.normal(0, 1.5, size=(n_rows, len(scaler.mean_)))
+    return scaler.mean_ + noise * scaler.scale_
+
+
+def benchmark(name, forest, scaler, kernel, rng):
+    print("\n" + "=" * 60)
+    print(f"{name} ({len(forest.estimators_)} trees, {forest.n_features_in_} features)")
+    print("=" * 60)
+
+    def sklearn_path(X):
+        X_scaled = scaler.transform(X)
+        return forest.decision_function(X_scaled), forest.predict(X_scaled)
+
+    for n_rows in ROW_COUNTS:
+        X = sample_rows(scaler, n_rows, rng)
+
+        expected_scores, expected_labels = sklearn_path(X)
+        scores, labels = kernel.score(X)
+        max_diff = float(np.max(np.abs(scores - expected_scores)))
+        assert max_diff < SCORE_TOLERANCE, f"score mismatch {max_diff}"
+        assert np.array_equal(labels, expected_labels), "label mismatch"
+
+        sk_time = time_call(lambda: sklearn_path(X))
+        fast_time = time_call(lambda: kernel.score(X))
+        print(f"  {n_rows:>6} rows | sklearn {sk_time * 1e3:9.3f} ms | "
+              f"compiled {fast_time * 1e3:9.3f} ms | speedup {sk_time / fast_time:6.1f}x | "
+              f"max |diff| {max_diff:.1e}")
+
+
+def main():
+    models = load_model_version(".")
+    rng = np.random.default_rng(42)
+
+    if models.anomaly_model is not None:
+        benchmark("Anomaly model", models.anomaly_model, models.health_scaler,
+                  models.kernels["anomaly_forest"], rng)
+    if models.trend_detector is not None:
+        benchmark("Trend detector", models.trend_detector, models.trend_detector_scaler,
+                  models.kernels["trend_forest"], rng)
+
+    print("\nAll compiled scores and labels match sklearn.")
+
+
+if __name__ == "__main__":
+    main()
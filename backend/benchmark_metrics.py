@@ -0,0 +1,106 @@
+"""
+Benchmark: cost of the /metrics instrumentation
+===============================================
+1. One span on its own (enter + exit + histogram observe), next to an
+   empty `with` block and the METRICS_ENABLED=0 no-op span.
+2. The instrumented endpoints on a synthetic population (same data as
+   benchmark_serving.py), first with metrics on and then with them off.
+   Calls alternate between the two settings, so drift in the machine
+   hits both equally.
+
+Run from the backend folder:
+    python benchmark_metrics.py
+    python benchmark_metrics.py --patients 10000 --calls 3000
+"""
+
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+
+# Sets up the offline memory store and imports app quietly
+import benchmark_serving
+import metrics
+
+app = benchmark_serving.app
+SPAN_CALLS = 200000
+
+
+def time_spans(make_span, calls=SPAN_CALLS):
+    """Mean nanoseconds per `with make_span():` block"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        with make_span():
+            pass
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def bench_spans():
+    print(f"Span overhead ({SPAN_CALLS} spans each, inside a request)")
+    print("-" * 60)
+    metrics.begin_request("bench")
+    baseline = time_spans(lambda: contextlib.nullcontext())
+    metrics.enabled = True
+    stage = time_spans(lambda: metrics.span("bench"))
+    model = time_spans(lambda: metrics.model_span("bench_model", "predict", rows=1))
+    metrics.enabled = False
+    disabled = time_spans(lambda: metrics.span("bench"))
+    metrics.enabled = True
+    metrics.end_request("GET", 200)
+    print(f"  {'empty with block':<26} {baseline:>8.0f} ns")
+    print(f"  {'span (enabled)':<26} {stage:>8.0f} ns  ({stage - baseline:+.0f} ns)")
+    print(f"  {'model_span + row count':<26} {model:>8.0f} ns  ({model - baseline:+.0f} ns)")
+    print(f"  {'span (METRICS_ENABLED=0)':<26} {disabled:>8.0f} ns  ({disabled - baseline:+.0f} ns)")
+
+
+def bench_endpoints(n_patients, calls, rng):
+    client = app.app.test_client()
+
+    def simple_id():
+        return f"P{int(rng.integers(1, n_patients + 1))}"
+
+    cases = [
+        ("predict_health", lambda: client.post("/predict_health", json={"patient_id": simple_id()})),
+        ("detect_deterioration", lambda: client.post("/detect_deterioration", json={"patient_id": simple_id()})),
+        ("get_all_patients_page",
+         lambda: client.get("/get_all_patients", query_string={"limit": 50, "after": simple_id()})),
+    ]
+    print(f"\nEndpoints, {n_patients} patients, {calls} calls per setting (result cache cleared per call)")
+    print("-" * 88)
+    for name, call in cases:
+        latencies = {True: [], False: []}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(benchmark_serving.WARMUP_CALLS):
+                call()
+            for i in range(2 * calls):
+                metrics.enabled = i % 2 == 0
+                app.result_cache.clear()
+                start = time.perf_counter()
+                response = call()
+                latencies[metrics.enabled].append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name}: {response.status_code}")
+        metrics.enabled = True
+        on = np.percentile(np.array(latencies[True]) * 1000, [50, 95])
+        off = np.percentile(np.array(latencies[False]) * 1000, [50, 95])
+        print(f"  {name:<24} on p50 {on[0]:7.3f} ms p95 {on[1]:7.3f} ms | off p50 {off[0]:7.3f} ms "
+              f"p95 {off[1]:7.3f} ms | p50 {(on[0] / off[0] - 1) * 100:+5.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of per-stage latency metrics")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=2000, help="timed calls per endpoint and setting")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    bench_spans()
+    rng = np.random.default_rng(args.seed)
+    benchmark_serving.load_population(args.patients, rng)
+    bench_endpoints(args.patients, args.calls, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Benchmark: serving path on synthetic patient populations
+========================================================
+Runs offline (STORAGE_BACKEND=memory, no Firebase) against populations of
+100, 10,000 and 100,000 synthetic patients. Each patient has a mapping
+(P1..PN), patient_info, HISTORY_DAYS of history drawn from the
+low/moderate/high risk profiles, and a current reading.
+
+For every population it times, patients picked at random:
+
+- calculate_trend_features    one (7, 6) window
+- resolve_patient_id          simple ID -> UID
+- predict_health              POST, latest reading from the window cache,
+                              result cache cleared before every call (MISS)
+- predict_health_hit          POST, the same patient again (result cache HIT)
+- detect_deterioration        POST, trend window from the window cache (MISS)
+- detect_deterioration_hit    POST, the same patient again (result cache HIT)
+- get_all_patients            GET, full list
+- get_all_patients_page       GET ?limit=50&after=<random>
+- get_all_patients_304        GET with If-None-Match of the full list
+
+and reports latency percentiles, single-thread throughput and the peak
+Python allocation per call (tracemalloc, in a separate short pass so the
+tracing does not skew latencies). Results go to a JSON file tagged with
+the git commit, and --compare prints the change against an earlier run.
+
+Run from the backend folder:
+    python benchmark_serving.py
+    python benchmark_serving.py --populations 100,10000 --seconds 1
+    python benchmark_serving.py --compare benchmark_results/serving-<old commit>.json
+"""
+
+import os
+
+# Local stand-in store and no background work before app is imported
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.pop("STORAGE_SEED_JSON", None)
+os.environ.pop("TIMESERIES_DB", None)
+os.environ["ENABLE_SCHEDULER"] = "0"
+os.environ["ENABLE_WORKER"] = "0"
+
+import argparse
+import contextlib
+import json
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+import warnings
+from datetime import date, timedelta
+
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    import app
+from risk_profiles import RISK_LEVELS, draw_readings, to_reading
+from trend_features import calculate_trend_features
+from window_cache import WindowCache
+
+POPULATIONS = [100, 10000, 100000]
+WARMUP_CALLS = 20
+MIN_CALLS = 5
+MEMORY_CALLS = 50
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Synthetic population
+# -----------------------------------------------------------------------------
+def build_population(n_patients, history_days, rng):
+    """RTDB-shaped tree for n_patients, readings drawn in one vectorized call"""
+    levels = rng.integers(0, len(RISK_LEVELS), n_patients)
+    rows = draw_readings(np.repeat(levels, history_days + 1), rng)
+    today = date(2026, 10, 1)
+    dates = [(today - timedelta(days=history_days - d)).isoformat() for d in range(history_days)]
+
+    health_data, mappings, patient_info = {}, {}, {}
+    for p in range(n_patients):
+        uid = f"bench-uid-{p:06d}"
+        simple_id = f"P{p + 1}"
+        block = rows[p * (history_days + 1):(p + 1) * (history_days + 1)]
+        health_data[uid] = {
+            "history": {date_key: to_reading(row) for date_key, row in zip(dates, block)},
+            "current": to_reading(block[-1]),
+        }
+        mappings[simple_id] = uid
+        patient_info[simple_id] = {"name": f"Patient {p + 1}", "email": f"p{p + 1}@bench.local", "uid": uid}
+    return {"health_data": health_data, "patient_mappings": mappings, "patient_info": patient_info}
+
+
+def load_population(n_patients, rng):
+    """Replace the store contents and reset every cache; returns the store's traced MB"""
+    tree = build_population(n_patients, app.HISTORY_DAYS, rng)
+    tracemalloc.start()
+    app.store.set("/", tree)
+    del tree
+    population_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Fresh caches, same settings as the app
+    app.window_cache = WindowCache(
+        app.reading_to_row, max_bytes=app.window_cache.max_bytes, ttl_seconds=app.window_cache.ttl_seconds,
+        days=app.window_cache.days, trend_days=app.TREND_WINDOW_DAYS,
+    )
+    app.result_cache.clear()
+    deadline = time.time() + 60
+    while len(app.patient_id_cache.mappings()) < n_patients and time.time() < deadline:
+        time.sleep(0.05)
+    return population_bytes / 1e6
+
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+def measure(call, make_args, seconds, max_calls):
+    """Latency percentiles + throughput of call(*make_args()), then peak allocation"""
+    start = time.perf_counter()
+    for _ in range(WARMUP_CALLS):
+        call(*make_args())
+        if time.perf_counter() - start > seconds / 4:
+            break
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_calls and (time.perf_counter() - start < seconds or len(latencies) < MIN_CALLS):
+        args = make_args()
+        call_start = time.perf_counter()
+        call(*args)
+        latencies.append(time.perf_counter() - call_start)
+    latencies = np.array(latencies) * 1000
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(MEMORY_CALLS, len(latencies))):
+        args = make_args()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "calls": len(latencies),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(latencies.max()), 4),
+        "throughput_per_s": round(len(latencies) / (latencies.sum() / 1000), 1),
+        "peak_alloc_kb": round(float(np.max(peaks)) / 1024, 1) if peaks else None,
+    }
+
+
+def checked(response, result_cache=None):
+    """Raise on errors, or when X-Result-Cache is not the path the case is meant to time"""
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)[:200]}")
+    if result_cache and response.headers.get("X-Result-Cache") != result_cache:
+        raise RuntimeError(f"expected result cache {result_cache}, got {response.headers.get('X-Result-Cache')}")
+    return response
+
+
+def bench_population(n_patients, seconds, max_calls, rng):
+    client = app.app.test_client()
+
+    def simple_id():
+        return f"P{int(rng.integers(1, n_patients + 1))}"
+
+    def uncached_id():
+        # Cleared outside the timed call, so every call pays for inference
+        app.result_cache.clear()
+        return (simple_id(),)
+
+    hot_id = simple_id()
+
+    list_etag = client.get("/get_all_patients").headers["ETag"]
+
+    def window():
+        return (rng.standard_normal((app.TREND_WINDOW_DAYS, 6)) * [8, 2000, 60, 1.5, 0.8, 15]
+                + [75, 6000, 300, 4, 7, 25],)
+
+    cases = [
+        ("calculate_trend_features", calculate_trend_features, window),
+        ("resolve_patient_id", app.resolve_patient_id, lambda: (simple_id(),)),
+        ("predict_health",
+         lambda patient_id: checked(client.post("/predict_health", json={"patient_id": patient_id}), "MISS"),
+         uncached_id),
+        ("predict_health_hit",
+         lambda patient_id: checked(client.post("/predict_health", json={"patient_id": patient_id})),
+         lambda: (hot_id,)),
+        ("detect_deterioration",
+         lambda patient_id: checked(client.post("/detect_deterioration", json={"patient_id": patient_id}),
+                                    "MISS"),
+         uncached_id),
+        ("detect_deterioration_hit",
+         lambda patient_id: checked(client.post("/detect_deterioration", json={"patient_id": patient_id})),
+         lambda: (hot_id,)),
+        ("get_all_patients", lambda: checked(client.get("/get_all_patients")), lambda: ()),
+        ("get_all_patients_page",
+         lambda after: checked(client.get("/get_all_patients", query_string={"limit": 50, "after": after})),
+         lambda: (simple_id(),)),
+        ("get_all_patients_304",
+         lambda etag: checked(client.get("/get_all_patients", headers={"If-None-Match": etag})),
+         lambda: (list_etag,)),
+    ]
+    results = {}
+    for name, call, make_args in cases:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results[name] = measure(call, make_args, seconds, max_calls)
+        summary = results[name]
+        print(f"  {name:<26} {summary['calls']:>6} calls | p50 {summary['p50_ms']:>9.3f} ms | "
+              f"p95 {summary['p95_ms']:>9.3f} ms | p99 {summary['p99_ms']:>9.3f} ms | "
+              f"{summary['throughput_per_s']:>9.1f}/s | peak {summary['peak_alloc_kb']:>9.1f} KB")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} (commit {baseline.get('commit')}): new p50 / old p50, new p95 / old p95")
+    for population, run in results["populations"].items():
+        old_endpoints = baseline["populations"].get(population, {}).get("endpoints", {})
+        for name, summary in run["endpoints"].items():
+            old = old_endpoints.get(name)
+            if old:
+                print(f"  {population:>7} {name:<26} p50 x{summary['p50_ms'] / old['p50_ms']:6.2f}   "
+                      f"p95 x{summary['p95_ms'] / old['p95_ms']:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serving-path benchmark on synthetic populations")
+    parser.add_argument("--populations", default=",".join(str(n) for n in POPULATIONS),
+                        help="comma-separated patient counts")
+    parser.add_argument("--seconds", type=float, default=2.0, help="time budget per endpoint")
+    parser.add_argument("--calls", type=int, default=5000, help="max timed calls per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="results file (default benchmark_results/serving-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "model_version": app.model_registry.active.version,
+        "seconds_per_endpoint": args.seconds,
+        "populations": {},
+    }
+    for n_patients in [int(n) for n in args.populations.split(",")]:
+        rng = np.random.default_rng(args.seed)
+        load_start = time.perf_counter()
+        population_mb = load_population(n_patients, rng)
+        print(f"\n{n_patients} patients ({population_mb:.1f} MB traced, "
+              f"loaded in {time.perf_counter() - load_start:.1f}s)")
+        print("-" * 118)
+        results["populations"][str(n_patients)] = {
+            "population_mb": round(population_mb, 1),
+            "endpoints": bench_population(n_patients, args.seconds, args.calls, rng),
+        }
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    out = args.out or os.path.join("benchmark_results", f"serving-{commit or 'local'}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out} (max RSS {results['max_rss_mb']} MB)")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
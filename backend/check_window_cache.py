@@ -0,0 +1,152 @@
+"""
+Check: WindowCache loads and refreshes, with and without the time-series store
+==============================================================================
+Runs offline (STORAGE_BACKEND=memory). For both history sources - the
+primary store's health_data JSON and a TimeseriesStore mirror - it loads a
+patient, writes a newer history day and current reading, forces a refresh
+(ttl 0) and checks that the cached trend window matches the store.
+
+It then hammers one entry from writer threads (new days, new current
+readings, refreshes) while reader threads take trend rows and features,
+and checks that nothing raised, that every trend_snapshot() is
+self-consistent and that the rolling trend state still matches the
+cached rows.
+
+Run from the backend folder:  python check_window_cache.py
+"""
+
+import os
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.pop("STORAGE_SEED_JSON", None)
+
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from datastore import store
+from timeseries_store import TimeseriesMirror, TimeseriesStore
+from trend_features import calculate_trend_features
+from window_cache import WindowCache
+
+FIELDS = ["heartRate", "steps", "calories", "distance", "sleepHours", "workout"]
+UID = "check-uid"
+
+
+def to_row(reading):
+    return [float(reading.get(field, 0)) for field in FIELDS]
+
+
+def reading(day):
+    return {"heartRate": 70 + day, "steps": 5000 + 100 * day, "calories": 200, "distance": 3.0,
+            "sleepHours": 7.0, "workout": day}
+
+
+def expected_rows(history_days):
+    history = store.get(f"health_data/{UID}/history") or {}
+    rows = [to_row(history[date_key]) for date_key in sorted(history)][-history_days:]
+    rows.append(to_row(store.get(f"health_data/{UID}/current")))
+    return np.array(rows, dtype=np.float32)
+
+
+def check(timeseries):
+    label = "timeseries" if timeseries is not None else "store JSON"
+    mirror = TimeseriesMirror(timeseries, to_row) if timeseries is not None else None
+    store.set(f"health_data/{UID}", {
+        "history": {f"2026-10-0{day}": reading(day) for day in range(1, 6)},
+        "current": reading(6),
+    })
+    if mirror:
+        mirror.sync_patient(UID, full=True)
+
+    cache = WindowCache(to_row, ttl_seconds=0, days=30, trend_days=7, timeseries=timeseries)
+    assert np.array_equal(cache.trend_rows(UID, 6), expected_rows(6)), f"{label}: load"
+
+    # A new day and a new current reading arrive, then the entry goes stale
+    store.update({"history/2026-10-06": reading(6), "current": reading(7)}, f"health_data/{UID}")
+    if mirror:
+        mirror.sync_patient(UID, latest="2026-10-05")
+    window = cache.get(UID)
+    assert cache.refreshes == 1, f"{label}: expected a refresh, got {cache.stats()}"
+    assert window.dates[-1] == "2026-10-06", f"{label}: refresh missed the new day"
+    assert np.array_equal(window.trend_rows(6), expected_rows(6)), f"{label}: refresh"
+    assert np.allclose(window.trend_features(), calculate_trend_features(expected_rows(6)),
+                       rtol=1e-4, atol=1e-3), f"{label}: rolling trend state"
+    print(f"  {label:<12} load + refresh OK ({len(window.dates)} days cached)")
+
+
+def check_concurrent(seconds=2.0):
+    store.set(f"health_data/{UID}", {
+        "history": {f"2026-09-{day:02d}": reading(day) for day in range(1, 8)},
+        "current": reading(8),
+    })
+    cache = WindowCache(to_row, ttl_seconds=0.01, days=30, trend_days=7)
+    window = cache.get(UID)
+    stop = threading.Event()
+    errors = []
+
+    def run(fn):
+        def loop():
+            i = 0
+            while not stop.is_set():
+                try:
+                    fn(i)
+                except Exception as e:
+                    errors.append(repr(e))
+                    stop.set()
+                i += 1
+        return threading.Thread(target=loop)
+
+    def new_day(i):
+        # Day keys past the store's, so refreshes never rewrite them
+        cache.apply_reading(UID, reading(i % 40), date_key=f"2026-10-{i // 28 % 28 + 1:02d}-{i % 28:02d}")
+
+    def new_current(i):
+        cache.apply_reading(UID, reading(i % 50))
+
+    def read(i):
+        with window.lock:
+            rows = window.trend_rows(6)
+            trend_rows = window.trend.window()
+        assert np.array_equal(rows, trend_rows), "trend state and cached rows disagree"
+        # What /detect_deterioration fingerprints and scores must be the same readings
+        rows, features = window.trend_snapshot(6, pad_to=7)
+        padded = np.concatenate([np.repeat(rows[:1], 7 - len(rows), axis=0), rows])
+        assert np.allclose(features, calculate_trend_features(padded), rtol=1e-4, atol=1e-3), \
+            "snapshot features do not match snapshot rows"
+
+    threads = [run(new_day), run(new_current), run(lambda i: cache.get(UID)), run(read), run(read)]
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    try:
+        for thread in threads:
+            thread.start()
+        stop.wait(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert not errors, f"concurrent access raised: {errors[:3]}"
+    assert np.array_equal(window.trend.window(), window.trend_rows(6)), \
+        "rolling trend rows differ from the cached rows"
+    assert np.allclose(window.trend_features(), calculate_trend_features(window.trend_rows(6)),
+                       rtol=1e-4, atol=1e-3), "rolling trend state drifted from the cached rows"
+    print(f"  concurrent   writers + readers OK ({len(window.dates)} days cached)")
+
+
+def main():
+    print("WindowCache load/refresh")
+    print("=" * 40)
+    check(None)
+    with tempfile.TemporaryDirectory() as tmp:
+        timeseries = TimeseriesStore(os.path.join(tmp, "timeseries.db"))
+        check(timeseries)
+    check_concurrent()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+# backend/datastore.py
+"""
+Data Store Access
+=================
+Every database read/write in the backend goes through `store`, so that
+the time of the last successful database contact is known without ever
+probing the database (used by /readyz), and so the backend can run
+against a local database for benchmarks and offline load tests.
+
+STORAGE_BACKEND selects the implementation (same tree semantics for all):
+
+    firebase  Firebase Realtime Database (default, production)
+    memory    nested dicts in this process
+    sqlite    one SQLite file, STORAGE_SQLITE_PATH (default local_store.db)
+
+STORAGE_SEED_JSON optionally loads an RTDB JSON export into a local store.
+
+Interface: get / get_last / get_since / query_equal (reads),
+set / update / delete / transaction (writes), listen (change events).
+"""
+
+import copy
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from firebase_admin import db
+
+import metrics
+
+
+class StoreBase(object):
+    """Contact tracking shared by every backend"""
+
+    name = None
+
+    def __init__(self):
+        self.last_success = None
+        self.last_error = None
+        self.last_error_at = None
+        self.operations = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+    def _call(self, op, fn, *args, **kwargs):
+        """Run one database operation, recording success/failure time and its latency"""
+        try:
+            with metrics.span(f"store_{op}"):
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+                self.last_error = str(e)
+                self.last_error_at = time.time()
+            raise
+        with self._stats_lock:
+            self.operations += 1
+            self.last_success = time.time()
+        return result
+
+    def _contact(self):
+        with self._stats_lock:
+            self.last_success = time.time()
+
+    def status(self):
+        now = time.time()
+        return {
+            "backend": self.name,
+            "last_success_age_seconds": round(now - self.last_success, 3) if self.last_success else None,
+            "last_error": self.last_error,
+            "last_error_age_seconds": round(now - self.last_error_at, 3) if self.last_error_at else None,
+            "operations": self.operations,
+            "errors": self.errors,
+        }
+
+    def healthy(self):
+        """False only when the most recent database contact failed"""
+        if self.last_error_at is None:
+            return True
+        return self.last_success is not None and self.last_success >= self.last_error_at
+
+
+class FirebaseStore(StoreBase):
+    """Firebase Realtime Database access with contact tracking"""
+
+    name = "firebase"
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def get(self, path, shallow=False):
+        return self._call("get", db.reference(path).get, shallow=shallow)
+
+    def get_last(self, path, n):
+        """Last n children of path by key (date keys sort chronologically)"""
+        if n <= 0:
+            return None
+        return self._call("get_last", db.reference(path).order_by_key().limit_to_last(n).get)
+
+    def get_since(self, path, start_key):
+        """Children of path with key >= start_key"""
+        return self._call("get_since", db.reference(path).order_by_key().start_at(start_key).get)
+
+    def query_equal(self, path, child, value):
+        """Children of path whose `child` field equals value (server-side)"""
+        return self._call("query_equal", db.reference(path).order_by_child(child).equal_to(value).get)
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def set(self, path, value):
+        return self._call("set", db.reference(path).set, value)
+
+    def update(self, updates, path="/"):
+        """Multi-path update: {relative/path: value} applied atomically"""
+        return self._call("update", db.reference(path).update, updates)
+
+    def delete(self, path):
+        return self._call("delete", db.reference(path).delete)
+
+    def transaction(self, path, update_fn):
+        return self._call("transaction", db.reference(path).transaction, update_fn)
+
+    # -------------------------------------------------------------------------
+    # Change notifications
+    # -------------------------------------------------------------------------
+    def listen(self, path, callback):
+        """Stream put/patch events for path; returns a registration with close()"""
+        def on_event(event):
+            self._contact()
+            callback(event)
+        return self._call("listen", db.reference(path).listen, on_event)
+
+
+# -----------------------------------------------------------------------------
+# Local backends - RTDB tree semantics on this machine
+# -----------------------------------------------------------------------------
+def split_path(path):
+    return [part for part in str(path).split("/") if part]
+
+
+def join_path(parts):
+    return "/".join(parts)
+
+
+def rtdb_key_order(key):
+    """RTDB order_by_key: integer-like keys first (numerically), then strings"""
+    if key.isdigit() and (key == "0" or not key.startswith("0")) and len(key) < 19:
+        return (0, int(key), "")
+    return (1, 0, key)
+
+
+def prune(value):
+    """Drop None values and empty objects, as RTDB never stores them"""
+    if isinstance(value, list):
+        value = {str(i): item for i, item in enumerate(value)}
+    if isinstance(value, dict):
+        pruned = {}
+        for key, child in value.items():
+            child = prune(child)
+            if child is not None:
+                pruned[str(key)] = child
+        return pruned or None
+    return value
+
+
+class LocalEvent(object):
+    """Same fields as firebase_admin.db.Event"""
+
+    __slots__ = ("event_type", "path", "data")
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class LocalRegistration(object):
+    def __init__(self, store, listener_id):
+        self._store = store
+        self._listener_id = listener_id
+
+    def close(self):
+        self._store._remove_listener(self._listener_id)
+
+
+class LocalTreeStore(StoreBase):
+    """
+    Shared logic of the local backends. Subclasses provide _read(parts),
+    _write(parts, value) and _child_keys(parts); ordered queries, multi-path
+    updates, transactions and listeners are built on those three.
+    """
+
+    def __init__(self):
+        super(LocalTreeStore, self).__init__()
+        self._lock = threading.RLock()
+        self._listeners = {}
+        self._next_listener_id = 0
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def get(self, path, shallow=False):
+        def read():
+            with self._lock:
+                value = self._read(split_path(path))
+            if shallow and isinstance(value, dict):
+                return {key: (True if isinstance(child, dict) else child) for key, child in value.items()}
+            return value
+        return self._call("get", read)
+
+    def _children(self, path, select):
+        parts = split_path(path)
+        with self._lock:
+            keys = select(sorted(self._child_keys(parts), key=rtdb_key_order))
+            if not keys:
+                return None
+            return {key: self._read(parts + [key]) for key in keys}
+
+    def get_last(self, path, n):
+        """Last n children of path by key (date keys sort chronologically)"""
+        if n <= 0:
+            return None
+        return self._call("get_last", self._children, path, lambda keys: keys[-n:])
+
+    def get_since(self, path, start_key):
+        """Children of path with key >= start_key"""
+        start = rtdb_key_order(start_key)
+        return self._call("get_since", self._children, path,
+                          lambda keys: [key for key in keys if rtdb_key_order(key) >= start])
+
+    def query_equal(self, path, child, value):
+        """Children of path whose `child` field equals value"""
+        def query():
+            with self._lock:
+                node = self._read(split_path(path)) or {}
+            matches = {key: data for key, data in node.items()
+                       if isinstance(data, dict) and data.get(child) == value}
+            return matches or None
+        return self._call("query_equal", query)
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def set(self, path, value):
+        def write():
+            with self._lock:
+                self._write(split_path(path), prune(copy.deepcopy(value)))
+                self._notify([path])
+        return self._call("set", write)
+
+    def update(self, updates, path="/"):
+        """Multi-path update: {relative/path: value} applied atomically"""
+        base = split_path(path)
+        def write():
+            with self._lock:
+                changed = []
+                for relative, value in updates.items():
+                    parts = base + split_path(relative)
+                    self._write(parts, prune(copy.deepcopy(value)))
+                    changed.append(join_path(parts))
+                self._notify(changed)
+        return self._call("update", write)
+
+    def delete(self, path):
+        return self.set(path, None)
+
+    def transaction(self, path, update_fn):
+        parts = split_path(path)
+        def run():
+            with self._lock:
+                value = prune(copy.deepcopy(update_fn(self._read(parts))))
+                self._write(parts, value)
+                self._notify([path])
+            return copy.deepcopy(value)
+        return self._call("transaction", run)
+
+    # -------------------------------------------------------------------------
+    # Change notifications (delivered on one dispatcher thread, like Firebase)
+    # -------------------------------------------------------------------------
+    def listen(self, path, callback):
+        """Initial `put` of the current value, then a `put` per change at/under path"""
+        def register():
+            with self._lock:
+                self._next_listener_id += 1
+                listener_id = self._next_listener_id
+                self._listeners[listener_id] = (split_path(path), callback)
+                self._events.put((listener_id, LocalEvent("put", "/", self._read(split_path(path)))))
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch, name=f"{self.name}-listeners",
+                                                        daemon=True)
+                    self._dispatcher.start()
+            return LocalRegistration(self, listener_id)
+        return self._call("listen", register)
+
+    def _remove_listener(self, listener_id):
+        with self._lock:
+            self._listeners.pop(listener_id, None)
+
+    def _notify(self, changed_paths):
+        """Queue events for listeners at, above or below each written path (lock held)"""
+        if not self._listeners:
+            return
+        for changed in changed_paths:
+            changed_parts = split_path(changed)
+            for listener_id, (listen_parts, _) in self._listeners.items():
+                depth = len(listen_parts)
+                if changed_parts[:depth] == listen_parts:
+                    event = LocalEvent("put", "/" + join_path(changed_parts[depth:]), self._read(changed_parts))
+                elif listen_parts[:len(changed_parts)] == changed_parts:
+                    event = LocalEvent("put", "/", self._read(listen_parts))
+                else:
+                    continue
+                self._events.put((listener_id, event))
+
+    def _dispatch(self):
+        while True:
+            listener_id, event = self._events.get()
+            listener = self._listeners.get(listener_id)
+            if listener is None:
+                continue
+            try:
+                listener[1](event)
+            except Exception as e:
+                print(f"ERROR in {self.name} store listener: {e}")
+
+    def load_json(self, path):
+        """Replace the whole tree with an RTDB JSON export"""
+        with open(path) as f:
+            self.set("/", json.load(f))
+        print(f"{self.name} store: loaded {path}")
+
+
+class MemoryStore(LocalTreeStore):
+    """The whole tree as nested dicts in this process"""
+
+    name = "memory"
+
+    def __init__(self, data=None):
+        super(MemoryStore, self).__init__()
+        self._root = prune(copy.deepcopy(data)) or {}
+
+    def _node(self, parts):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _read(self, parts):
+        return copy.deepcopy(self._node(parts))
+
+    def _child_keys(self, parts):
+        node = self._node(parts)
+        return list(node) if isinstance(node, dict) else []
+
+    def _write(self, parts, value):
+        if not parts:
+            self._root = value if isinstance(value, dict) else {}
+            return
+        if value is None:
+            # Delete, then drop ancestors that became empty
+            trail = [self._root]
+            for part in parts[:-1]:
+                node = trail[-1].get(part)
+                if not isinstance(node, dict):
+                    return
+                trail.append(node)
+            trail[-1].pop(parts[-1], None)
+            for depth in range(len(parts) - 1, 0, -1):
+                if trail[depth]:
+                    break
+                trail[depth - 1].pop(parts[depth - 1], None)
+            return
+        node = self._root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[parts[-1]] = value
+
+
+class SqliteStore(LocalTreeStore):
+    """
+    The tree in one SQLite file: every leaf is a row keyed by its full path,
+    and a children table indexes each node's child keys for ordered queries.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path="local_store.db"):
+        super(SqliteStore, self).__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leaves (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS children ("
+            " parent TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (parent, key))"
+        )
+
+    @staticmethod
+    def _descendants(path):
+        """[low, high) bounds of every path below `path` ('/' sorts right before '0')"""
+        if not path:
+            return "", "\U0010ffff"
+        return path + "/", path + "0"
+
+    def _read(self, parts):
+        path = join_path(parts)
+        if path:
+            row = self._conn.execute("SELECT value FROM leaves WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+        low, high = self._descendants(path)
+        rows = self._conn.execute(
+            "SELECT path, value FROM leaves WHERE path >= ? AND path < ?", (low, high)
+        ).fetchall()
+        if not rows:
+            return None
+        tree = {}
+        for leaf_path, value in rows:
+            node = tree
+            leaf_parts = split_path(leaf_path[len(low):])
+            for part in leaf_parts[:-1]:
+                node = node.setdefault(part, {})
+            node[leaf_parts[-1]] = json.loads(value)
+        return tree
+
+    def _child_keys(self, parts):
+        rows = self._conn.execute("SELECT key FROM children WHERE parent = ?", (join_path(parts),))
+        return [row[0] for row in rows]
+
+    def _write(self, parts, value):
+        path = join_path(parts)
+        conn = self._conn
+        ancestors = [join_path(parts[:depth]) for depth in range(1, len(parts))]
+        if value is None and ancestors and conn.execute(
+                "SELECT 1 FROM leaves WHERE path IN (%s) LIMIT 1" % ",".join("?" * len(ancestors)),
+                ancestors).fetchone():
+            return  # nothing can exist below a leaf
+        conn.execute("BEGIN")
+        try:
+            # Remove the old subtree, and any leaf that an ancestor used to be
+            low, high = self._descendants(path)
+            conn.execute("DELETE FROM leaves WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+            conn.execute("DELETE FROM children WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                         (path, low, high))
+            for ancestor in ancestors:
+                conn.execute("DELETE FROM leaves WHERE path = ?", (ancestor,))
+
+            if value is None:
+                self._unlink(parts)
+            elif parts or isinstance(value, dict):
+                conn.executemany("INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)",
+                                 [(join_path(parts[:depth]), parts[depth]) for depth in range(len(parts))])
+                leaves, children = [], []
+                self._flatten(parts, value, leaves, children)
+                conn.executemany("INSERT INTO leaves (path, value) VALUES (?, ?)", leaves)
+                conn.executemany("INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)", children)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _flatten(self, parts, value, leaves, children):
+        if isinstance(value, dict):
+            parent = join_path(parts)
+            for key, child in value.items():
+                children.append((parent, key))
+                self._flatten(parts + [key], child, leaves, children)
+        else:
+            leaves.append((join_path(parts), json.dumps(value)))
+
+    def _unlink(self, parts):
+        """Remove a deleted node from its parent, and every ancestor left empty"""
+        for depth in range(len(parts), 0, -1):
+            parent = join_path(parts[:depth - 1])
+            self._conn.execute("DELETE FROM children WHERE parent = ? AND key = ?", (parent, parts[depth - 1]))
+            if self._conn.execute("SELECT 1 FROM children WHERE parent = ? LIMIT 1", (parent,)).fetchone():
+                return
+
+
+def create_store(backend=None):
+    """Store for STORAGE_BACKEND (firebase | memory | sqlite)"""
+    backend = (backend or os.getenv("STORAGE_BACKEND", "firebase")).lower()
+    if backend == "firebase":
+        return FirebaseStore()
+    if backend == "memory":
+        local_store = MemoryStore()
+    elif backend == "sqlite":
+        local_store = SqliteStore(os.getenv("STORAGE_SQLITE_PATH", "local_store.db"))
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (use firebase, memory or sqlite)")
+    if os.getenv("STORAGE_SEED_JSON"):
+        local_store.load_json(os.getenv("STORAGE_SEED_JSON"))
+    return local_store
+
+
+store = create_store()
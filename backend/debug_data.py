@@ -16,9 +16,9 @@ if not firebase_admin._apps:
 # Shah's UID from mapping
 shah_uid = "PMtPmMkVdzaYdG9M8Xc1DjrMAaZ2"
 
-# Get history data
+# Get the last 6 days of history (ordered, limited query - not the whole history)
 history_ref = db.reference(f"health_data/{shah_uid}/history")
-history_data = history_ref.get()
+history_data = history_ref.order_by_key().limit_to_last(6).get()
 
 if history_data:
     sorted_dates = sorted(history_data.keys())[-6:]
@@ -0,0 +1,190 @@
+# backend/fast_inference.py
+"""
+Compiled (pure NumPy) inference kernels
+=======================================
+sklearn validates its input on every call, which dominates the cost of
+scoring a single 1x6 watch reading. These kernels read the fitted parameters
+ONCE when a model version is loaded and then score N rows with plain
+vectorized NumPy - no per-call validation.
+"""
+
+import numpy as np
+
+
+def scaler_params(scaler, n_features):
+    """Return (mean, scale) of a fitted StandardScaler as float64 arrays"""
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+    return mean, scale
+
+
+def as_rows(X):
+    """Coerce a single row or an (N, D) matrix to a float64 (N, D) array"""
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+    return X
+
+
+class CompiledKMeans(object):
+    """
+    StandardScaler + KMeans folded into one distance computation.
+
+    Scaling then measuring distance to centroid c:
+        || (x - mean) / scale - c ||
+    equals measuring a per-feature weighted distance to a centroid moved
+    back into raw feature space:
+        || (x - (mean + c * scale)) / scale ||
+    so the scaler costs nothing extra at request time.
+    """
+
+    def __init__(self, scaler, kmeans):
+        centers = np.asarray(kmeans.cluster_centers_, dtype=np.float64)
+        self.n_features = centers.shape[1]
+        self.mean, self.std = scaler_params(scaler, self.n_features)
+        self.inv_scale = 1.0 / self.std
+        self.raw_centers = self.mean + centers * self.std
+
+    def scale(self, X):
+        """Equivalent of scaler.transform(X)"""
+        return (as_rows(X) - self.mean) / self.std
+
+    def predict(self, X):
+        """
+        Score N raw (unscaled) rows.
+        Returns (cluster_ids, distances (N, K), confidence %) - confidence is
+        the same (1 - nearest / farthest) * 100 used by /predict_health.
+        """
+        X = as_rows(X)
+        diff = (X[:, np.newaxis, :] - self.raw_centers[np.newaxis, :, :]) * self.inv_scale
+        distances = np.sqrt(np.einsum('nkd,nkd->nk', diff, diff))
+        cluster_ids = distances.argmin(axis=1)
+        min_dist = distances[np.arange(len(X)), cluster_ids]
+        max_dist = distances.max(axis=1)
+        safe_max = np.where(max_dist > 0, max_dist, 1.0)
+        confidence = np.where(max_dist > 0, (1 - min_dist / safe_max) * 100, 50.0)
+        return cluster_ids, distances, confidence
+
+
+def average_path_length(n_samples):
+    """
+    Expected path length of an unsuccessful BST search over n samples - the
+    correction IsolationForest adds at a leaf that still holds n samples.
+    """
+    n = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    big = n > 2
+    result[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return result
+
+
+class CompiledIsolationForest(object):
+    """
+    A fitted IsolationForest exported to flat NumPy arrays.
+
+    All trees are concatenated into one node table (feature, threshold,
+    children, path length). Leaves point at themselves and carry
+    depth + average_path_length(n_node_samples), so every row walks every
+    tree in lock-step for max_depth vectorized steps. One pass yields the
+    decision_function score AND the predict label.
+    """
+
+    # Keeps the (rows x trees) int32 node table inside the CPU cache
+    CHUNK_ROWS = 1024
+
+    def __init__(self, forest, scaler=None):
+        features, thresholds, lefts, rights, path_lengths, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for tree, tree_features in zip(forest.estimators_, forest.estimators_features_):
+            t = tree.tree_
+            n_nodes = t.node_count
+            children_left = t.children_left
+            children_right = t.children_right
+            is_leaf = children_left == -1
+
+            # Node depth (root = 0); sklearn builds parents before children
+            depth = np.zeros(n_nodes, dtype=np.int64)
+            for node in range(n_nodes):
+                if not is_leaf[node]:
+                    depth[children_left[node]] = depth[node] + 1
+                    depth[children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            # Tree features index into the forest's per-tree feature subset
+            feature = np.zeros(n_nodes, dtype=np.int32)
+            feature[~is_leaf] = np.asarray(tree_features)[t.feature[~is_leaf]]
+
+            node_ids = np.arange(n_nodes)
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, np.inf, t.threshold))
+            lefts.append(np.where(is_leaf, node_ids, children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, children_right) + offset)
+            path_lengths.append(np.where(
+                is_leaf, depth + average_path_length(t.n_node_samples), 0.0
+            ))
+            roots.append(offset)
+            offset += n_nodes
+
+        self.n_nodes = offset
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        # children[node] is the left child, children[node + n_nodes] the right one
+        self.children = np.concatenate(lefts + rights).astype(np.int32)
+        self.path_length = np.concatenate(path_lengths)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = max_depth
+        self.offset = float(forest.offset_)
+
+        max_samples = getattr(forest, "_max_samples", None) or forest.max_samples_
+        self.denominator = len(self.roots) * float(average_path_length([max_samples])[0])
+
+        n_features = forest.n_features_in_
+        if scaler is not None:
+            self.mean, self.std = scaler_params(scaler, n_features)
+        else:
+            self.mean, self.std = np.zeros(n_features), np.ones(n_features)
+
+    def _path_lengths(self, X32):
+        """Sum of path lengths over all trees for each row"""
+        n_rows, n_features = X32.shape
+        values = X32.ravel()
+        row_base = (np.arange(n_rows, dtype=np.int32) * n_features)[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        right_offset = np.int32(self.n_nodes)
+        for _ in range(self.max_depth):
+            x = np.take(values, row_base + np.take(self.feature, node))
+            go_right = x > np.take(self.threshold, node)
+            node = np.take(self.children, node + go_right * right_offset)
+        return np.take(self.path_length, node).sum(axis=1)
+
+    def scale(self, X):
+        """Equivalent of scaler.transform(X) (identity without a scaler)"""
+        return (as_rows(X) - self.mean) / self.std
+
+    def score(self, X):
+        """
+        Score N raw (unscaled) rows.
+        Returns (decision_function scores, predict labels: 1 normal / -1 anomaly)
+        """
+        return self.score_scaled(self.scale(X))
+
+    def score_scaled(self, X):
+        """score() for rows already passed through scale()"""
+        # sklearn walks its trees on float32 input
+        X32 = X.astype(np.float32)
+        depths = np.empty(len(X32))
+        for start in range(0, len(X32), self.CHUNK_ROWS):
+            depths[start:start + self.CHUNK_ROWS] = self._path_lengths(X32[start:start + self.CHUNK_ROWS])
+
+        if self.denominator > 0:
+            scores = -(2.0 ** (-depths / self.denominator))
+        else:
+            scores = -np.ones(len(X32))
+        decision = scores - self.offset
+        labels = np.where(decision < 0, -1, 1)
+        return decision, labels
@@ -0,0 +1,206 @@
+# backend/ingest_buffer.py
+"""
+Write-Coalescing Ingest Buffer for watch readings
+=================================================
+/send_data does not write to the database per reading. Readings land in
+an in-memory buffer and a flusher thread writes the buffer every
+`flush_seconds` as ONE multi-path update:
+
+    health_data/{uid}/current/{field}          <- newest value of each field
+    health_data/{uid}/history/{date}/{field}   <- newest value of that day
+
+Several readings for the same patient (or the same patient-day) within
+one interval merge field by field (newer values win), so write volume is
+bounded by active patients per interval, not by upload rate. Each field
+is its own path, so a reading with only some metrics (e.g. just
+heartRate) updates those and keeps the other stored fields.
+
+- Backpressure: at most `max_pending` patients wait in the buffer; add()
+  refuses new patients beyond that (the route answers 503) and wakes the
+  flusher early.
+- A failed flush puts its readings back (newer readings win) and is
+  retried on the next interval.
+- stats(): ingest rate, flush latency and buffer depth.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class IngestBuffer(object):
+    """Per-patient latest readings, flushed as one multi-path update"""
+
+    def __init__(self, write, flush_seconds=0.5, max_pending=50000, on_flush=None,
+                 rate_window_seconds=60):
+        """
+        write(updates) performs the multi-path update ({path: value}).
+        on_flush({uid: reading}, {(uid, date): reading}) runs after each successful write
+        (readings hold only the fields written, not necessarily all six metrics).
+        """
+        self.write = write
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self.rate_window_seconds = rate_window_seconds
+
+        self._current = {}   # uid -> (timestamp, reading)
+        self._history = {}   # (uid, date) -> (timestamp, reading)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._rate_buckets = deque()  # [second, readings] for the last rate_window_seconds
+        self._flush_seconds_recent = deque(maxlen=256)
+        self.readings_received = 0
+        self.readings_coalesced = 0
+        self.readings_rejected = 0
+        self.flushes = 0
+        self.paths_written = 0
+        self.flush_errors = 0
+        self.last_error = None
+        self.last_flush_at = None
+
+    # -------------------------------------------------------------------------
+    # Ingest
+    # -------------------------------------------------------------------------
+    def add(self, uid, reading, date_key, timestamp):
+        """Buffer one normalized reading. False when the buffer is full."""
+        with self._lock:
+            if uid not in self._current and len(self._current) >= self.max_pending:
+                self.readings_rejected += 1
+                self._wake.set()
+                return False
+            self.readings_received += 1
+            self._count_rate()
+            if uid in self._current:
+                self.readings_coalesced += 1
+            for buffer, key in ((self._current, uid), (self._history, (uid, date_key))):
+                self._merge(buffer, key, (timestamp, reading))
+        return True
+
+    @staticmethod
+    def _merge(buffer, key, entry):
+        """Merge (timestamp, reading) into buffer[key]; the newer reading wins field by field"""
+        previous = buffer.get(key)
+        if previous is None:
+            buffer[key] = entry
+        elif previous[0] <= entry[0]:
+            buffer[key] = (entry[0], dict(previous[1], **entry[1]))
+        else:
+            # An out-of-order older reading only fills fields the newer one lacks
+            buffer[key] = (previous[0], dict(entry[1], **previous[1]))
+
+    def _count_rate(self):
+        second = int(time.time())
+        if self._rate_buckets and self._rate_buckets[-1][0] == second:
+            self._rate_buckets[-1][1] += 1
+        else:
+            self._rate_buckets.append([second, 1])
+        while self._rate_buckets[0][0] <= second - self.rate_window_seconds:
+            self._rate_buckets.popleft()
+
+    # -------------------------------------------------------------------------
+    # Flush
+    # -------------------------------------------------------------------------
+    def flush(self):
+        """Write everything buffered in one update; returns paths written"""
+        with self._flush_lock:
+            with self._lock:
+                current, self._current = self._current, {}
+                history, self._history = self._history, {}
+            if not current and not history:
+                return 0
+
+            updates = {f"health_data/{uid}/current/{field}": value
+                       for uid, (_, reading) in current.items() for field, value in reading.items()}
+            updates.update({f"health_data/{uid}/history/{date_key}/{field}": value
+                            for (uid, date_key), (_, reading) in history.items()
+                            for field, value in reading.items()})
+            start = time.perf_counter()
+            try:
+                self.write(updates)
+            except Exception as e:
+                self._requeue(current, history)
+                self.flush_errors += 1
+                self.last_error = str(e)
+                print(f"ERROR in ingest flush ({len(updates)} paths, kept for retry): {e}")
+                return 0
+            self._flush_seconds_recent.append(time.perf_counter() - start)
+            self.flushes += 1
+            self.paths_written += len(updates)
+            self.last_flush_at = time.time()
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush({uid: reading for uid, (_, reading) in current.items()},
+                              {key: reading for key, (_, reading) in history.items()})
+            except Exception as e:
+                print(f"WARNING: ingest on_flush failed: {e}")
+        return len(updates)
+
+    def _requeue(self, current, history):
+        """Put a failed batch back, merged under readings that arrived since"""
+        with self._lock:
+            for buffer, failed in ((self._current, current), (self._history, history)):
+                for key, entry in failed.items():
+                    self._merge(buffer, key, entry)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ingest-flush", daemon=True)
+        self._thread.start()
+        print(f"Ingest buffer: flushing every {self.flush_seconds}s (max {self.max_pending} patients pending)")
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending_patients = len(self._current)
+            pending_days = len(self._history)
+            buckets = list(self._rate_buckets)
+        now = time.time()
+        recent = [count for second, count in buckets if second > now - self.rate_window_seconds]
+        span = min(self.rate_window_seconds, now - buckets[0][0]) if buckets else 0
+        latencies = sorted(self._flush_seconds_recent)
+        return {
+            "running": self._thread is not None,
+            "flush_seconds": self.flush_seconds,
+            "buffer_depth": {"patients": pending_patients, "history_days": pending_days,
+                             "capacity": self.max_pending},
+            "ingest_rate_per_second": round(sum(recent) / span, 2) if span >= 1 else None,
+            "readings_received": self.readings_received,
+            "readings_coalesced": self.readings_coalesced,
+            "readings_rejected": self.readings_rejected,
+            "flushes": self.flushes,
+            "paths_written": self.paths_written,
+            "flush_errors": self.flush_errors,
+            "last_error": self.last_error,
+            "last_flush_at": self.last_flush_at,
+            "flush_latency_ms": {
+                "last": round(self._flush_seconds_recent[-1] * 1000, 2) if latencies else None,
+                "p50": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+        }
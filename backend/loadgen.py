@@ -0,0 +1,297 @@
+# backend/loadgen.py
+"""
+Load Generator - thousands of virtual watches against the API
+=============================================================
+Every virtual watch uploads a reading every `--interval` seconds, drawn
+from its risk profile (low / moderate / high, see risk_profiles.py).
+Upload times are spread evenly over the interval, so N watches produce a
+steady N / interval requests per second. With --mix, part of those events
+become dashboard reads (predict_health, detect_deterioration,
+get_health_prediction) for the same patient instead of uploads.
+
+- One scheduler thread finds due watches with vectorized NumPy ops and
+  draws all their readings in one call; a thread pool sends the requests.
+- Every pool thread keeps its own keep-alive requests.Session, so
+  connections are reused instead of opened per request.
+- Sends are bounded (--concurrency in flight plus a small queue). Events
+  that would wait longer are counted as "late" rather than piling up.
+- Reports achieved throughput and p50/p95/p99 latency per endpoint.
+
+Usage (from the backend folder, with the API running):
+    python loadgen.py --watches 2000 --interval 5 --duration 60
+    python loadgen.py --patients-from-api --mix send_data=0.8,detect_deterioration=0.2
+    python loadgen.py --watches 500 --batch 50 --json results.json   # gateway-style batches
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from risk_profiles import RISK_LEVELS, draw_readings, level_index, to_reading
+
+ENDPOINTS = ("send_data", "predict_health", "detect_deterioration", "get_health_prediction")
+TICK_SECONDS = 0.01
+
+
+def parse_weights(text, allowed):
+    """'a=0.5,b=0.5' -> normalized probability array in `allowed` order"""
+    weights = dict.fromkeys(allowed, 0.0)
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"Unknown name '{name.strip()}' (use {', '.join(allowed)})")
+        weights[name.strip()] = float(value or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("Weights must add up to more than 0")
+    return np.array([weights[name] / total for name in allowed])
+
+
+# -----------------------------------------------------------------------------
+# Results
+# -----------------------------------------------------------------------------
+class EndpointStats(object):
+    """Latencies (ms) and outcomes of one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms, status):
+        with self.lock:
+            self.latencies.append(latency_ms)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not isinstance(status, int) or not 200 <= status < 300:
+                self.errors += 1
+
+    def summary(self, elapsed):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            statuses = dict(self.statuses)
+            errors = self.errors
+        if not len(latencies):
+            return None
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(latencies.max()), 2),
+        }
+
+
+# -----------------------------------------------------------------------------
+# Virtual watches
+# -----------------------------------------------------------------------------
+class VirtualWatches(object):
+    """Per-watch next-due times; due() advances every watch that is due"""
+
+    def __init__(self, patient_ids, levels, interval, rng):
+        self.patient_ids = list(patient_ids)
+        self.levels = np.asarray(levels, dtype=np.intp)
+        self.interval = interval
+        # Random phase so uploads are spread over the interval, not synchronized
+        self.next_due = rng.uniform(0, interval, len(self.patient_ids))
+
+    def due(self, elapsed):
+        due = np.flatnonzero(self.next_due <= elapsed)
+        self.next_due[due] += self.interval
+        return due
+
+
+class LoadGenerator(object):
+    """Schedules watch events and sends them from a bounded thread pool"""
+
+    def __init__(self, base_url, watches, mix, concurrency=64, batch=1, rng=None):
+        self.base_url = base_url.rstrip("/")
+        self.watches = watches
+        self.mix = mix
+        self.batch = batch
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.concurrency = concurrency
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadgen")
+        # In flight + queued; beyond this an event is counted late instead of queued
+        self.slots = threading.BoundedSemaphore(concurrency * 2)
+        self.local = threading.local()
+        self.stats = {endpoint: EndpointStats() for endpoint in ENDPOINTS}
+        self.readings_sent = 0
+        self.late = 0
+
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.local.session = session
+        return session
+
+    # -------------------------------------------------------------------------
+    # Requests
+    # -------------------------------------------------------------------------
+    def _send(self, endpoint, method, path, payload):
+        start = time.perf_counter()
+        try:
+            if method == "GET":
+                response = self.session().get(self.base_url + path, timeout=30)
+            else:
+                response = self.session().post(self.base_url + path, json=payload, timeout=30)
+            response.content  # read the body so the connection goes back to the pool
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        finally:
+            self.slots.release()
+        self.stats[endpoint].record((time.perf_counter() - start) * 1000, status)
+
+    def submit(self, endpoint, method, path, payload=None):
+        if not self.slots.acquire(blocking=False):
+            self.late += 1
+            return
+        self.pool.submit(self._send, endpoint, method, path, payload)
+
+    def dispatch(self, due):
+        """Send the events of every due watch"""
+        kinds = self.rng.choice(len(ENDPOINTS), size=len(due), p=self.mix)
+        uploads = due[kinds == 0]
+        if len(uploads):
+            rows = draw_readings(self.watches.levels[uploads], self.rng)
+            readings = [dict(to_reading(row), patient_id=self.watches.patient_ids[i], source="loadgen")
+                        for i, row in zip(uploads, rows)]
+            for start in range(0, len(readings), self.batch):
+                chunk = readings[start:start + self.batch]
+                payload = chunk[0] if len(chunk) == 1 else {"readings": chunk}
+                self.submit("send_data", "POST", "/send_data", payload)
+                self.readings_sent += len(chunk)
+        for i, kind in zip(due, kinds):
+            patient_id = self.watches.patient_ids[i]
+            if kind == 1:
+                self.submit("predict_health", "POST", "/predict_health", {"patient_id": patient_id})
+            elif kind == 2:
+                self.submit("detect_deterioration", "POST", "/detect_deterioration", {"patient_id": patient_id})
+            elif kind == 3:
+                self.submit("get_health_prediction", "GET", f"/get_health_prediction/{patient_id}")
+
+    # -------------------------------------------------------------------------
+    # Run
+    # -------------------------------------------------------------------------
+    def run(self, duration, report_every=5.0):
+        """Generate load for `duration` seconds (0 = until Ctrl+C)"""
+        start = time.perf_counter()
+        next_report = report_every
+        try:
+            while True:
+                elapsed = time.perf_counter() - start
+                if duration and elapsed >= duration:
+                    break
+                due = self.watches.due(elapsed)
+                if len(due):
+                    self.dispatch(due)
+                if report_every and elapsed >= next_report:
+                    next_report += report_every
+                    done = sum(len(stats.latencies) for stats in self.stats.values())
+                    print(f"  t={elapsed:6.1f}s  completed {done:8d}  ({done / elapsed:8.1f} req/s)  late {self.late}")
+                time.sleep(TICK_SECONDS)
+        except KeyboardInterrupt:
+            print("Stopping...")
+        self.pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "watches": len(self.watches.patient_ids),
+            "interval_seconds": self.watches.interval,
+            "target_events_per_second": round(len(self.watches.patient_ids) / self.watches.interval, 1),
+            "readings_sent": self.readings_sent,
+            "late_events": self.late,
+            "endpoints": {endpoint: summary for endpoint, summary in
+                          ((endpoint, stats.summary(elapsed)) for endpoint, stats in self.stats.items())
+                          if summary is not None},
+        }
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+def patients_from_api(base_url):
+    """Every patient UID from /get_all_patients (paged)"""
+    uids, after = [], None
+    while True:
+        params = {"limit": 500}
+        if after:
+            params["after"] = after
+        page = requests.get(f"{base_url.rstrip('/')}/get_all_patients", params=params, timeout=30).json()
+        uids += [patient["firebase_uid"] for patient in page["patients"]]
+        after = page.get("next_after")
+        if not after:
+            return uids
+
+
+def print_report(report):
+    print("=" * 88)
+    print(f"{report['watches']} watches every {report['interval_seconds']}s "
+          f"(target {report['target_events_per_second']} events/s) for {report['elapsed_seconds']}s, "
+          f"{report['readings_sent']} readings, {report['late_events']} late events")
+    print("-" * 88)
+    print(f"{'endpoint':<24}{'requests':>9}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for endpoint, summary in report["endpoints"].items():
+        print(f"{endpoint:<24}{summary['requests']:>9}{summary['throughput_rps']:>9}{summary['errors']:>8}"
+              f"{summary['p50_ms']:>9}{summary['p95_ms']:>9}{summary['p99_ms']:>9}  {summary['statuses']}")
+    print("=" * 88)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many smartwatches uploading to the API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="API base URL")
+    parser.add_argument("--watches", type=int, default=1000, help="virtual watches (synthetic patient UIDs)")
+    parser.add_argument("--patients-from-api", action="store_true",
+                        help="one watch per patient from /get_all_patients instead of synthetic UIDs")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between uploads per watch")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run (0 = until Ctrl+C)")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight")
+    parser.add_argument("--batch", type=int, default=1, help="readings per /send_data request")
+    parser.add_argument("--risk-mix", default="low=0.5,moderate=0.3,high=0.2",
+                        type=lambda text: parse_weights(text, RISK_LEVELS), help="share of watches per risk level")
+    parser.add_argument("--mix", default="send_data=1", type=lambda text: parse_weights(text, ENDPOINTS),
+                        help=f"share of events per endpoint ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report-every", type=float, default=5.0, help="progress line every N seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    if args.patients_from_api:
+        patient_ids = patients_from_api(args.url)
+        if not patient_ids:
+            parser.error("No patients returned by /get_all_patients")
+    else:
+        patient_ids = [f"loadgen-{i:06d}" for i in range(args.watches)]
+    levels = rng.choice(level_index(RISK_LEVELS), size=len(patient_ids), p=args.risk_mix)
+
+    watches = VirtualWatches(patient_ids, levels, args.interval, rng)
+    generator = LoadGenerator(args.url, watches, args.mix, concurrency=args.concurrency,
+                              batch=max(1, args.batch), rng=rng)
+    print(f"Load generator: {len(patient_ids)} watches -> {args.url} "
+          f"({len(patient_ids) / args.interval:.1f} events/s, {args.concurrency} connections)")
+    report = generator.run(args.duration, args.report_every)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Load test: single-flight coalescing on the real endpoints
+=========================================================
+Fires many simultaneous requests for a handful of patients (the "patient
+dashboard + several doctors refresh at once" case) through the app's own
+test client, against the in-memory store with simulated RTDB latency on
+every read and a simulated model cost, and checks via /debug/cache_stats:
+
+1. /detect_deterioration + /predict_health, cold caches: each patient's
+   window (history + current) is read once for both endpoints, and each
+   endpoint runs the models once per patient (inference_flight + result
+   cache); every request gets the same JSON
+2. /predict_health_batch for the same panel from many callers: callers
+   share a current reading that is already in flight (fetch_flight), so
+   with the shared fetch pool working in waves each patient is read at
+   most once per wave
+
+Run from the backend folder:  python loadtest_coalescing.py
+"""
+
+import os
+
+# Local stand-in store and no background work before app is imported
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.pop("STORAGE_SEED_JSON", None)
+os.environ.pop("TIMESERIES_DB", None)
+os.environ["ENABLE_SCHEDULER"] = "0"
+os.environ["ENABLE_WORKER"] = "0"
+
+import contextlib
+import threading
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    import app
+from singleflight import SingleFlight
+from window_cache import WindowCache
+
+PATIENTS = 4
+REQUESTS_PER_PATIENT = 16
+STORE_LATENCY = 0.05    # seconds per read (RTDB round-trip)
+COMPUTE_LATENCY = 0.02  # seconds added to every model run
+READ_METHODS = ("get", "get_last", "get_since")
+
+
+class ReadLatency(object):
+    """Makes the shared store's reads sleep like RTDB and counts health_data reads"""
+
+    def __init__(self, store, latency):
+        self.store = store
+        self.latency = latency
+        self.reads = 0
+        self.lock = threading.Lock()
+        self.originals = {name: getattr(store, name) for name in READ_METHODS}
+
+    def wrap(self, read):
+        def slow_read(path, *args, **kwargs):
+            time.sleep(self.latency)
+            if path.startswith("health_data/"):
+                with self.lock:
+                    self.reads += 1
+            return read(path, *args, **kwargs)
+        return slow_read
+
+    def __enter__(self):
+        for name, read in self.originals.items():
+            setattr(self.store, name, self.wrap(read))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name in READ_METHODS:
+            delattr(self.store, name)
+        return False
+
+
+def make_tree(rng):
+    def day():
+        return {"heartRate": int(rng.integers(55, 100)), "steps": int(rng.integers(1000, 12000)),
+                "calories": int(rng.integers(100, 500)), "distance": 3.0,
+                "sleepHours": 7.0, "workout": int(rng.integers(0, 60))}
+    uids = [f"loadtest-uid{p}" for p in range(PATIENTS)]
+    return {
+        "patient_mappings": {f"P{p + 1}": uid for p, uid in enumerate(uids)},
+        "patient_info": {f"P{p + 1}": {"name": f"Patient {p + 1}", "uid": uid} for p, uid in enumerate(uids)},
+        "health_data": {uid: {"history": {f"2026-09-{d:02d}": day() for d in range(1, 29)}, "current": day()}
+                        for uid in uids},
+    }
+
+
+def reset_caches():
+    """Cold window/result caches and fresh single-flight counters, app settings kept"""
+    app.window_cache = WindowCache(
+        app.reading_to_row, max_bytes=app.window_cache.max_bytes, ttl_seconds=app.window_cache.ttl_seconds,
+        days=app.window_cache.days, trend_days=app.TREND_WINDOW_DAYS,
+    )
+    app.result_cache.clear()
+    app.inference_flight = SingleFlight()
+    app.fetch_flight = SingleFlight()
+
+
+def slow_models():
+    """Wrap both model pipelines with COMPUTE_LATENCY; returns the run counter"""
+    runs = {"health": 0, "deterioration": 0}
+    lock = threading.Lock()
+
+    def slowed(name, build):
+        def run(*args, **kwargs):
+            time.sleep(COMPUTE_LATENCY)
+            with lock:
+                runs[name] += 1
+            return build(*args, **kwargs)
+        return run
+
+    app.build_health_predictions = slowed("health", app.build_health_predictions)
+    app.build_deterioration_results = slowed("deterioration", app.build_deterioration_results)
+    return runs
+
+
+def fire(requests):
+    """Send every (path, json) POST at once, one thread + client each"""
+    responses = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def send(i, path, body):
+        client = app.app.test_client()
+        barrier.wait()
+        responses[i] = client.post(path, json=body)
+
+    threads = [threading.Thread(target=send, args=(i, path, body)) for i, (path, body) in enumerate(requests)]
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return responses, time.perf_counter() - start
+
+
+def cache_stats():
+    return app.app.test_client().get("/debug/cache_stats").get_json()
+
+
+def check_dashboards(latency, runs):
+    reset_caches()
+    requests = [(path, {"patient_id": f"P{p + 1}"})
+                for p in range(PATIENTS) for path in ("/detect_deterioration", "/predict_health")
+                for _ in range(REQUESTS_PER_PATIENT // 2)]
+    latency.reads = 0
+    responses, elapsed = fire(requests)
+    stats = cache_stats()
+
+    for (path, body), response in zip(requests, responses):
+        assert response.status_code == 200, f"{path} {body}: {response.status_code} {response.get_data()[:200]}"
+    for key in {(path, body["patient_id"]) for path, body in requests}:
+        bodies = {response.get_data() for (path, body), response in zip(requests, responses)
+                  if (path, body["patient_id"]) == key}
+        assert len(bodies) == 1, f"{key}: requests got different results"
+
+    statuses = [response.headers.get("X-Result-Cache") for response in responses]
+    print(f"  dashboards    | {len(requests)} requests | health_data reads {latency.reads:3d} "
+          f"(uncoalesced {len(requests) * 2}) | model runs {runs['health'] + runs['deterioration']:3d} | "
+          f"MISS/SHARED/HIT {statuses.count('MISS')}/{statuses.count('SHARED')}/{statuses.count('HIT')} | "
+          f"wall {elapsed * 1e3:6.1f} ms")
+
+    assert latency.reads == 2 * PATIENTS, f"expected {2 * PATIENTS} window reads, got {latency.reads}"
+    assert stats["window_cache"]["misses"] == PATIENTS, stats["window_cache"]
+    assert stats["inference_coalescing"]["executions"] == 2 * PATIENTS, stats["inference_coalescing"]
+    assert stats["inference_coalescing"]["coalesced"] + stats["result_cache"]["hits"] == \
+        len(requests) - 2 * PATIENTS, (stats["inference_coalescing"], stats["result_cache"])
+    assert runs["health"] == PATIENTS and runs["deterioration"] == PATIENTS, runs
+
+
+def check_batches(latency):
+    reset_caches()
+    panel = [f"P{p + 1}" for p in range(PATIENTS)]
+    requests = [("/predict_health_batch", {"patient_ids": panel}) for _ in range(REQUESTS_PER_PATIENT)]
+    latency.reads = 0
+    responses, elapsed = fire(requests)
+    stats = cache_stats()
+
+    for response in responses:
+        assert response.status_code == 200, f"{response.status_code} {response.get_data()[:200]}"
+    fetch = stats["fetch_coalescing"]
+    print(f"  batch panels  | {len(requests)} requests | health_data reads {latency.reads:3d} "
+          f"(uncoalesced {len(requests) * PATIENTS}) | fetch executions {fetch['executions']:3d}, "
+          f"coalesced {fetch['coalesced']:3d} | wall {elapsed * 1e3:6.1f} ms")
+
+    # 16 workers by default: the queued reads run in waves, one per patient each
+    waves = -(-len(requests) * PATIENTS // app._fetch_pool._max_workers)
+    assert latency.reads == fetch["executions"], (latency.reads, fetch)
+    assert latency.reads <= waves * PATIENTS, f"expected at most {waves * PATIENTS} current reads, got {latency.reads}"
+    assert fetch["executions"] + fetch["coalesced"] == len(requests) * PATIENTS, fetch
+
+
+def main():
+    app.store.set("/", make_tree(np.random.default_rng(7)))
+    deadline = time.time() + 10
+    while len(app.patient_id_cache.mappings()) < PATIENTS and time.time() < deadline:
+        time.sleep(0.01)
+    runs = slow_models()
+
+    print(f"Concurrent requests for {PATIENTS} patients through the app "
+          f"({STORE_LATENCY * 1e3:.0f} ms per read, +{COMPUTE_LATENCY * 1e3:.0f} ms per model run)")
+    print("=" * 60)
+    with ReadLatency(app.store, STORE_LATENCY) as latency:
+        check_dashboards(latency, runs)
+        check_batches(latency)
+    print("\nCoalesced reads and model runs match /debug/cache_stats.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# backend/metrics.py
+"""
+Serving Metrics - per-stage latency histograms and counters
+===========================================================
+Fixed-bucket histograms (Prometheus `le` buckets) and counters, kept in
+process and rendered in Prometheus text format at /metrics.
+
+    with metrics.span("window_build"):
+        ...
+    with metrics.model_span("trend_forest", "predict", rows=len(X)):
+        ...
+
+- Every span is labelled with the endpoint of the request running on the
+  current thread ("background" for worker/scheduler threads). bind(fn)
+  carries the label into thread-pool tasks.
+- Spans are inclusive: a store read inside window_cache is counted in
+  both stages.
+- An observation is two perf_counter() calls, one dict lookup, a bisect
+  and a short lock - about a microsecond (see benchmark_metrics.py).
+  METRICS_ENABLED=0 turns every span into a shared no-op.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+_bisect_left = bisect.bisect_left
+_perf_counter = time.perf_counter
+
+# Seconds; covers 50 us kernel calls up to multi-second population sweeps
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = os.getenv("METRICS_ENABLED", "1") == "1"
+
+
+class _RequestLocal(threading.local):
+    # Class defaults: a missed getattr() on a thread-local costs ~10x a hit
+    endpoint = "background"
+    request_start = None
+
+
+_local = _RequestLocal()
+
+
+class Histogram(object):
+    """Counts per bucket (non-cumulative, last slot is +Inf), sum and count"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricFamily(object):
+    """One metric name with a child histogram/counter per label combination"""
+
+    def __init__(self, name, help_text, kind, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, labels):
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.get(labels)
+                if child is None:
+                    child = Histogram(self.buckets) if self.kind == "histogram" else [0]
+                    self._children[labels] = child
+        return child
+
+    def observe(self, labels, value):
+        self._child(labels).observe(value)
+
+    def inc(self, labels, amount=1):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for labels, child in children:
+            label_text = ",".join(f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels))
+            if self.kind == "counter":
+                lines.append(f"{self.name}{{{label_text}}} {child[0]}")
+                continue
+            with child.lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._families = []
+
+    def histogram(self, name, help_text, labelnames, buckets=DEFAULT_BUCKETS):
+        family = MetricFamily(name, help_text, "histogram", labelnames, buckets)
+        self._families.append(family)
+        return family
+
+    def counter(self, name, help_text, labelnames):
+        family = MetricFamily(name, help_text, "counter", labelnames)
+        self._families.append(family)
+        return family
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+REQUEST_SECONDS = registry.histogram(
+    "healthsync_request_seconds", "Request latency by Flask endpoint", ("endpoint", "method"))
+REQUESTS = registry.counter(
+    "healthsync_requests_total", "Requests by Flask endpoint and status", ("endpoint", "method", "status"))
+STAGE_SECONDS = registry.histogram(
+    "healthsync_stage_seconds", "Time in each serving stage (inclusive spans)", ("endpoint", "stage"))
+MODEL_SECONDS = registry.histogram(
+    "healthsync_model_seconds", "Model kernel time by model and step (scale, predict)",
+    ("endpoint", "model", "stage"))
+MODEL_ROWS = registry.counter(
+    "healthsync_model_rows_total", "Rows scored by each model", ("endpoint", "model"))
+_stage_children = STAGE_SECONDS._children
+
+
+# -----------------------------------------------------------------------------
+# Spans
+# -----------------------------------------------------------------------------
+class Span(object):
+    """Times one block into a histogram child resolved up front"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = _perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = _perf_counter() - self.start
+        histogram = self.histogram
+        i = _bisect_left(histogram.buckets, elapsed)
+        with histogram.lock:
+            histogram.counts[i] += 1
+            histogram.sum += elapsed
+            histogram.count += 1
+        return False
+
+
+class NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def current_endpoint():
+    return _local.endpoint
+
+
+def span(stage):
+    """Time a serving stage of the current endpoint"""
+    if not enabled:
+        return NOOP_SPAN
+    labels = (_local.endpoint, stage)
+    histogram = _stage_children.get(labels)
+    if histogram is None:
+        histogram = STAGE_SECONDS._child(labels)
+    return Span(histogram)
+
+
+def model_span(model, stage, rows=None):
+    """Time one model step (scale / predict); rows are counted on predict"""
+    if not enabled:
+        return NOOP_SPAN
+    endpoint = _local.endpoint
+    if rows is not None:
+        MODEL_ROWS.inc((endpoint, model), rows)
+    return Span(MODEL_SECONDS._child((endpoint, model, stage)))
+
+
+def bind(fn):
+    """fn that runs under the caller's endpoint label (for thread pools)"""
+    endpoint = current_endpoint()
+
+    def bound(*args, **kwargs):
+        previous = _local.endpoint
+        _local.endpoint = endpoint
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.endpoint = previous
+    return bound
+
+
+# -----------------------------------------------------------------------------
+# Requests
+# -----------------------------------------------------------------------------
+def begin_request(endpoint):
+    _local.endpoint = endpoint or "unmatched"
+    _local.request_start = time.perf_counter()
+
+
+def end_request(method, status):
+    start = _local.request_start
+    if enabled and start is not None:
+        endpoint = _local.endpoint
+        REQUEST_SECONDS.observe((endpoint, method), time.perf_counter() - start)
+        REQUESTS.inc((endpoint, method, str(status)))
+    # Back to the class defaults for whatever runs next on this thread
+    _local.__dict__.pop("endpoint", None)
+    _local.__dict__.pop("request_start", None)
+
+
+def render():
+    return registry.render()
@@ -0,0 +1,216 @@
+# backend/model_registry.py
+"""
+Versioned ML Model Registry
+===========================
+Holds every pickled artifact the backend serves (health K-Means + scaler,
+anomaly Isolation Forest, trend detector, trend K-Means, cluster names) as ONE
+immutable version. Request handlers take a snapshot with `registry.active`
+and use it for the whole request, so a retrained model set can be loaded in
+the background and swapped in atomically while requests are in flight.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+from fast_inference import CompiledKMeans, CompiledIsolationForest
+
+# Artifact name -> pickle file (relative to the model directory)
+MODEL_FILES = {
+    "health_cluster_model": "health_cluster_model.pkl",
+    "health_scaler": "health_scaler.pkl",
+    "anomaly_model": "anomaly_model.pkl",
+    "cluster_names": "cluster_names.pkl",
+    "trend_detector": "trend_detector.pkl",
+    "trend_detector_scaler": "trend_detector_scaler.pkl",
+    "trend_cluster_model": "trend_cluster_model.pkl",
+    "trend_cluster_scaler": "trend_cluster_scaler.pkl",
+    "trend_cluster_names": "trend_cluster_names.pkl",
+}
+
+# Compiled kernel name -> (scaler, K-Means) it is built from
+KMEANS_KERNELS = {
+    "health_kmeans": ("health_scaler", "health_cluster_model"),
+    "trend_kmeans": ("trend_cluster_scaler", "trend_cluster_model"),
+}
+
+# Compiled kernel name -> (scaler, IsolationForest) it is built from
+FOREST_KERNELS = {
+    "anomaly_forest": ("health_scaler", "anomaly_model"),
+    "trend_forest": ("trend_detector_scaler", "trend_detector"),
+}
+
+# Scaler -> model pairs that must agree on the number of input features
+SCALER_MODEL_PAIRS = [
+    ("health_scaler", "health_cluster_model"),
+    ("health_scaler", "anomaly_model"),
+    ("trend_detector_scaler", "trend_detector"),
+    ("trend_cluster_scaler", "trend_cluster_model"),
+]
+
+
+class ModelVersion(object):
+    """One complete, consistent and read-only set of loaded ML artifacts"""
+
+    def __init__(self, version, model_dir, artifacts, artifact_bytes, load_seconds, kernels=None):
+        object.__setattr__(self, "_artifacts", dict(artifacts))
+        object.__setattr__(self, "kernels", dict(kernels or {}))
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "model_dir", model_dir)
+        object.__setattr__(self, "artifact_bytes", dict(artifact_bytes))
+        object.__setattr__(self, "memory_bytes", sum(artifact_bytes.values()))
+        object.__setattr__(self, "load_seconds", load_seconds)
+        object.__setattr__(self, "loaded_at", datetime.now().isoformat())
+
+    def __getattr__(self, name):
+        artifacts = object.__getattribute__(self, "_artifacts")
+        if name in MODEL_FILES:
+            return artifacts.get(name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ModelVersion is immutable - load a new version instead")
+
+    def is_loaded(self, name):
+        return self._artifacts.get(name) is not None
+
+    def describe(self):
+        """Summary used by /debug/model_status"""
+        return {
+            "version": self.version,
+            "model_dir": self.model_dir,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "memory_bytes": self.memory_bytes,
+            "artifact_bytes": self.artifact_bytes,
+            "compiled_kernels": sorted(self.kernels),
+        }
+
+
+def load_model_version(model_dir):
+    """
+    Load every artifact found in model_dir into a new ModelVersion.
+    Missing files are skipped (same behaviour as the old load_ml_models),
+    mismatched scaler/model pairs raise ValueError.
+    """
+    start = time.perf_counter()
+    artifacts = {}
+    artifact_bytes = {}
+    digest = hashlib.sha1()
+
+    for name, filename in sorted(MODEL_FILES.items()):
+        path = os.path.join(model_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            raw = f.read()
+        artifacts[name] = pickle.loads(raw)
+        # Pickled size is a close proxy for the in-memory footprint of
+        # sklearn estimators (dominated by their numpy arrays)
+        artifact_bytes[name] = len(raw)
+        digest.update(name.encode())
+        digest.update(raw)
+
+    for scaler_name, model_name in SCALER_MODEL_PAIRS:
+        scaler = artifacts.get(scaler_name)
+        model = artifacts.get(model_name)
+        if scaler is None or model is None:
+            continue
+        n_scaler = getattr(scaler, "n_features_in_", None)
+        n_model = getattr(model, "n_features_in_", None)
+        if n_scaler is not None and n_model is not None and n_scaler != n_model:
+            raise ValueError(
+                f"{scaler_name} expects {n_scaler} features but {model_name} expects {n_model}"
+            )
+
+    # Fold scalers into the K-Means centroids and flatten the Isolation
+    # Forests into node arrays once, at load time
+    kernels = {}
+    for kernel_name, (scaler_name, model_name) in KMEANS_KERNELS.items():
+        if artifacts.get(scaler_name) is not None and artifacts.get(model_name) is not None:
+            kernels[kernel_name] = CompiledKMeans(artifacts[scaler_name], artifacts[model_name])
+    for kernel_name, (scaler_name, model_name) in FOREST_KERNELS.items():
+        if artifacts.get(model_name) is not None:
+            kernels[kernel_name] = CompiledIsolationForest(artifacts[model_name], artifacts.get(scaler_name))
+
+    version = digest.hexdigest()[:12] if artifacts else "empty"
+    return ModelVersion(version, model_dir, artifacts, artifact_bytes,
+                        time.perf_counter() - start, kernels)
+
+
+class ModelRegistry(object):
+    """
+    Holds the active ModelVersion. Swapping is a single reference assignment,
+    so readers always see either the old or the new set - never a mix.
+    """
+
+    def __init__(self, model_dir="."):
+        self.model_dir = model_dir
+        self._active = ModelVersion("empty", model_dir, {}, {}, 0.0)
+        self._reload_lock = threading.Lock()
+        self.reload_in_progress = False
+        self.last_reload_error = None
+        self.history = []
+
+    @property
+    def active(self):
+        return self._active
+
+    def activate(self, new_version):
+        """Atomically make new_version the one served to requests"""
+        previous = self._active
+        self._active = new_version
+        self.history.append({
+            "version": new_version.version,
+            "activated_at": datetime.now().isoformat(),
+            "replaced": previous.version,
+        })
+        del self.history[:-10]
+        return previous
+
+    def load(self, model_dir=None):
+        """Load a version synchronously and activate it (used at startup)"""
+        new_version = load_model_version(model_dir or self.model_dir)
+        self.activate(new_version)
+        return new_version
+
+    def reload(self, model_dir=None):
+        """
+        Load a new version and swap it in, refusing versions that drop an
+        artifact the active version serves. Returns the new version.
+        """
+        with self._reload_lock:
+            self.reload_in_progress = True
+            try:
+                new_version = load_model_version(model_dir or self.model_dir)
+                missing = [name for name in MODEL_FILES
+                           if self._active.is_loaded(name) and not new_version.is_loaded(name)]
+                if missing:
+                    raise ValueError(f"New model set is missing: {', '.join(missing)}")
+                self.activate(new_version)
+                self.last_reload_error = None
+                print(f"Model registry: activated version {new_version.version}")
+                return new_version
+            except Exception as e:
+                self.last_reload_error = str(e)
+                print(f"ERROR reloading ML models: {e}")
+                raise
+            finally:
+                self.reload_in_progress = False
+
+    def reload_async(self, model_dir=None):
+        """Start a background reload; returns False if one is already running"""
+        if self.reload_in_progress:
+            return False
+
+        def run():
+            try:
+                self.reload(model_dir)
+            except Exception:
+                pass  # recorded in last_reload_error
+
+        threading.Thread(target=run, name="model-reload", daemon=True).start()
+        return True
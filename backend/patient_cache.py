@@ -0,0 +1,288 @@
+# backend/patient_cache.py
+"""
+Patient ID Resolution Cache
+===========================
+Keeps simple patient IDs (P1, P2, ...) -> Firebase UID in memory so that
+resolve_patient_id costs zero network calls on a hit.
+
+Two sources, same as the old resolver:
+1. patient_mappings/{id}   - kept live by a Firebase listener
+2. users/*/patientId       - index rebuilt at most once per TTL
+
+PatientDirectory builds the sorted /get_all_patients list from the live
+mappings plus a patient_info mirror, once per change instead of per call.
+"""
+
+import bisect
+import hashlib
+import threading
+import time
+
+from datastore import store
+from singleflight import SingleFlight
+
+
+class PatientIdCache(object):
+    """In-memory simple ID -> UID map with live invalidation and hit/miss counters"""
+
+    def __init__(self, users_ttl_seconds=300):
+        self.users_ttl_seconds = users_ttl_seconds
+        self._mappings = {}
+        self._users_index = {}
+        self._users_loaded_at = None
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_synced = False
+        # Concurrent misses on the same ID share one read
+        self._flights = SingleFlight(copy_results=False)
+        self.hits = 0
+        self.misses = 0
+        self.network_reads = 0
+        self.users_refreshes = 0
+        # Bumped on every change to the mappings mirror
+        self.version = 0
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+    def resolve(self, simple_id):
+        """Return the UID for an upper-case simple ID, or None"""
+        uid = self._mappings.get(simple_id) or self._users_index.get(simple_id)
+        if uid:
+            self.hits += 1
+            return uid
+
+        self.misses += 1
+
+        # Once the listener has synced, the mapping dict mirrors the database
+        if not self._listener_synced:
+            uid, shared = self._flights.do(simple_id, lambda: store.get(f"patient_mappings/{simple_id}"))
+            if not shared:
+                self.network_reads += 1
+            if uid:
+                self.remember(simple_id, uid)
+                return uid
+
+        # Fall back to users/*/patientId, re-downloading it at most once per TTL
+        if self._users_index_stale():
+            self.refresh_users_index()
+        return self._users_index.get(simple_id)
+
+    def remember(self, simple_id, uid):
+        """Record a mapping we just wrote (or read) ourselves"""
+        with self._lock:
+            if self._mappings.get(simple_id.upper()) != uid:
+                self._mappings[simple_id.upper()] = uid
+                self.version += 1
+
+    def forget(self, simple_id):
+        with self._lock:
+            self._mappings.pop(simple_id.upper(), None)
+            self._users_index.pop(simple_id.upper(), None)
+            self.version += 1
+
+    def mappings(self):
+        """Snapshot of the live patient_mappings mirror"""
+        with self._lock:
+            return dict(self._mappings)
+
+    @property
+    def synced(self):
+        """True once the listener has delivered patient_mappings"""
+        return self._listener_synced
+
+    # -------------------------------------------------------------------------
+    # users/*/patientId index
+    # -------------------------------------------------------------------------
+    def _users_index_stale(self):
+        return (self._users_loaded_at is None or
+                time.time() - self._users_loaded_at > self.users_ttl_seconds)
+
+    def refresh_users_index(self):
+        """Rebuild the patientId -> UID index from the users tree"""
+        self.network_reads += 1
+        self.users_refreshes += 1
+        users = store.get("users") or {}
+        index = {}
+        for uid, user_data in users.items():
+            patient_id = (user_data or {}).get("patientId")
+            if patient_id:
+                index[str(patient_id).upper()] = uid
+        with self._lock:
+            self._users_index = index
+            self._users_loaded_at = time.time()
+
+    # -------------------------------------------------------------------------
+    # Live invalidation
+    # -------------------------------------------------------------------------
+    def start_listener(self):
+        """Mirror patient_mappings with a Firebase listener (falls back to per-miss reads)"""
+        try:
+            self._listener = store.listen("patient_mappings", self._on_mappings_event)
+            print("Patient ID cache: listening to patient_mappings")
+        except Exception as e:
+            self._listener = None
+            print(f"WARNING: Patient ID cache listener unavailable, using reads on miss: {e}")
+
+    def stop_listener(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            self._listener_synced = False
+
+    def _on_mappings_event(self, event):
+        """Apply a put/patch event from the patient_mappings listener"""
+        path = event.path.strip("/")
+        data = event.data
+        with self._lock:
+            if not path:
+                if event.event_type == "put":
+                    self._mappings = {}
+                for simple_id, uid in (data or {}).items():
+                    if uid:
+                        self._mappings[simple_id.upper()] = uid
+                    else:
+                        self._mappings.pop(simple_id.upper(), None)
+            else:
+                simple_id = path.split("/")[0].upper()
+                if data:
+                    self._mappings[simple_id] = data
+                else:
+                    self._mappings.pop(simple_id, None)
+            self._listener_synced = True
+            self.version += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "network_reads": self.network_reads,
+            "users_index_refreshes": self.users_refreshes,
+            "mappings_cached": len(self._mappings),
+            "users_index_size": len(self._users_index),
+            "listening": self._listener_synced,
+        }
+
+
+class PatientDirectory(object):
+    """
+    Sorted patient list for /get_all_patients, served from memory.
+
+    patient_mappings comes from the PatientIdCache mirror and patient_info
+    from a listener of its own. The list and its content hash (used for the
+    ETag) are rebuilt only when either side changed. Paging is a bisect.
+    Until both listeners have synced, listing() reads the store like before.
+    """
+
+    def __init__(self, id_cache, sort_key):
+        self.id_cache = id_cache
+        self.sort_key = sort_key
+        self._info = {}
+        self._info_version = 0
+        self._info_synced = False
+        self._listener = None
+        self._lock = threading.Lock()
+        self._built_for = None
+        self._listing = None
+        self.rebuilds = 0
+        self.store_reads = 0
+
+    def start_listener(self):
+        try:
+            self._listener = store.listen("patient_info", self._on_info_event)
+            print("Patient directory: listening to patient_info")
+        except Exception as e:
+            self._listener = None
+            print(f"WARNING: Patient directory listener unavailable, reading on every call: {e}")
+
+    def stop_listener(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            self._info_synced = False
+
+    def _on_info_event(self, event):
+        """Apply a put/patch on patient_info (whole tree, one patient or one field)"""
+        parts = [part for part in event.path.split("/") if part]
+        with self._lock:
+            if event.event_type == "patch":
+                for key, value in (event.data or {}).items():
+                    self._put_info(parts + [part for part in key.split("/") if part], value)
+            else:
+                self._put_info(parts, event.data)
+            self._info_version += 1
+            self._info_synced = True
+
+    def _put_info(self, parts, data):
+        """Set patient_info/<parts> to data (None deletes)"""
+        if not parts:
+            self._info = {simple_id: info for simple_id, info in (data or {}).items() if isinstance(info, dict)}
+        elif len(parts) == 1:
+            if isinstance(data, dict):
+                self._info[parts[0]] = data
+            else:
+                self._info.pop(parts[0], None)
+        else:
+            info = dict(self._info.get(parts[0]) or {})
+            if data is None:
+                info.pop(parts[1], None)
+            else:
+                info[parts[1]] = data
+            self._info[parts[0]] = info
+
+    # -------------------------------------------------------------------------
+    # Listing
+    # -------------------------------------------------------------------------
+    def listing(self):
+        """(content hash, sorted simple IDs, their sort keys, {simple_id: row})"""
+        if not (self._info_synced and self.id_cache.synced):
+            self.store_reads += 1
+            return self._build(store.get("patient_mappings") or {}, store.get("patient_info") or {})
+        with self._lock:
+            built_for = (self.id_cache.version, self._info_version)
+            if self._built_for == built_for:
+                return self._listing
+            info = dict(self._info)
+        listing = self._build(self.id_cache.mappings(), info)
+        with self._lock:
+            self._built_for = built_for
+            self._listing = listing
+        return listing
+
+    def _build(self, mappings, patient_info):
+        self.rebuilds += 1
+        simple_ids = sorted((simple_id for simple_id, uid in mappings.items() if uid), key=self.sort_key)
+        rows = {}
+        digest = hashlib.sha1()
+        for simple_id in simple_ids:
+            info = patient_info.get(simple_id) or {}
+            row = {
+                "simple_id": simple_id,
+                "firebase_uid": mappings[simple_id],
+                "name": info.get("name", "Unknown"),
+                "email": info.get("email", ""),
+            }
+            rows[simple_id] = row
+            digest.update(f"{simple_id}\0{row['firebase_uid']}\0{row['name']}\0{row['email']}\n".encode())
+        return digest.hexdigest()[:20], simple_ids, [self.sort_key(simple_id) for simple_id in simple_ids], rows
+
+    def page(self, limit=None, after=None, listing=None):
+        """
+        (content hash, rows, total, next_after) for one page of the sorted
+        list; pass a listing() already taken to page that same snapshot.
+        """
+        content_hash, simple_ids, keys, rows = listing if listing is not None else self.listing()
+        start = bisect.bisect_right(keys, self.sort_key(after.upper())) if after else 0
+        end = len(simple_ids) if limit is None else min(len(simple_ids), start + limit)
+        next_after = simple_ids[end - 1] if end < len(simple_ids) and end > start else None
+        return content_hash, [rows[simple_id] for simple_id in simple_ids[start:end]], len(simple_ids), next_after
+
+    def stats(self):
+        return {
+            "listening": self._info_synced and self.id_cache.synced,
+            "patients_info_cached": len(self._info),
+            "rebuilds": self.rebuilds,
+            "store_reads": self.store_reads,
+        }
@@ -0,0 +1,213 @@
+# backend/patient_index.py
+"""
+Reverse Indexes and ID Allocation for Patients
+==============================================
+Maintained nodes that turn signup-time scans into single-key reads:
+
+    patient_index/by_uid/{uid}          -> simple ID (P1, P2, ...)
+    patient_index/by_email/{email_key}  -> Firebase UID
+    counters/patient_id                 -> highest P<n> handed out
+    patient_index/claims/{uid}          -> P<n> being (or already) assigned
+
+New IDs come from a transactional counter (O(1), safe under concurrent
+signups). The mapping, patient_info, users/{uid} fields and indexes are
+then written in ONE multi-path update. Existing data is indexed and the
+counter seeded once with:
+
+    python patient_index.py backfill
+"""
+
+import sys
+from urllib.parse import quote
+
+from datastore import store
+
+INDEX_ROOT = "patient_index"
+COUNTER_PATH = "counters/patient_id"
+BACKFILL_CHUNK = 500
+
+
+def normalize_email(email):
+    """Emails match case-insensitively everywhere (index keys and fallbacks)"""
+    return email.strip().lower()
+
+
+def email_key(email):
+    """Firebase-safe key for an email (keys cannot contain . $ # [ ] /)"""
+    return quote(normalize_email(email), safe="@").replace(".", "%2E")
+
+
+def index_updates(simple_id=None, uid=None, email=None):
+    """Multi-path update entries (relative to the root) that index one patient"""
+    updates = {}
+    if uid and simple_id:
+        updates[f"{INDEX_ROOT}/by_uid/{uid}"] = simple_id
+    if uid and email:
+        updates[f"{INDEX_ROOT}/by_email/{email_key(email)}"] = uid
+    return updates
+
+
+def lookup_simple_id(uid):
+    """Simple ID already assigned to a UID, or None - single-key reads only"""
+    simple_id = store.get(f"{INDEX_ROOT}/by_uid/{uid}")
+    if simple_id:
+        return simple_id
+    # Users that were not indexed yet still carry users/{uid}/patientId
+    return store.get(f"users/{uid}/patientId")
+
+
+def lookup_uid_by_email(email):
+    """
+    UID of the user with this email (any case), or None. Users that are not
+    indexed yet are found with a server-side query; /users is scanned only
+    when that query is unavailable (no RTDB index), never for an unknown
+    email. A match is indexed so the next lookup is a single-key read.
+    """
+    uid = store.get(f"{INDEX_ROOT}/by_email/{email_key(email)}")
+    if uid:
+        return uid
+    try:
+        uid = _query_uid_by_email(email)
+    except Exception as e:
+        print(f"WARNING: users email query unavailable ({e}), scanning /users instead")
+        uid = _scan_uid_by_email(email)
+    if uid:
+        store.update(index_updates(uid=uid, email=email))
+    return uid
+
+
+def _query_uid_by_email(email):
+    """
+    Server-side equality query. Needs ".indexOn": ["email"] on /users in the
+    RTDB rules (see PROJECT_GUIDE.md); without it Firebase rejects the query
+    and the error propagates. None means no such user. The query is exact,
+    so the email as given and lower-cased are both tried (stored emails of
+    any other case are only found once indexed).
+    """
+    wanted = normalize_email(email)
+    for value in dict.fromkeys([email.strip(), wanted]):
+        matches = store.query_equal("users", "email", value) or {}
+        for uid, user_data in matches.items():
+            if normalize_email((user_data or {}).get("email") or "") == wanted:
+                return uid
+    return None
+
+
+def _scan_uid_by_email(email):
+    """Download /users and match case-insensitively (pre-index behaviour)"""
+    wanted = normalize_email(email)
+    for uid, user_data in (store.get("users") or {}).items():
+        if normalize_email((user_data or {}).get("email") or "") == wanted:
+            return uid
+    return None
+
+
+def max_assigned_number():
+    """Highest N among existing P<N> keys (only needed to seed the counter)"""
+    keys = store.get("patient_mappings", shallow=True) or {}
+    max_patient_num = 0
+    for simple_id in keys:
+        if simple_id.startswith("P") and simple_id[1:].isdigit():
+            max_patient_num = max(max_patient_num, int(simple_id[1:]))
+    return max_patient_num
+
+
+def allocate_patient_number():
+    """Hand out the next patient number with a transaction on counters/patient_id"""
+    seed = max_assigned_number() if store.get(COUNTER_PATH) is None else 0
+    return store.transaction(COUNTER_PATH, lambda current: (current if current is not None else seed) + 1)
+
+
+def assign_new_patient_id(uid, name, email, user_fields=None, max_attempts=5):
+    """
+    Allocate P<n> for uid and write patient_mappings, patient_info,
+    users/{uid} and the indexes in ONE multi-path update.
+    Returns (simple_id, created) - created is False when a concurrent
+    request already gave this UID an ID (that ID is returned instead).
+
+    A transaction on patient_index/claims/{uid} makes sure concurrent
+    signups for one UID agree on a single ID. Nothing else is written
+    before the update, so a failed write leaves only the claim behind. The
+    claim is released on error. After a crash, the next call for the UID
+    finds the claim without a mapping and finishes the write with that ID.
+    """
+    for _ in range(max_attempts):
+        new_simple_id = f"P{allocate_patient_number()}"
+
+        # Skip numbers written outside the allocator (e.g. demo patients)
+        if store.get(f"patient_mappings/{new_simple_id}") is not None:
+            continue
+
+        # Claim the UID: only the first concurrent signup picks the ID
+        claim_path = f"{INDEX_ROOT}/claims/{uid}"
+        claimed = store.transaction(claim_path, lambda current: current or new_simple_id)
+        if claimed != new_simple_id:
+            if store.get(f"patient_mappings/{claimed}") == uid:
+                return claimed, False
+            # Claimed by a request that is still writing or that crashed;
+            # writing the same ID again is harmless either way
+            new_simple_id = claimed
+
+        updates = {
+            f"patient_mappings/{new_simple_id}": uid,
+            f"patient_info/{new_simple_id}": {"name": name, "email": email, "uid": uid},
+            f"users/{uid}/patientId": new_simple_id,
+        }
+        for field, value in (user_fields or {}).items():
+            updates[f"users/{uid}/{field}"] = value
+        updates.update(index_updates(simple_id=new_simple_id, uid=uid, email=email))
+        try:
+            store.update(updates)
+        except Exception:
+            store.transaction(claim_path, lambda current: None if current == new_simple_id else current)
+            raise
+        return new_simple_id, True
+
+    raise RuntimeError(f"Could not allocate a free patient ID after {max_attempts} attempts")
+
+
+def backfill():
+    """Build both indexes from patient_mappings and users (one-off)"""
+    mappings = store.get("patient_mappings") or {}
+    users = store.get("users") or {}
+
+    updates = {}
+    for simple_id, uid in mappings.items():
+        if uid:
+            updates.update(index_updates(simple_id=simple_id, uid=uid))
+    for uid, user_data in users.items():
+        user_data = user_data or {}
+        patient_id = user_data.get("patientId")
+        if patient_id and f"{INDEX_ROOT}/by_uid/{uid}" not in updates:
+            updates.update(index_updates(simple_id=patient_id, uid=uid))
+        if user_data.get("email"):
+            updates.update(index_updates(uid=uid, email=user_data["email"]))
+
+    items = list(updates.items())
+    for start in range(0, len(items), BACKFILL_CHUNK):
+        store.update(dict(items[start:start + BACKFILL_CHUNK]))
+
+    by_uid = sum(1 for path in updates if path.startswith(f"{INDEX_ROOT}/by_uid/"))
+    print(f"[OK] Indexed {by_uid} UIDs and {len(updates) - by_uid} emails")
+
+    # Never move the counter backwards
+    highest = max_assigned_number()
+    counter = store.transaction(COUNTER_PATH, lambda current: max(current or 0, highest))
+    print(f"[OK] Patient ID counter at P{counter}")
+    return updates
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("Usage: python patient_index.py backfill   (build indexes + seed ID counter)")
+        sys.exit(1)
+
+    import os
+    os.environ["ENABLE_SCHEDULER"] = "0"
+    os.environ["ENABLE_WORKER"] = "0"
+    os.environ["RESOLVER_LISTEN"] = "0"
+    os.environ["TIMESERIES_MIRROR"] = "0"
+    # Same store and credentials as the API (FIREBASE_CREDENTIALS or firebase_key.json)
+    import app
+
+    backfill()
@@ -0,0 +1,105 @@
+# backend/result_cache.py
+"""
+Prediction Result Cache
+=======================
+Dashboards poll every few seconds while a patient's reading and trend
+window rarely change between polls. Results are cached as the final JSON
+bytes under a fingerprint of (endpoint, model version, patient, exact
+model input), so an identical request is answered without touching the
+models. A new model version or any change in the input is a new key.
+
+Entries expire after `ttl_seconds`; the least recently used are evicted
+once `max_bytes` is exceeded.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def fingerprint(*parts):
+    """sha1 over the parts; NumPy arrays contribute dtype, shape and raw bytes"""
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(part.tobytes())
+        elif isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """Key -> JSON bytes with TTL and a byte budget (LRU eviction)"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl_seconds=60):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def get(self, key):
+        """Cached JSON bytes for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            body, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= len(body)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += len(body)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (body, time.time())
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+            "ttl_seconds": self.ttl_seconds,
+        }
@@ -0,0 +1,81 @@
+# backend/risk_profiles.py
+"""
+Simulated Watch Readings by Risk Level
+======================================
+The low / moderate / high risk levels used by create_demo_patients.py,
+as per-metric (mean, std, min, max) for the six watch variables. Draws
+are vectorized: one call produces readings for any number of patients,
+each with its own risk level.
+"""
+
+import numpy as np
+
+METRICS = ("heartRate", "steps", "calories", "distance", "sleepHours", "workout")
+INTEGER_METRICS = ("heartRate", "steps", "calories", "workout")
+
+# metric: (mean, std, min, max)
+RISK_PROFILES = {
+    "low": {
+        "heartRate": (68, 6, 50, 95),
+        "steps": (9000, 2000, 3000, 20000),
+        "calories": (380, 60, 150, 700),
+        "distance": (6.5, 1.5, 1.5, 15.0),
+        "sleepHours": (7.6, 0.6, 5.5, 9.5),
+        "workout": (40, 15, 0, 120),
+    },
+    "moderate": {
+        "heartRate": (82, 8, 58, 110),
+        "steps": (5500, 1500, 1000, 12000),
+        "calories": (280, 50, 100, 500),
+        "distance": (4.0, 1.0, 0.5, 9.0),
+        "sleepHours": (6.4, 0.8, 4.0, 8.5),
+        "workout": (20, 10, 0, 60),
+    },
+    "high": {
+        "heartRate": (98, 10, 65, 140),
+        "steps": (2500, 1000, 200, 7000),
+        "calories": (180, 40, 60, 350),
+        "distance": (1.8, 0.7, 0.1, 5.0),
+        "sleepHours": (5.0, 1.0, 2.5, 7.5),
+        "workout": (5, 5, 0, 30),
+    },
+}
+RISK_LEVELS = tuple(RISK_PROFILES)
+
+# (levels, metrics) parameter tables, rows in RISK_LEVELS order
+_MEAN, _STD, _MIN, _MAX = (
+    np.array([[RISK_PROFILES[level][metric][i] for metric in METRICS] for level in RISK_LEVELS], dtype=np.float64)
+    for i in range(4)
+)
+_ROUNDING = np.array([0 if metric in INTEGER_METRICS else 1 if metric == "sleepHours" else 2
+                      for metric in METRICS])
+
+
+def level_index(levels):
+    """Risk level names -> row indexes into the profile tables (ValueError if unknown)"""
+    try:
+        return np.array([RISK_LEVELS.index(level) for level in levels], dtype=np.intp)
+    except ValueError:
+        raise ValueError(f"Unknown risk level (use {', '.join(RISK_LEVELS)})")
+
+
+def draw_readings(level_indexes, rng=None):
+    """(n, 6) readings, one row per patient, drawn from each patient's profile"""
+    rng = rng if rng is not None else np.random.default_rng()
+    level_indexes = np.asarray(level_indexes, dtype=np.intp)
+    values = rng.standard_normal((len(level_indexes), len(METRICS)))
+    values = _MEAN[level_indexes] + values * _STD[level_indexes]
+    return np.clip(values, _MIN[level_indexes], _MAX[level_indexes])
+
+
+def to_reading(row):
+    """One draw_readings() row -> reading dict with watch-like types"""
+    reading = {}
+    for metric, value, digits in zip(METRICS, row, _ROUNDING):
+        reading[metric] = int(round(value)) if digits == 0 else round(float(value), int(digits))
+    return reading
+
+
+def simulated_reading(risk_level="low", rng=None):
+    """A single reading for one patient"""
+    return to_reading(draw_readings(level_index([risk_level]), rng)[0])
@@ -0,0 +1,267 @@
+# backend/scheduler.py
+"""
+Deterioration Scheduler - precompute trend results at day rollover
+=================================================================
+Deterioration status only changes when a new day enters a patient's
+window, so instead of scoring on every dashboard request a background
+thread:
+
+1. every `interval_seconds` checks patients' newest history day
+2. queues the patients whose newest day changed since they were checked,
+   highest last-known severity first (Severe before Stable)
+3. scores the queue in batches and hands the results to `publish`
+   (app.py writes them to predictions/{uid}/deterioration)
+
+Which patients are checked (each check is one read per patient without
+TIMESERIES_DB):
+- with the change feed (listen_for_changes(), a health_data listener),
+  every patient on the first pass, then only patients whose data changed.
+  Opt-in (SCHEDULER_LISTEN=1): on Firebase the root listener downloads
+  the whole health_data tree, full histories included, on every connect
+- without it, every mapped patient, round-robin, at most `max_checks`
+  per interval (0 = all of them every interval)
+
+Patients skipped for insufficient history count as checked for that day,
+so they are not refetched until a new day arrives.
+A batch whose scoring or publish raises goes back in the queue and is
+retried on the next pass.
+
+The scoring, listing and publishing functions come from app.py so the
+scheduler uses exactly the same pipeline as /detect_deterioration_bulk.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from datastore import store
+
+
+class DeteriorationScheduler(object):
+    """Priority queue of patients whose trend window gained a day"""
+
+    def __init__(self, list_patients, latest_days, score_batch, publish,
+                 interval_seconds=300, batch_size=64, max_checks=0):
+        """
+        list_patients() -> [(simple_id, uid)]
+        latest_days(uids) -> {uid: newest history date key or None}
+        score_batch([(simple_id, uid)]) -> {uid: result dict}
+        publish({uid: result dict}) -> None
+        """
+        self.list_patients = list_patients
+        self.latest_days = latest_days
+        self.score_batch = score_batch
+        self.publish = publish
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.max_checks = max_checks
+
+        self._queue = []
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._scored_day = {}
+        self._severity = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Change feed: uids whose data changed since they were last checked
+        self._changed = set()
+        self._listener = None
+        self._snapshot_seen = False
+        self._full_pass_done = False
+        self._cursor = 0
+
+        self.runs = 0
+        self.scored = 0
+        self.skipped = 0
+        self.checks = 0
+        self.last_run_at = None
+        self.last_run_seconds = None
+        self.last_error = None
+
+    # -------------------------------------------------------------------------
+    # Queue
+    # -------------------------------------------------------------------------
+    def enqueue(self, simple_id, uid, day=None):
+        """Queue a patient; higher last-known severity is popped first"""
+        with self._lock:
+            if uid in self._queued:
+                return
+            priority = -self._severity.get(uid, 0)
+            heapq.heappush(self._queue, (priority, next(self._sequence), simple_id, uid, day))
+            self._queued.add(uid)
+
+    def _pop_batch(self):
+        with self._lock:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                _, _, simple_id, uid, day = heapq.heappop(self._queue)
+                self._queued.discard(uid)
+                batch.append((simple_id, uid, day))
+            return batch
+
+    # -------------------------------------------------------------------------
+    # One pass
+    # -------------------------------------------------------------------------
+    def _patients_to_check(self):
+        """The [(simple_id, uid)] to check this pass (see module docstring)"""
+        patients = self.list_patients()
+        if self._listener is not None and self._full_pass_done:
+            with self._lock:
+                changed = self._changed
+                self._changed = set()
+            patients = [(simple_id, uid) for simple_id, uid in patients if uid in changed]
+            if self.max_checks and len(patients) > self.max_checks:
+                with self._lock:
+                    self._changed.update(uid for _, uid in patients[self.max_checks:])
+                patients = patients[:self.max_checks]
+            return patients
+        if not self.max_checks or len(patients) <= self.max_checks:
+            self._full_pass_done = True
+            return patients
+        # Round-robin through the full list, max_checks at a time
+        start = self._cursor % len(patients)
+        batch = (patients[start:] + patients[:start])[:self.max_checks]
+        self._cursor = start + self.max_checks
+        if self._cursor >= len(patients):
+            self._full_pass_done = True
+        return batch
+
+    def find_rollovers(self):
+        """Queue the checked patients whose newest history day changed since scoring"""
+        patients = self._patients_to_check()
+        newest = self.latest_days([uid for _, uid in patients]) if patients else {}
+        self.checks += len(patients)
+        queued = 0
+        for simple_id, uid in patients:
+            day = newest.get(uid)
+            if day is not None and day != self._scored_day.get(uid):
+                self.enqueue(simple_id, uid, day)
+                queued += 1
+        return queued
+
+    def drain(self):
+        """Score everything queued, most severe first, batch by batch"""
+        scored = 0
+        while True:
+            batch = self._pop_batch()
+            if not batch:
+                return scored
+            try:
+                results = self.score_batch([(simple_id, uid) for simple_id, uid, _ in batch])
+                for _, uid, day in batch:
+                    if uid in results:
+                        results[uid]["history_day"] = day
+                if results:
+                    self.publish(results)
+            except Exception:
+                # Back in the queue at the same severity, retried next pass
+                for simple_id, uid, day in batch:
+                    self.enqueue(simple_id, uid, day)
+                raise
+            with self._lock:
+                for _, uid, day in batch:
+                    # Skipped (e.g. too little history) still counts as done for this day
+                    self._scored_day[uid] = day
+                    if uid in results:
+                        self._severity[uid] = results[uid]["detection"]["deterioration_status"]["severity"]
+            self.skipped += len(batch) - len(results)
+            scored += len(results)
+
+    def run_once(self):
+        start = time.time()
+        try:
+            queued = self.find_rollovers()
+            scored = self.drain()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"ERROR in deterioration scheduler: {e}")
+            return 0
+        finally:
+            self.runs += 1
+            self.last_run_at = start
+            self.last_run_seconds = time.time() - start
+        self.scored += scored
+        if queued:
+            print(f"Deterioration scheduler: {queued} patients rolled over, {scored} rescored "
+                  f"in {self.last_run_seconds:.2f}s")
+        return scored
+
+    # -------------------------------------------------------------------------
+    # Change feed
+    # -------------------------------------------------------------------------
+    def notify(self, uid):
+        """Mark uid as changed (checked on the next pass)"""
+        with self._lock:
+            self._changed.add(uid)
+
+    def _on_event(self, event):
+        """Map a health_data put/patch event to the patients it touched"""
+        path = event.path.strip("/")
+        if not path:
+            if event.event_type == "put" and not self._snapshot_seen:
+                # Initial sync delivers the whole tree - the first full pass covers it
+                self._snapshot_seen = True
+                return
+            uids = {key.split("/")[0] for key in (event.data or {})}
+        else:
+            uids = {path.split("/")[0]}
+        for uid in uids:
+            self.notify(uid)
+
+    def listen_for_changes(self):
+        """Check only changed patients after the first pass (falls back to sweeps)"""
+        try:
+            self._listener = store.listen("health_data", self._on_event)
+            print("Deterioration scheduler: listening to health_data for changed patients")
+        except Exception as e:
+            self._listener = None
+            print(f"WARNING: Deterioration scheduler change feed unavailable, sweeping all patients: {e}")
+
+    # -------------------------------------------------------------------------
+    # Background thread
+    # -------------------------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="deterioration-scheduler", daemon=True)
+        self._thread.start()
+        print(f"Deterioration scheduler: checking for new days every {self.interval_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval_seconds)
+
+    def stats(self):
+        severities = list(self._severity.values())
+        return {
+            "running": self._thread is not None,
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "scored": self.scored,
+            "skipped": self.skipped,
+            "patients_checked": self.checks,
+            "change_feed": self._listener is not None,
+            "changed_pending": len(self._changed),
+            "max_checks": self.max_checks,
+            "queued": len(self._queue),
+            "patients_tracked": len(self._scored_day),
+            "severe_patients": sum(1 for severity in severities if severity >= 2),
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": round(self.last_run_seconds, 3) if self.last_run_seconds is not None else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,233 @@
+# backend/simulation.py
+"""
+Server-Side Simulation Engine
+=============================
+Simulated patients (started with /start_simulation) each produce a
+reading every `interval_seconds`, drawn from their risk profile. All of
+them share ONE thread and ONE hashed timer wheel:
+
+- the wheel has `wheel_size` slots of `tick_seconds`; a patient sits in
+  the slot of its next reading (plus whole revolutions for intervals
+  longer than the wheel)
+- each tick only looks at its own slot, so per-tick cost follows the
+  number of readings due, not the number of simulated patients
+- the readings due in a tick are drawn in one vectorized call and handed
+  to `emit` together (app.py feeds them to the ingest buffer)
+
+Stopped patients are dropped lazily when their slot comes round, and
+their index is then reused.
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+from risk_profiles import RISK_LEVELS, draw_readings, level_index
+
+
+class SimulationEngine(object):
+    """Timer wheel of simulated patients with vectorized reading draws"""
+
+    def __init__(self, emit, tick_seconds=0.1, wheel_size=512, max_patients=100000, rng=None,
+                 max_interval_seconds=86400):
+        """emit(uids, rows) receives the (n, 6) readings due in one tick"""
+        self.emit = emit
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self.max_patients = max_patients
+        self.max_interval_seconds = max_interval_seconds
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self._wheel = [[] for _ in range(wheel_size)]
+        self._position = 0
+        self._index = {}     # uid -> slot index into the arrays below
+        self._uids = []
+        self._free = []
+        self._levels = np.zeros(0, dtype=np.intp)
+        self._interval_ticks = np.zeros(0, dtype=np.int64)
+        self._rounds = np.zeros(0, dtype=np.int64)
+        self._active = np.zeros(0, dtype=bool)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.readings = 0
+        self.errors = 0
+        self.last_error = None
+        self._busy_seconds = 0.0
+        self._cpu_seconds = 0.0
+        self._started_at = None
+
+    # -------------------------------------------------------------------------
+    # Patients
+    # -------------------------------------------------------------------------
+    def start_patient(self, uid, risk_level="low", interval_seconds=5.0):
+        """
+        Simulate uid (or change its profile/interval if already simulated).
+        Raises ValueError for a bad profile/interval, OverflowError when
+        max_patients are already simulated.
+        """
+        if risk_level not in RISK_LEVELS:
+            raise ValueError(f"risk_level must be one of {', '.join(RISK_LEVELS)}")
+        if not (math.isfinite(interval_seconds)
+                and self.tick_seconds <= interval_seconds <= self.max_interval_seconds):
+            raise ValueError(f"interval_seconds must be between {self.tick_seconds} and "
+                             f"{self.max_interval_seconds}")
+        interval_ticks = max(1, int(round(interval_seconds / self.tick_seconds)))
+        with self._lock:
+            i = self._index.get(uid)
+            if i is None:
+                if len(self._index) >= self.max_patients:
+                    raise OverflowError(f"At most {self.max_patients} simulated patients")
+                i = self._allocate(uid)
+                # Random first delay spreads new patients over their interval
+                self._schedule(i, int(self.rng.integers(1, interval_ticks + 1)))
+            self._levels[i] = level_index([risk_level])[0]
+            self._interval_ticks[i] = interval_ticks
+        self.start()
+
+    def stop_patient(self, uid):
+        """Stop simulating uid; False if it was not simulated"""
+        with self._lock:
+            i = self._index.pop(uid, None)
+            if i is None:
+                return False
+            self._active[i] = False
+            return True
+
+    def stop_all(self):
+        with self._lock:
+            stopped = len(self._index)
+            self._active[list(self._index.values())] = False
+            self._index.clear()
+        return stopped
+
+    def patients(self):
+        """{uid: {"risk_level", "interval_seconds"}}"""
+        with self._lock:
+            return {uid: {"risk_level": RISK_LEVELS[self._levels[i]],
+                          "interval_seconds": round(float(self._interval_ticks[i]) * self.tick_seconds, 3)}
+                    for uid, i in self._index.items()}
+
+    def _allocate(self, uid):
+        if self._free:
+            i = self._free.pop()
+            self._uids[i] = uid
+        else:
+            i = len(self._uids)
+            self._uids.append(uid)
+            if i >= len(self._active):
+                capacity = max(1024, 2 * len(self._active))
+                self._levels = np.resize(self._levels, capacity)
+                self._interval_ticks = np.resize(self._interval_ticks, capacity)
+                self._rounds = np.resize(self._rounds, capacity)
+                self._active = np.concatenate([self._active, np.zeros(capacity - len(self._active), dtype=bool)])
+        self._active[i] = True
+        self._index[uid] = i
+        return i
+
+    def _schedule(self, i, delay_ticks):
+        """Put index i in the slot delay_ticks ahead of the current one"""
+        self._wheel[(self._position + delay_ticks) % self.wheel_size].append(i)
+        self._rounds[i] = (delay_ticks - 1) // self.wheel_size
+
+    # -------------------------------------------------------------------------
+    # Ticks
+    # -------------------------------------------------------------------------
+    def tick(self):
+        """Advance the wheel one slot and emit the readings that are due"""
+        with self._lock:
+            self._position = (self._position + 1) % self.wheel_size
+            slot = self._wheel[self._position]
+            if not slot:
+                self.ticks += 1
+                return 0
+            self._wheel[self._position] = []
+            indexes = np.array(slot, dtype=np.intp)
+
+            stopped = indexes[~self._active[indexes]]
+            self._free.extend(stopped.tolist())
+            indexes = indexes[self._active[indexes]]
+
+            waiting = self._rounds[indexes] > 0
+            self._rounds[indexes[waiting]] -= 1
+            self._wheel[self._position].extend(indexes[waiting].tolist())
+
+            due = indexes[~waiting]
+            for i, delay in zip(due.tolist(), self._interval_ticks[due].tolist()):
+                self._schedule(i, delay)
+            uids = [self._uids[i] for i in due.tolist()]
+            levels = self._levels[due]
+            self.ticks += 1
+
+        if not uids:
+            return 0
+        rows = draw_readings(levels, self.rng)
+        try:
+            self.emit(uids, rows)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"ERROR in simulation tick: {e}")
+            return 0
+        self.readings += len(uids)
+        return len(uids)
+
+    def _loop(self):
+        next_tick = time.monotonic() + self.tick_seconds
+        while not self._stop.is_set():
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+                continue
+            if delay < -self.tick_seconds:
+                self.late_ticks += 1
+            busy_start, cpu_start = time.perf_counter(), time.thread_time()
+            self.tick()
+            self._busy_seconds += time.perf_counter() - busy_start
+            self._cpu_seconds += time.thread_time() - cpu_start
+            next_tick += self.tick_seconds
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._loop, name="simulation-wheel", daemon=True)
+            self._thread.start()
+        print(f"Simulation engine: timer wheel running ({self.wheel_size} x {self.tick_seconds}s slots)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        running_seconds = time.time() - self._started_at if self._started_at else 0
+        with self._lock:
+            by_level = np.bincount(self._levels[list(self._index.values())], minlength=len(RISK_LEVELS))
+            patients = len(self._index)
+        return {
+            "running": self._thread is not None,
+            "patients": patients,
+            "patients_by_risk": dict(zip(RISK_LEVELS, by_level.tolist())),
+            "tick_seconds": self.tick_seconds,
+            "wheel_size": self.wheel_size,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "readings_generated": self.readings,
+            "readings_per_second": round(self.readings / running_seconds, 2) if running_seconds else None,
+            "avg_tick_ms": round(self._busy_seconds / self.ticks * 1000, 3) if self.ticks else None,
+            "cpu_percent": round(100 * self._cpu_seconds / running_seconds, 2) if running_seconds else None,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
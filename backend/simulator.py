@@ -1,25 +1,36 @@
 # simulator.py
-import requests
-import time
+"""
+Health Data Simulator - every patient uploads a reading every 5 seconds.
+
+Thin wrapper around loadgen.py: /users is read ONCE at start-up (not every
+cycle), then each patient becomes a virtual watch whose readings follow
+its riskLevel (low when unset). Sends are concurrent over pooled
+connections, so it keeps up with thousands of patients. Ctrl+C prints
+the throughput / latency report.
+"""
+
+import numpy as np
 from firebase_admin import credentials, db, initialize_app
 
+from loadgen import ENDPOINTS, LoadGenerator, VirtualWatches, print_report
+from risk_profiles import RISK_LEVELS, level_index
+
+API_URL = "http://127.0.0.1:5000"
+INTERVAL_SECONDS = 5
+
 # Initialize Firebase admin so we can read /users
 cred = credentials.Certificate("firebase_key.json")
 initialize_app(cred, {
     "databaseURL": "https://health-sync-dev-default-rtdb.firebaseio.com/"
 })
 
-while True:
-    users_ref = db.reference("users")
-    users = users_ref.get() or {}
-
-    for uid, user_data in users.items():
-        if user_data.get("role") == "patient":
-            try:
-                # Call Flask endpoint to push a single reading for this patient UID
-                response = requests.get(f"http://127.0.0.1:5000/send_data", params={"patient_id": uid}, timeout=5)
-                print(uid, response.json())
-            except Exception as e:
-                print(f"Error calling send_data for {uid}: {e}")
+users = db.reference("users").get() or {}
+patients = {uid: user_data.get("riskLevel") for uid, user_data in users.items()
+            if user_data.get("role") == "patient"}
+levels = level_index([risk if risk in RISK_LEVELS else "low" for risk in patients.values()])
+print(f"Simulating {len(patients)} patients, one reading every {INTERVAL_SECONDS}s each")
 
-    time.sleep(5)
+uploads_only = np.array([1.0 if endpoint == "send_data" else 0.0 for endpoint in ENDPOINTS])
+watches = VirtualWatches(list(patients), levels, INTERVAL_SECONDS, np.random.default_rng())
+generator = LoadGenerator(API_URL, watches, uploads_only, concurrency=16)
+print_report(generator.run(duration=0, report_every=30))
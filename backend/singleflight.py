@@ -0,0 +1,79 @@
+# backend/singleflight.py
+"""
+Request Coalescing (single-flight)
+==================================
+When several threads ask for the same key at the same time, only the
+first (the leader) runs the work; the others wait for it and receive a
+copy of its result (or its exception). Nothing is cached once the call
+finishes - that is what the window and result caches are for.
+"""
+
+import copy
+import threading
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Deduplicate concurrent calls that share a key"""
+
+    def __init__(self, copy_results=True):
+        self.copy_results = copy_results
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers with this key.
+        Returns (result, shared) - shared is True for callers that waited
+        on another thread's call. Followers get a deep copy of the result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return (copy.deepcopy(call.result) if self.copy_results else call.result), True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        # Followers copy call.result after we return - keep it pristine
+        if call.waiters and self.copy_results:
+            return copy.deepcopy(call.result), False
+        return call.result, False
+
+    def stats(self):
+        calls = self.leaders + self.shared
+        return {
+            "executions": self.leaders,
+            "coalesced": self.shared,
+            "coalesced_rate": round(self.shared / calls, 4) if calls else None,
+            "in_flight": len(self._calls),
+        }
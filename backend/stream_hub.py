@@ -0,0 +1,207 @@
+# backend/stream_hub.py
+"""
+Live Prediction Streams (Server-Sent Events)
+============================================
+One upstream watcher per patient, any number of subscribers:
+
+- the first subscriber for a patient opens a listener on
+  health_data/{uid}/current (or a poller when listeners are unavailable)
+- each time the reading actually changes, the payload is computed ONCE
+  and fanned out to every subscriber's queue
+- the last subscriber leaving closes the watcher
+
+Idle subscribers are just a thread blocked on a queue plus a heartbeat
+comment every `heartbeat_seconds`. Slow clients drop their oldest
+message instead of growing memory.
+"""
+
+import hashlib
+import json
+import queue
+import threading
+import time
+
+from datastore import store
+
+
+def reading_fingerprint(reading):
+    return hashlib.sha1(json.dumps(reading, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class PatientStream(object):
+    """Upstream watcher + subscriber queues for one patient"""
+
+    def __init__(self, hub, uid):
+        self.hub = hub
+        self.uid = uid
+        self.subscribers = set()
+        self.reading = None
+        self.fingerprint = None
+        self.last_message = None
+        self._watcher = None
+        self._poller_stop = threading.Event()
+        self._lock = threading.Lock()
+        # start() runs outside the hub lock: stop() waits for it, and a stop
+        # that wins the race keeps start() from opening anything
+        self._upstream_lock = threading.Lock()
+        self._stopped = False
+
+    # -------------------------------------------------------------------------
+    # Upstream
+    # -------------------------------------------------------------------------
+    def start(self):
+        path = f"health_data/{self.uid}/current"
+        with self._upstream_lock:
+            if self._stopped:
+                # The last subscriber already left
+                return
+            try:
+                self._watcher = store.listen(path, self._on_event)
+            except Exception as e:
+                print(f"Stream {self.uid}: listener unavailable ({e}), polling every {self.hub.poll_seconds}s")
+                threading.Thread(target=self._poll, args=(path,), name=f"stream-poll-{self.uid}",
+                                 daemon=True).start()
+
+    def stop(self):
+        with self._upstream_lock:
+            self._stopped = True
+            self._poller_stop.set()
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+    def _poll(self, path):
+        while not self._poller_stop.is_set():
+            try:
+                self.reading_changed(store.get(path))
+            except Exception as e:
+                print(f"Stream {self.uid}: poll failed: {e}")
+            self._poller_stop.wait(self.hub.poll_seconds)
+
+    def _on_event(self, event):
+        """Apply a put/patch event on .../current to our copy of the reading"""
+        path = event.path.strip("/")
+        with self._lock:
+            reading = dict(self.reading or {})
+        if not path:
+            if event.event_type == "put":
+                reading = event.data
+            else:
+                reading.update(event.data or {})
+        else:
+            reading[path.split("/")[0]] = event.data
+        self.reading_changed(reading)
+
+    # -------------------------------------------------------------------------
+    # Fan-out
+    # -------------------------------------------------------------------------
+    def reading_changed(self, reading):
+        """Compute + broadcast only if the reading differs from the last one"""
+        self.hub.upstream_events += 1
+        if not reading:
+            return
+        fingerprint = reading_fingerprint(reading)
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            self.reading = reading
+            self.fingerprint = fingerprint
+        try:
+            payload = self.hub.compute(self.uid, reading)
+        except Exception as e:
+            print(f"Stream {self.uid}: prediction failed: {e}")
+            return
+        self.hub.payloads_computed += 1
+        message = f"event: prediction\ndata: {json.dumps(payload, default=str)}\n\n"
+        with self._lock:
+            self.last_message = message
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self.hub.deliver(subscriber, message)
+
+
+class StreamHub(object):
+    """Registry of PatientStreams with fan-out / client metrics"""
+
+    def __init__(self, compute, heartbeat_seconds=15, poll_seconds=5, queue_size=16):
+        """compute(uid, reading) -> JSON-serializable payload"""
+        self.compute = compute
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.upstream_events = 0
+        self.payloads_computed = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.connections_total = 0
+
+    def subscribe(self, uid):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            stream = self._streams.get(uid)
+            new_stream = stream is None
+            if new_stream:
+                stream = self._streams[uid] = PatientStream(self, uid)
+            stream.subscribers.add(subscriber)
+            self.connections_total += 1
+        if new_stream:
+            stream.start()
+        elif stream.last_message is not None:
+            # Late joiners get the latest payload straight away
+            self.deliver(subscriber, stream.last_message)
+        return subscriber
+
+    def unsubscribe(self, uid, subscriber):
+        with self._lock:
+            stream = self._streams.get(uid)
+            if stream is None:
+                return
+            stream.subscribers.discard(subscriber)
+            if stream.subscribers:
+                return
+            del self._streams[uid]
+        stream.stop()
+
+    def deliver(self, subscriber, message):
+        """Non-blocking put; a full queue drops its oldest message"""
+        while True:
+            try:
+                subscriber.put_nowait(message)
+                self.messages_sent += 1
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    self.messages_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def events(self, uid, subscriber):
+        """SSE body generator for one client: payloads + heartbeat comments"""
+        try:
+            yield f"retry: {int(self.heartbeat_seconds * 1000)}\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    yield f": heartbeat {int(time.time())}\n\n"
+        finally:
+            self.unsubscribe(uid, subscriber)
+
+    def stats(self):
+        with self._lock:
+            clients = {uid: len(stream.subscribers) for uid, stream in self._streams.items()}
+        fanout = self.messages_sent / self.payloads_computed if self.payloads_computed else None
+        return {
+            "patients_streaming": len(clients),
+            "clients": sum(clients.values()),
+            "clients_per_patient": clients,
+            "connections_total": self.connections_total,
+            "upstream_events": self.upstream_events,
+            "payloads_computed": self.payloads_computed,
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "fanout_ratio": round(fanout, 2) if fanout is not None else None,
+        }
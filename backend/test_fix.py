@@ -30,9 +30,9 @@ def get_workout_minutes(data):
 # Shah's UID from mapping
 shah_uid = "PMtPmMkVdzaYdG9M8Xc1DjrMAaZ2"
 
-# Get history data
+# Get the last 6 days of history (ordered, limited query - not the whole history)
 history_ref = db.reference(f"health_data/{shah_uid}/history")
-history_data = history_ref.get()
+history_data = history_ref.order_by_key().limit_to_last(6).get()
 
 # Get current data
 current_ref = db.reference(f"health_data/{shah_uid}/current")
@@ -0,0 +1,375 @@
+# backend/timeseries_store.py
+"""
+Indexed Time-Series Store for health history
+============================================
+A local SQLite mirror of health_data/{uid}/history with one typed row per
+patient-day:
+
+    readings(uid, date, heart_rate, steps, calories, distance,
+             sleep_hours, workout_minutes)   PRIMARY KEY (uid, date)
+
+Range, last-N and multi-patient window queries are index seeks that
+return (dates, float64 (days, 6) rows) already in date order, so readers
+no longer download JSON dicts and sort their keys in Python.
+
+TimeseriesMirror keeps the table in step with the primary store: a
+catch-up sync per patient (only days at/after the newest mirrored date,
+or everything with full=True) on a background thread, repeated every
+`resync_seconds`, plus the days the API's ingest flush writes
+(apply_days). start(listen=True) also follows the health_data root for
+live changes, but on Firebase that listener downloads the whole tree,
+full histories included, on every connect and reconnect. Enable it in
+the API with TIMESERIES_DB=<file>, or run it apart:
+
+    python timeseries_store.py sync [--full]   # one-off catch-up
+    python timeseries_store.py follow          # catch-up, then mirror live
+"""
+
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from datastore import split_path, store
+
+COLUMNS = ("heart_rate", "steps", "calories", "distance", "sleep_hours", "workout_minutes")
+N_METRICS = len(COLUMNS)
+# Bound on "?" parameters per IN (...) query
+QUERY_CHUNK = 500
+
+
+def _rows_to_arrays(rows):
+    """[(date, *metrics)] -> (dates, float64 (n, 6) array)"""
+    dates = [row[0] for row in rows]
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), N_METRICS)
+    return dates, values
+
+
+class TimeseriesStore(object):
+    """One typed row per (uid, date) in a SQLite file"""
+
+    def __init__(self, path="timeseries.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " uid TEXT NOT NULL, date TEXT NOT NULL, "
+            + ", ".join(f"{column} REAL NOT NULL" for column in COLUMNS)
+            + ", PRIMARY KEY (uid, date)) WITHOUT ROWID"
+        )
+        self._select = "SELECT date, " + ", ".join(COLUMNS) + " FROM readings"
+        self._upsert = ("INSERT OR REPLACE INTO readings (uid, date, " + ", ".join(COLUMNS)
+                        + ") VALUES (?, ?, " + ", ".join("?" * N_METRICS) + ")")
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def upsert(self, uid, days):
+        """Insert or overwrite [(date, row of 6 metrics)] for one patient"""
+        records = [(uid, date_key) + tuple(float(value) for value in row) for date_key, row in days]
+        if records:
+            with self._lock:
+                self._transaction(lambda conn: conn.executemany(self._upsert, records))
+        return len(records)
+
+    def replace(self, uid, days):
+        """Make [(date, row)] the patient's complete history"""
+        records = [(uid, date_key) + tuple(float(value) for value in row) for date_key, row in days]
+
+        def write(conn):
+            conn.execute("DELETE FROM readings WHERE uid = ?", (uid,))
+            conn.executemany(self._upsert, records)
+        with self._lock:
+            self._transaction(write)
+        return len(records)
+
+    def delete(self, uid, date_key=None):
+        """Drop one day, or the whole patient when date_key is None"""
+        with self._lock:
+            if date_key is None:
+                self._conn.execute("DELETE FROM readings WHERE uid = ?", (uid,))
+            else:
+                self._conn.execute("DELETE FROM readings WHERE uid = ? AND date = ?", (uid, date_key))
+
+    def _transaction(self, fn):
+        self._conn.execute("BEGIN")
+        try:
+            fn(self._conn)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    # -------------------------------------------------------------------------
+    # Queries - every result is (dates, (days, 6) array), oldest first
+    # -------------------------------------------------------------------------
+    def range(self, uid, start=None, end=None):
+        """Days with start <= date <= end (either bound optional)"""
+        query, params = self._select + " WHERE uid = ?", [uid]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(end)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY date", params).fetchall()
+        return _rows_to_arrays(rows)
+
+    def since(self, uid, date_key):
+        return self.range(uid, start=date_key)
+
+    def last(self, uid, n):
+        """Newest n days"""
+        if n <= 0:
+            return _rows_to_arrays([])
+        with self._lock:
+            rows = self._conn.execute(
+                self._select + " WHERE uid = ? ORDER BY date DESC LIMIT ?", (uid, n)).fetchall()
+        return _rows_to_arrays(rows[::-1])
+
+    def windows(self, uids, n):
+        """{uid: newest n days} for many patients in one read transaction"""
+        windows = {}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for uid in uids:
+                    rows = self._conn.execute(
+                        self._select + " WHERE uid = ? ORDER BY date DESC LIMIT ?", (uid, n)
+                    ).fetchall() if n > 0 else []
+                    windows[uid] = _rows_to_arrays(rows[::-1])
+            finally:
+                self._conn.execute("COMMIT")
+        return windows
+
+    def latest_dates(self, uids):
+        """{uid: newest mirrored date or None}"""
+        uids = list(uids)
+        latest = dict.fromkeys(uids)
+        with self._lock:
+            for i in range(0, len(uids), QUERY_CHUNK):
+                chunk = uids[i:i + QUERY_CHUNK]
+                rows = self._conn.execute(
+                    "SELECT uid, MAX(date) FROM readings WHERE uid IN (%s) GROUP BY uid"
+                    % ",".join("?" * len(chunk)), chunk)
+                latest.update(rows)
+        return latest
+
+    def stats(self):
+        with self._lock:
+            days, patients = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT uid) FROM readings").fetchone()
+        return {"path": self.path, "patients": patients, "days": days}
+
+
+class TimeseriesMirror(object):
+    """Copies health_data/*/history from the primary store into a TimeseriesStore"""
+
+    def __init__(self, timeseries, to_row, resync_seconds=0):
+        """
+        to_row(day dict) -> [heartRate, steps, calories, distance, sleepHours, workout]
+        resync_seconds: repeat the catch-up this often (0 = once at start)
+        """
+        self.timeseries = timeseries
+        self.to_row = to_row
+        self.resync_seconds = resync_seconds
+        self._listener = None
+        self._snapshot_seen = False
+        self._stop = threading.Event()
+        self._thread = None
+        # Set once the first catch-up finished; readers should not trust the table before
+        self.ready = threading.Event()
+        self.days_synced = 0
+        self.events = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_sync_at = None
+
+    def _days(self, history):
+        return [(date_key, self.to_row(day_data)) for date_key, day_data in sorted((history or {}).items())
+                if isinstance(day_data, dict)]
+
+    # -------------------------------------------------------------------------
+    # Catch-up
+    # -------------------------------------------------------------------------
+    def sync_patient(self, uid, full=False, latest=None):
+        """Mirror one patient's history (only days >= `latest` unless full)"""
+        path = f"health_data/{uid}/history"
+        if full or latest is None:
+            count = self.timeseries.replace(uid, self._days(store.get(path)))
+        else:
+            count = self.timeseries.upsert(uid, self._days(store.get_since(path, latest)))
+        self.days_synced += count
+        return count
+
+    def sync_all(self, full=False):
+        """Catch up every patient under health_data; returns days written"""
+        start = time.time()
+        uids = list(store.get("health_data", shallow=True) or {})
+        latest = self.timeseries.latest_dates(uids)
+        written = 0
+        for uid in uids:
+            if self._stop.is_set():
+                break
+            try:
+                written += self.sync_patient(uid, full=full, latest=latest.get(uid))
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"Timeseries mirror: sync of {uid} failed: {e}")
+        self.last_sync_at = time.time()
+        print(f"Timeseries mirror: {written} days from {len(uids)} patients "
+              f"in {self.last_sync_at - start:.2f}s")
+        return written
+
+    # -------------------------------------------------------------------------
+    # Live changes
+    # -------------------------------------------------------------------------
+    def apply_days(self, days, complete=lambda reading: True):
+        """
+        Mirror history days we just wrote ourselves ({(uid, date): reading}).
+        Days whose reading is not complete(reading) only had some fields
+        written, so they are re-read from the store.
+        """
+        by_uid = {}
+        for (uid, date_key), reading in days.items():
+            if not complete(reading):
+                self.sync_day(uid, date_key)
+                continue
+            by_uid.setdefault(uid, []).append((date_key, self.to_row(reading)))
+        for uid, rows in by_uid.items():
+            self.days_synced += self.timeseries.upsert(uid, sorted(rows))
+
+    def _on_event(self, event):
+        self.events += 1
+        parts = split_path(event.path)
+        try:
+            if not parts and event.event_type == "put" and not self._snapshot_seen:
+                # Initial sync delivers the whole tree - sync_all() covers it
+                self._snapshot_seen = True
+                return
+            if event.event_type == "patch":
+                for key, value in (event.data or {}).items():
+                    self._apply(parts + split_path(key), value)
+            else:
+                self._apply(parts, event.data)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"Timeseries mirror: could not apply change at {event.path}: {e}")
+
+    def _apply(self, parts, data):
+        """Apply a put of `data` at health_data/<parts>"""
+        if not parts:
+            for uid, node in (data or {}).items():
+                self._apply([uid], node)
+            return
+        uid = parts[0]
+        if len(parts) == 1:
+            history = data.get("history") if isinstance(data, dict) else None
+            self.days_synced += self.timeseries.replace(uid, self._days(history))
+        elif parts[1] != "history":
+            return
+        elif len(parts) == 2:
+            self.days_synced += self.timeseries.replace(uid, self._days(data))
+        elif len(parts) > 3:
+            # A single field changed - re-read the whole day
+            self.sync_day(uid, parts[2])
+        else:
+            self._put_day(uid, parts[2], data)
+
+    def sync_day(self, uid, date_key):
+        """Re-read one history day from the store (after a write of some of its fields)"""
+        self._put_day(uid, date_key, store.get(f"health_data/{uid}/history/{date_key}"))
+
+    def _put_day(self, uid, date_key, data):
+        if isinstance(data, dict):
+            self.days_synced += self.timeseries.upsert(uid, [(date_key, self.to_row(data))])
+        else:
+            self.timeseries.delete(uid, date_key)
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+    def start(self, listen=False):
+        """Catch up on a background thread; listen=True also follows health_data"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        if listen:
+            # Listen first so nothing written during the catch-up is missed
+            self._snapshot_seen = False
+            self._listener = store.listen("health_data", self._on_event)
+        self._thread = threading.Thread(target=self._loop, name="timeseries-sync", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_all()
+                if not self._stop.is_set():
+                    self.ready.set()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"Timeseries mirror: catch-up failed: {e}")
+            if not self.resync_seconds:
+                return
+            self._stop.wait(self.resync_seconds)
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        stats = self.timeseries.stats()
+        stats.update({
+            "following": self._listener is not None,
+            "ready": self.ready.is_set(),
+            "resync_seconds": self.resync_seconds,
+            "days_synced": self.days_synced,
+            "events": self.events,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_sync_at": self.last_sync_at,
+        })
+        return stats
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("sync", "follow"):
+        print("Usage: python timeseries_store.py sync [--full]   (one-off catch-up into TIMESERIES_DB)")
+        print("       python timeseries_store.py follow          (catch-up, then mirror live changes)")
+        sys.exit(1)
+
+    os.environ.setdefault("TIMESERIES_DB", "timeseries.db")
+    os.environ["TIMESERIES_MIRROR"] = "0"
+    os.environ["ENABLE_SCHEDULER"] = "0"
+    os.environ["ENABLE_WORKER"] = "0"
+    import app
+
+    if sys.argv[1] == "sync":
+        app.timeseries_mirror.sync_all(full="--full" in sys.argv[2:])
+        sys.exit(0)
+
+    # No /send_data traffic reaches this process, so follow the database
+    app.timeseries_mirror.start(listen=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Timeseries mirror: {app.timeseries_mirror.stats()}")
+    except KeyboardInterrupt:
+        app.timeseries_mirror.stop()
@@ -19,6 +19,7 @@ Author: Health Sync FYP Project
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 from sklearn.cluster import KMeans
@@ -28,6 +29,8 @@ import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from trend_features import calculate_trend_features, calculate_trend_features_batch
+
 # Paths
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
 DATASET_PATH = os.path.join(BASE_PATH, "..", "ML model doc", "mturkfitbit_export_4.12.16-5.12.16", "Fitabase Data 4.12.16-5.12.16")
@@ -97,7 +100,7 @@ def create_trend_features(df, window_size=7):
 
     feature_cols = ['AvgHeartRate', 'TotalSteps', 'Calories', 'TotalDistance', 'SleepHours', 'ActiveMinutes']
 
-    all_trend_features = []
+    all_windows = []
     all_user_ids = []
 
     # Group by user
@@ -107,61 +110,21 @@ def create_trend_features(df, window_size=7):
         if len(user_data) < window_size:
             continue
 
-        # Create trend features for each window
-        for i in range(len(user_data) - window_size + 1):
-            window = user_data.iloc[i:i+window_size][feature_cols].values
-            trend_features = calculate_trend_features(window, feature_cols)
-            all_trend_features.append(trend_features)
-            all_user_ids.append(user_id)
-
-    print(f"Created {len(all_trend_features)} trend feature vectors")
-
-    return np.array(all_trend_features), all_user_ids
-
-
-def calculate_trend_features(window, feature_names):
-    """
-    Extract TREND features from a time window
-    These features capture: Is health DECLINING or STABLE?
-    """
-    features = []
-
-    for i, name in enumerate(feature_names):
-        col_data = window[:, i]
+        # Every sliding window of this user: (n_windows, window_size, 6)
+        values = user_data[feature_cols].values.astype(np.float64)
+        windows = sliding_window_view(values, window_size, axis=0).transpose(0, 2, 1)
+        all_windows.append(windows)
+        all_user_ids.extend([user_id] * len(windows))
 
-        # 1. Mean (average level)
-        features.append(np.mean(col_data))
+    # Trend features for all windows in one vectorized pass
+    if all_windows:
+        X_trends = calculate_trend_features_batch(np.concatenate(all_windows))
+    else:
+        X_trends = np.empty((0, len(feature_cols) * 6))
 
-        # 2. Standard Deviation (variability)
-        features.append(np.std(col_data))
+    print(f"Created {len(X_trends)} trend feature vectors")
 
-        # 3. Trend Slope (is it increasing/decreasing?)
-        x = np.arange(len(col_data))
-        if np.std(col_data) > 0:
-            slope = np.polyfit(x, col_data, 1)[0]
-        else:
-            slope = 0
-        features.append(slope)
-
-        # 4. Change Rate (end vs start)
-        if col_data[0] != 0:
-            change_rate = (col_data[-1] - col_data[0]) / col_data[0]
-        else:
-            change_rate = 0
-        features.append(change_rate)
-
-        # 5. Recent value (most recent day)
-        features.append(col_data[-1])
-
-        # 6. Trend consistency (how consistent is the decline/improvement)
-        diffs = np.diff(col_data)
-        if len(diffs) > 0:
-            trend_consistency = np.mean(diffs)
-        else:
-            trend_consistency = 0
-        features.append(trend_consistency)
-
-    return np.array(features)
+    return X_trends, all_user_ids
 
 
 def train_deterioration_detector(X_trends):
@@ -391,8 +354,6 @@ def test_deterioration_detection():
     with open('trend_cluster_names.pkl', 'rb') as f:
         cluster_names = pickle.load(f)
 
-    feature_names = ['AvgHeartRate', 'TotalSteps', 'Calories', 'TotalDistance', 'SleepHours', 'ActiveMinutes']
-
     # Test Case 1: DECLINING health (should detect deterioration)
     declining_week = np.array([
         [75, 8000, 2000, 6.0, 7.5, 45],  # Day 1 - Good
@@ -437,7 +398,7 @@ def test_deterioration_detection():
         print("-" * 50)
 
         # Calculate trend features
-        trend_features = calculate_trend_features(week_data, feature_names)
+        trend_features = calculate_trend_features(week_data)
 
         # Isolation Forest detection
         X_det = det_scaler.transform([trend_features])
@@ -0,0 +1,224 @@
+# backend/trend_features.py
+"""
+Trend Feature Extraction - shared by training and serving
+=========================================================
+36 features per window: for each of the 6 watch metrics
+[mean, std, slope, change rate, recent value, mean day-to-day diff].
+
+The x-axis of every window is always 0..days-1, so instead of one
+np.polyfit least-squares solve per column the slope has a fixed closed
+form, and the mean of np.diff telescopes to (last - first) / (days - 1).
+A whole (N, days, 6) batch is a handful of vectorized reductions.
+"""
+
+from collections import deque
+
+import numpy as np
+
+# Column order of every window (matches the FitBit training data)
+FEATURE_COLUMNS = ['AvgHeartRate', 'TotalSteps', 'Calories', 'TotalDistance', 'SleepHours', 'ActiveMinutes']
+
+# Statistics computed per column, in feature order
+TREND_STATS = ['mean', 'std', 'slope', 'change_rate', 'recent', 'consistency']
+
+
+def trend_feature_names():
+    """Names of the 36 features, in the order the pickled scalers expect"""
+    return [f"{column}_{stat}" for column in FEATURE_COLUMNS for stat in TREND_STATS]
+
+
+def calculate_trend_features_batch(windows):
+    """
+    Extract trend features from N windows at once.
+    windows: (N, days, 6) array -> (N, 36) feature matrix.
+    Same features and order as training - consistency is critical for ML.
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    n_windows, n_days, n_metrics = windows.shape
+
+    # 1. Mean (average level) / 2. Standard Deviation (variability)
+    means = windows.mean(axis=1)
+    stds = windows.std(axis=1)
+
+    # 3. Trend Slope: least squares against x = 0..days-1 in closed form
+    #    slope = sum((x - x_mean) * y) / sum((x - x_mean)^2)
+    x_centered = np.arange(n_days) - (n_days - 1) / 2.0
+    x_var = np.dot(x_centered, x_centered)
+    if x_var > 0:
+        slopes = np.einsum('d,ndm->nm', x_centered, windows) / x_var
+        slopes = np.where(stds > 0, slopes, 0.0)
+    else:
+        slopes = np.zeros_like(means)
+
+    # 4. Change Rate (end vs start) / 5. Recent value (most recent day)
+    first = windows[:, 0, :]
+    last = windows[:, -1, :]
+    change_rates = np.divide(last - first, first, out=np.zeros_like(first), where=first != 0)
+
+    # 6. Trend consistency: mean of day-to-day diffs telescopes
+    if n_days > 1:
+        mean_diffs = (last - first) / (n_days - 1)
+    else:
+        mean_diffs = np.zeros_like(first)
+
+    features = np.stack([means, stds, slopes, change_rates, last, mean_diffs], axis=2)
+    return features.reshape(n_windows, n_metrics * len(TREND_STATS))
+
+
+def calculate_trend_features(window):
+    """
+    Extract trend features from a single (days, 6) window
+    Same calculation as training - consistency is critical for ML
+    """
+    return calculate_trend_features_batch(np.asarray(window)[np.newaxis])[0]
+
+
+class RollingTrendState(object):
+    """
+    Sliding-window trend features for one patient, updated in O(1).
+
+    Keeps the window rows plus three running sums per metric - sum(y),
+    sum(y^2) and sum(i * y) with i = 0..n-1 - from which all 36 features
+    follow without touching the rows:
+        mean  = S / n
+        std   = sqrt(Q / n - mean^2)
+        slope = (W - (n - 1) / 2 * S) / (n (n^2 - 1) / 12)
+    Change rate, recent value and mean diff only need the first/last rows.
+    Sums are recomputed from the rows every RESYNC_EVERY updates so
+    floating-point drift never accumulates.
+    """
+
+    RESYNC_EVERY = 256
+    # Variance below this (relative to mean^2) is round-off of a flat series
+    FLAT_TOLERANCE = 1e-12
+
+    def __init__(self, max_days=7, rows=None):
+        self.max_days = max_days
+        self._rows = deque()
+        self._sum = np.zeros(len(FEATURE_COLUMNS))
+        self._sumsq = np.zeros(len(FEATURE_COLUMNS))
+        self._weighted = np.zeros(len(FEATURE_COLUMNS))
+        self._updates = 0
+        for row in rows if rows is not None else []:
+            self.push(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    # -------------------------------------------------------------------------
+    # Updates (all O(1))
+    # -------------------------------------------------------------------------
+    def push(self, row):
+        """Append the newest day, dropping the oldest when the window is full"""
+        if len(self._rows) == self.max_days:
+            self.drop_oldest()
+        y = np.asarray(row, dtype=np.float64)
+        self._weighted += len(self._rows) * y
+        self._sum += y
+        self._sumsq += y * y
+        self._rows.append(y)
+        self._updated()
+
+    def drop_oldest(self):
+        """Remove the oldest day; every remaining index shifts down by one"""
+        y = self._rows.popleft()
+        self._sum -= y
+        self._sumsq -= y * y
+        self._weighted -= self._sum
+        self._updated()
+        return y
+
+    def pop_last(self):
+        """Remove the newest day"""
+        y = self._rows.pop()
+        self._weighted -= len(self._rows) * y
+        self._sum -= y
+        self._sumsq -= y * y
+        self._updated()
+        return y
+
+    def replace_last(self, row):
+        """Overwrite the newest day (e.g. today's reading was updated)"""
+        y = np.asarray(row, dtype=np.float64)
+        old = self._rows[-1]
+        delta = y - old
+        self._weighted += (len(self._rows) - 1) * delta
+        self._sum += delta
+        self._sumsq += y * y - old * old
+        self._rows[-1] = y
+        self._updated()
+
+    def _updated(self):
+        self._updates += 1
+        if self._updates >= self.RESYNC_EVERY:
+            self.resync()
+
+    def resync(self):
+        """Recompute the running sums exactly from the rows"""
+        self._updates = 0
+        if not self._rows:
+            self._sum[:] = self._sumsq[:] = self._weighted[:] = 0.0
+            return
+        rows = self.window()
+        self._sum = rows.sum(axis=0)
+        self._sumsq = (rows * rows).sum(axis=0)
+        self._weighted = np.arange(len(rows)) @ rows
+
+    # -------------------------------------------------------------------------
+    # Features
+    # -------------------------------------------------------------------------
+    def window(self):
+        """Current window rows, oldest first, as an (n, 6) array"""
+        return np.array(self._rows, dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+
+    def features(self, pad_to=None):
+        """
+        The 36-feature vector of calculate_trend_features(window).
+        pad_to: treat the window as front-padded with copies of the oldest
+        day up to pad_to days (same as the serving-side pad_window).
+        """
+        n = len(self._rows)
+        if n == 0:
+            raise ValueError("RollingTrendState is empty")
+        first = self._rows[0]
+        last = self._rows[-1]
+        S, Q, W = self._sum, self._sumsq, self._weighted
+
+        pad = max(0, (pad_to or n) - n)
+        if pad:
+            # k copies of `first` in front: every existing index shifts by k
+            W = W + pad * S + first * (pad * (pad - 1) / 2.0)
+            S = S + pad * first
+            Q = Q + pad * first * first
+            n += pad
+
+        means = S / n
+        variances = np.maximum(Q / n - means * means, 0.0)
+        variances[variances <= self.FLAT_TOLERANCE * np.maximum(means * means, 1.0)] = 0.0
+        stds = np.sqrt(variances)
+
+        x_var = n * (n * n - 1) / 12.0
+        if x_var > 0:
+            slopes = np.where(stds > 0, (W - (n - 1) / 2.0 * S) / x_var, 0.0)
+        else:
+            slopes = np.zeros_like(means)
+
+        change_rates = np.divide(last - first, first, out=np.zeros_like(first), where=first != 0)
+        mean_diffs = (last - first) / (n - 1) if n > 1 else np.zeros_like(first)
+
+        return np.stack([means, stds, slopes, change_rates, last, mean_diffs], axis=1).reshape(-1)
+
+    # -------------------------------------------------------------------------
+    # Serialization
+    # -------------------------------------------------------------------------
+    def to_dict(self):
+        return {"max_days": self.max_days, "rows": self.window().tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild from to_dict() output (sums are recomputed exactly)"""
+        state = cls(max_days=data["max_days"])
+        for row in data["rows"]:
+            state._rows.append(np.asarray(row, dtype=np.float64))
+        state.resync()
+        return state
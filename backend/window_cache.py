@@ -0,0 +1,411 @@
+# backend/window_cache.py
+"""
+Hot Window Cache - recent readings per patient
+==============================================
+Keeps each active patient's last 30 history days as a compact float32
+(days, 6) block with its date index, plus the latest `current` reading,
+so a warm /detect_deterioration or /predict_health does no network I/O
+and no per-field dict parsing.
+
+- Entries are fresh for `ttl_seconds`; after that only the history days
+  newer than the last cached date (and the current reading) are fetched
+  and appended in place.
+- Least recently used patients are evicted once the memory budget is hit.
+- apply_reading() lets in-process writers update a cached patient directly.
+- Each entry has its own lock: writers (refresh, apply_reading) and
+  readers (trend_rows, trend_features) never see a half-applied update.
+  Store reads happen before the lock is taken.
+- Every entry carries a RollingTrendState over its trend window (last
+  history days + current), updated in O(1) as days/readings arrive.
+- save()/load() snapshot the cache to a JSON file so a restart only has
+  to fetch what changed since the snapshot.
+- With a TimeseriesStore, history comes from its indexed rows instead of
+  health_data JSON (only `current` is read from the primary store).
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from datastore import store
+from singleflight import SingleFlight
+from trend_features import RollingTrendState
+
+N_METRICS = 6
+# Rough per-entry cost beyond the NumPy block (dict, date keys, current reading)
+ENTRY_OVERHEAD_BYTES = 2048
+
+
+class PatientWindow(object):
+    """Last `capacity` history days of one patient as a float32 block"""
+
+    __slots__ = ("dates", "block", "current", "current_row", "fetched_at", "trend", "lock")
+
+    def __init__(self, capacity, trend_days=7):
+        # Reentrant: out-of-order days rebuild the trend from trend_rows()
+        self.lock = threading.RLock()
+        self.dates = []
+        self.block = np.zeros((capacity, N_METRICS), dtype=np.float32)
+        self.current = None
+        self.current_row = None
+        self.fetched_at = 0.0
+        # Trend window: last (trend_days - 1) history days + the current reading
+        self.trend = RollingTrendState(trend_days)
+
+    @property
+    def capacity(self):
+        return self.block.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.block.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def append_day(self, date_key, row):
+        """Add (or overwrite) one history day, dropping the oldest when full"""
+        with self.lock:
+            self._append_day(date_key, row)
+
+    def _append_day(self, date_key, row):
+        n_days = len(self.dates)
+        if n_days and date_key == self.dates[-1]:
+            self.block[n_days - 1] = row
+            self._trend_replace_day(self.block[n_days - 1])
+            return
+        if n_days and date_key < self.dates[-1]:
+            # Out-of-order day (rare): slot it in by date
+            position = bisect.bisect_left(self.dates, date_key)
+            if position < n_days and self.dates[position] == date_key:
+                self.block[position] = row
+                self.rebuild_trend()
+                return
+            rows = np.insert(self.block[:n_days], position, row, axis=0)[-self.capacity:]
+            self.dates.insert(position, date_key)
+            self.dates = self.dates[-self.capacity:]
+            self.block[:len(rows)] = rows
+            self.rebuild_trend()
+            return
+        if n_days == self.capacity:
+            self.block[:-1] = self.block[1:]
+            self.dates.pop(0)
+            n_days -= 1
+        self.block[n_days] = row
+        self.dates.append(date_key)
+        self._trend_push_day(self.block[n_days])
+
+    def set_current(self, reading, row):
+        row = np.asarray(row, dtype=np.float32)
+        with self.lock:
+            if self.current_row is not None:
+                self.trend.replace_last(row)
+            else:
+                self.trend.push(row)
+            self.current = reading
+            self.current_row = row
+
+    def clear_current(self):
+        with self.lock:
+            if self.current_row is not None:
+                self.trend.pop_last()
+            self.current = self.current_row = None
+
+    # -------------------------------------------------------------------------
+    # Trend window upkeep - history days sit in front of the current reading
+    # -------------------------------------------------------------------------
+    def _trend_push_day(self, row):
+        history_days = self.trend.max_days - 1
+        if self.current_row is not None:
+            self.trend.pop_last()
+        if len(self.trend) >= history_days:
+            self.trend.drop_oldest()
+        if history_days > 0:
+            self.trend.push(row)
+        if self.current_row is not None:
+            self.trend.push(self.current_row)
+
+    def _trend_replace_day(self, row):
+        if self.current_row is not None:
+            self.trend.pop_last()
+        if len(self.trend) and self.trend.max_days > 1:
+            self.trend.replace_last(row)
+        if self.current_row is not None:
+            self.trend.push(self.current_row)
+
+    def rebuild_trend(self):
+        """Recreate the trend state from the block (after out-of-order days)"""
+        with self.lock:
+            self.trend = RollingTrendState(self.trend.max_days, self.trend_rows(self.trend.max_days - 1))
+
+    def trend_features(self, pad_to=None):
+        """36 trend features of trend_rows(), from the rolling state"""
+        with self.lock:
+            return self.trend.features(pad_to=pad_to)
+
+    def trend_rows(self, history_days):
+        """Last history_days history rows + the current reading, oldest first (a copy)"""
+        with self.lock:
+            n_days = len(self.dates)
+            history = self.block[max(0, n_days - history_days):n_days] if history_days > 0 else self.block[:0]
+            if self.current_row is not None:
+                return np.vstack([history, self.current_row])
+            return history.copy()
+
+    def trend_snapshot(self, history_days, pad_to=None):
+        """
+        (trend_rows(history_days), trend_features(pad_to)) taken under one lock
+        hold, so both describe the same readings. Features are None while the
+        entry has no rows.
+        """
+        with self.lock:
+            rows = self.trend_rows(history_days)
+            features = self.trend.features(pad_to=pad_to) if len(self.trend) else None
+            return rows, features
+
+    def to_dict(self):
+        """Consistent copy of the entry for save()"""
+        with self.lock:
+            n_days = len(self.dates)
+            return {
+                "dates": list(self.dates),
+                "rows": self.block[:n_days].tolist(),
+                "current": self.current,
+                "fetched_at": self.fetched_at,
+                "trend": self.trend.to_dict(),
+            }
+
+
+class WindowCache(object):
+    """LRU of PatientWindow entries under a byte budget"""
+
+    def __init__(self, to_row, max_bytes=64 * 1024 * 1024, ttl_seconds=30, days=30, trend_days=7,
+                 timeseries=None, timeseries_ready=None):
+        """timeseries_ready() -> False while the time-series store is still catching up (read the store)"""
+        self.to_row = to_row
+        self.timeseries = timeseries
+        self.timeseries_ready = timeseries_ready
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.days = days
+        self.trend_days = trend_days
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Entries are shared by design, so waiters get the same object
+        self._flights = SingleFlight(copy_results=False)
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+    def get(self, uid):
+        """Fresh PatientWindow for uid (loads or tops it up when needed)"""
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None:
+                self._entries.move_to_end(uid)
+
+        if entry is not None and time.time() - entry.fetched_at <= self.ttl_seconds:
+            self.hits += 1
+            return entry
+
+        # Concurrent requests for the same patient share one load/refresh
+        entry, _ = self._flights.do(uid, lambda: self._fill(uid))
+        return entry
+
+    def _fill(self, uid):
+        with self._lock:
+            entry = self._entries.get(uid)
+        if entry is None:
+            self.misses += 1
+            entry = self._load(uid)
+            self._store(uid, entry)
+        elif time.time() - entry.fetched_at > self.ttl_seconds:
+            self.refreshes += 1
+            self._refresh(uid, entry)
+        else:
+            # Another thread refreshed it just before we got here
+            self.hits += 1
+        return entry
+
+    def trend_rows(self, uid, history_days):
+        return self.get(uid).trend_rows(history_days)
+
+    def current(self, uid):
+        """Latest health_data/{uid}/current reading (dict) or None"""
+        return self.get(uid).current
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+    def _history_timeseries(self):
+        if self.timeseries_ready is not None and not self.timeseries_ready():
+            return None
+        return self.timeseries
+
+    def _load(self, uid):
+        entry = PatientWindow(self.days, self.trend_days)
+        timeseries = self._history_timeseries()
+        if timeseries is not None:
+            self._append_rows(entry, *timeseries.last(uid, self.days))
+        else:
+            self._append_history(entry, store.get_last(f"health_data/{uid}/history", self.days) or {})
+        self._set_current(entry, store.get(f"health_data/{uid}/current"))
+        entry.fetched_at = time.time()
+        return entry
+
+    def _refresh(self, uid, entry):
+        """Fetch only days at/after the last cached date, plus the current reading"""
+        with entry.lock:
+            last_date = entry.dates[-1] if entry.dates else None
+        timeseries = self._history_timeseries()
+        if timeseries is not None:
+            if last_date:
+                dates, rows = timeseries.since(uid, last_date)
+            else:
+                dates, rows = timeseries.last(uid, self.days)
+        else:
+            if last_date:
+                history = store.get_since(f"health_data/{uid}/history", last_date) or {}
+            else:
+                history = store.get_last(f"health_data/{uid}/history", self.days) or {}
+            dates, rows = self._history_rows(history)
+        current = store.get(f"health_data/{uid}/current")
+
+        # Readers see the entry before or after the whole refresh, never halfway
+        with entry.lock:
+            self._append_rows(entry, dates, rows)
+            self._set_current(entry, current)
+            entry.fetched_at = time.time()
+
+    def _history_rows(self, history):
+        """health_data history dict -> (dates, rows), oldest first"""
+        dates = [date_key for date_key in sorted(history) if isinstance(history[date_key], dict)]
+        return dates, [self.to_row(history[date_key]) for date_key in dates]
+
+    def _append_history(self, entry, history):
+        self._append_rows(entry, *self._history_rows(history))
+
+    def _append_rows(self, entry, dates, rows):
+        for date_key, row in zip(dates, rows):
+            entry.append_day(date_key, row)
+
+    def _set_current(self, entry, reading):
+        if reading:
+            entry.set_current(reading, self.to_row(reading))
+        else:
+            entry.clear_current()
+
+    def _store(self, uid, entry):
+        with self._lock:
+            previous = self._entries.pop(uid, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[uid] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    # -------------------------------------------------------------------------
+    # Incremental updates
+    # -------------------------------------------------------------------------
+    def apply_reading(self, uid, reading, date_key=None):
+        """
+        Apply a reading we just wrote ourselves. Updates `current`, and the
+        history day `date_key` when given. Patients not cached are ignored.
+        """
+        with self._lock:
+            entry = self._entries.get(uid)
+        if entry is None or not reading:
+            return
+        row = self.to_row(reading)
+        if date_key:
+            entry.append_day(date_key, row)
+        else:
+            entry.set_current(reading, row)
+
+    def mark_stale(self, uid, date_key=None):
+        """
+        A write we cannot apply locally (e.g. a partial reading merged into
+        the stored day): refresh uid on its next lookup. A day older than
+        the newest cached one is outside the refresh, so the entry is dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(uid)
+        if entry is None:
+            return
+        with entry.lock:
+            older_day = date_key is not None and entry.dates and date_key < entry.dates[-1]
+            if not older_day:
+                entry.fetched_at = 0
+        if older_day:
+            self.invalidate(uid)
+
+    def invalidate(self, uid):
+        with self._lock:
+            entry = self._entries.pop(uid, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    # -------------------------------------------------------------------------
+    # Snapshots (survive restarts)
+    # -------------------------------------------------------------------------
+    def save(self, path):
+        """Write every entry (days, current reading, trend state) to a JSON file"""
+        with self._lock:
+            entries = list(self._entries.items())
+        snapshot = {uid: entry.to_dict() for uid, entry in entries}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"days": self.days, "patients": snapshot}, f)
+        os.replace(tmp_path, path)
+        print(f"Window cache: saved {len(snapshot)} patients to {path}")
+        return len(snapshot)
+
+    def load(self, path):
+        """Restore a save() snapshot; entries refresh incrementally on next use"""
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("days") != self.days:
+            print(f"Window cache: snapshot window {snapshot.get('days')} != {self.days} days, ignoring")
+            return 0
+        for uid, data in snapshot["patients"].items():
+            entry = PatientWindow(self.days, self.trend_days)
+            n_days = len(data["dates"])
+            entry.dates = list(data["dates"])
+            entry.block[:n_days] = np.asarray(data["rows"], dtype=np.float32).reshape(n_days, N_METRICS)
+            if data["current"]:
+                entry.current = data["current"]
+                entry.current_row = np.asarray(self.to_row(data["current"]), dtype=np.float32)
+            entry.fetched_at = data["fetched_at"]
+            trend = RollingTrendState.from_dict(data["trend"])
+            if trend.max_days == self.trend_days:
+                entry.trend = trend
+            else:
+                entry.rebuild_trend()
+            self._store(uid, entry)
+        print(f"Window cache: restored {len(snapshot['patients'])} patients from {path}")
+        return len(snapshot["patients"])
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "patients": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "ttl_seconds": self.ttl_seconds,
+            "coalesced_loads": self._flights.shared,
+        }
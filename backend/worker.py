@@ -0,0 +1,219 @@
+# backend/worker.py
+"""
+Event-Driven Scoring Worker
+===========================
+Rescores a patient whenever their `current` reading or `history` changes,
+writing the results to predictions/{uid}/health and
+predictions/{uid}/deterioration.
+
+Changes arrive through notify(uid). Inside the API the /send_data ingest
+flush calls it for every patient it wrote. start(listen=True) also
+listens to the health_data root for writes that bypass the API (the
+Android app writes to Firebase directly), but on Firebase that listener
+downloads the whole tree, every patient's full history included, on each
+connect and reconnect before the first change arrives.
+
+- Debounce: a burst of uploads for one patient becomes one job, run
+  `debounce_seconds` after the last change (but never later than
+  `max_delay_seconds` after the first).
+- Backpressure: at most `max_pending` patients wait in the debouncer and
+  `queue_size` jobs in the work queue. Due patients stay in the debouncer
+  while the queue is full (one slot per patient however many uploads
+  arrive); changes for new patients beyond max_pending are dropped and
+  counted. Memory stays bounded under any upload flood.
+
+Runs inside the API with ENABLE_WORKER=1 (fed by the ingest flush;
+WORKER_LISTEN=1 adds the root listener), or on its own, listening:
+
+    python worker.py
+"""
+
+import queue
+import threading
+import time
+
+from datastore import store
+
+
+class ScoringWorker(object):
+    """Debounced, bounded pipeline from health_data changes to predictions/"""
+
+    def __init__(self, score_batch, debounce_seconds=2.0, max_delay_seconds=10.0,
+                 queue_size=1000, max_pending=10000, threads=2, batch_size=32):
+        """score_batch(uids) -> number of prediction nodes written"""
+        self.score_batch = score_batch
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_pending = max_pending
+        self.threads = threads
+        self.batch_size = batch_size
+
+        self._pending = {}  # uid -> (first_seen, last_seen)
+        self._pending_lock = threading.Condition()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._listener = None
+        self._snapshot_seen = False
+        self._workers = []
+
+        self.events = 0
+        self.debounced = 0
+        self.dropped = 0
+        self.jobs = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self.queue_full_waits = 0
+
+    # -------------------------------------------------------------------------
+    # Change events -> debouncer
+    # -------------------------------------------------------------------------
+    def _on_event(self, event):
+        """Map a health_data put/patch event to the patients it touched"""
+        path = event.path.strip("/")
+        if not path:
+            if event.event_type == "put" and not self._snapshot_seen:
+                # Initial sync delivers the whole tree - not a change
+                self._snapshot_seen = True
+                return
+            uids = {key.split("/")[0] for key in (event.data or {})}
+        else:
+            uids = {path.split("/")[0]}
+        for uid in uids:
+            self.notify(uid)
+
+    def notify(self, uid):
+        """Record a change for uid (debounced)"""
+        now = time.time()
+        with self._pending_lock:
+            self.events += 1
+            if uid in self._pending:
+                first_seen, _ = self._pending[uid]
+                self._pending[uid] = (first_seen, now)
+                self.debounced += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending[uid] = (now, now)
+            self._pending_lock.notify()
+
+    def _due(self, now):
+        """(due uids, seconds until the next one is due)"""
+        due = []
+        next_wait = self.debounce_seconds
+        for uid, (first_seen, last_seen) in self._pending.items():
+            ready_at = min(last_seen + self.debounce_seconds, first_seen + self.max_delay_seconds)
+            if ready_at <= now:
+                due.append(uid)
+            else:
+                next_wait = min(next_wait, ready_at - now)
+        return due, next_wait
+
+    def _dispatch(self):
+        """Move due patients into the bounded work queue"""
+        while not self._stop.is_set():
+            with self._pending_lock:
+                due, next_wait = self._due(time.time())
+                if not due:
+                    self._pending_lock.wait(timeout=next_wait)
+                    continue
+            for uid in due:
+                try:
+                    self._queue.put_nowait(uid)
+                except queue.Full:
+                    # Backpressure: leave the rest pending until workers catch up
+                    self.queue_full_waits += 1
+                    self._stop.wait(0.1)
+                    break
+                with self._pending_lock:
+                    self._pending.pop(uid, None)
+
+    # -------------------------------------------------------------------------
+    # Work queue -> scoring
+    # -------------------------------------------------------------------------
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                uids = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(uids) < self.batch_size:
+                try:
+                    uids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.written += self.score_batch(uids)
+                self.jobs += len(uids)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"ERROR in scoring worker: {e}")
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+    @property
+    def running(self):
+        return bool(self._workers)
+
+    def start(self, listen=True):
+        """listen: also follow the health_data root (see module docstring for its cost)"""
+        if self._workers:
+            return
+        self._stop.clear()
+        self._snapshot_seen = False
+        if listen:
+            self._listener = store.listen("health_data", self._on_event)
+        threads = [threading.Thread(target=self._dispatch, name="worker-dispatch", daemon=True)]
+        threads += [threading.Thread(target=self._work, name=f"worker-{i}", daemon=True)
+                    for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        self._workers = threads
+        source = "listening to health_data" if listen else "fed by the ingest flush"
+        print(f"Scoring worker: {source} ({self.threads} threads, debounce {self.debounce_seconds}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        with self._pending_lock:
+            self._pending_lock.notify_all()
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "listening": self._listener is not None,
+            "events": self.events,
+            "debounced": self.debounced,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "queued": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "queue_full_waits": self.queue_full_waits,
+            "patients_scored": self.jobs,
+            "predictions_written": self.written,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    import os
+    os.environ["ENABLE_WORKER"] = "0"
+    import app
+
+    # No /send_data traffic reaches this process, so follow the database
+    app.scoring_worker.start(listen=True)
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Scoring worker: {app.scoring_worker.stats()}")
+    except KeyboardInterrupt:
+        app.scoring_worker.stop()